@@ -1,6 +1,12 @@
 import logging
+import sys
 
-from mapping_tool.cli import do_mapping_tool
+import imap_data_access
+
+from mapping_tool import data_access, map_cache
+from mapping_tool.cli import do_mapping_tool, RunOptions, stage_in_dependencies
+from mapping_tool.data_access import DownloadError
+from mapping_tool.dependency_manifest import DependencyManifest
 logger = logging.getLogger(__name__)
 
 import argparse
@@ -9,12 +15,35 @@ from pathlib import Path
 from mapping_tool.configuration import Configuration
 
 
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument('config_file', type=Path, help="Path to configuration file in YAML or JSON format")
+def add_common_arguments(parser: argparse.ArgumentParser):
     parser.add_argument('-v', '--verbose', action='count', default=0, help='Increase verbosity')
-    args = parser.parse_args()
+    parser.add_argument('--max-concurrent-downloads', type=int,
+                        default=data_access.config["MAX_CONCURRENT_DOWNLOADS"],
+                        help='Maximum number of dependency files to download at once')
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help='Ignore cached data archive query results and query the server again')
+    parser.add_argument('--local-store-budget-gb', type=float,
+                        help='Evict the least recently used downloaded files to keep the local data directory under '
+                             'this size')
+    parser.add_argument('--hedge-requests', action='store_true', default=data_access.config["HEDGE_REQUESTS"],
+                        help='Send a duplicate data archive query when the first one is slower than most')
+    parser.add_argument('--backend', choices=["upstream", "mirror", "proxy"], default=data_access.config["BACKEND"],
+                        help='Where to look up and download dependency files from')
+    parser.add_argument('--mirror-dir', type=Path, default=data_access.config["MIRROR_DIR"],
+                        help='Local mirror of the data archive used by the mirror backend')
+    parser.add_argument('--proxy-url', default=data_access.config["PROXY_URL"],
+                        help='URL of the caching proxy used by the proxy backend')
+
+
+def apply_common_arguments(args: argparse.Namespace):
+    data_access.config["MAX_CONCURRENT_DOWNLOADS"] = args.max_concurrent_downloads
+    data_access.config["REFRESH_QUERY_CACHE"] = args.refresh_cache
+    if args.local_store_budget_gb is not None:
+        data_access.config["LOCAL_STORE_BUDGET_BYTES"] = int(args.local_store_budget_gb * 1024 ** 3)
+    data_access.config["HEDGE_REQUESTS"] = args.hedge_requests
+    data_access.config["BACKEND"] = args.backend
+    data_access.config["MIRROR_DIR"] = args.mirror_dir
+    data_access.config["PROXY_URL"] = args.proxy_url
     if args.verbose > 0:
         log_level = logging.INFO
     else:
@@ -22,6 +51,71 @@ if __name__ == "__main__":
     logging.basicConfig(level=log_level, force=True)
     logging.captureWarnings(True)
 
+
+def run_prefetch(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="main.py prefetch",
+                                     description="Download every dependency of the given configurations so they can "
+                                                 "be run with --manifest on a machine without network access")
+    parser.add_argument('config_files', type=Path, nargs='+',
+                        help="Paths to configuration files in YAML or JSON format")
+    parser.add_argument('--data-dir', type=Path, help="Directory to download the dependencies into")
+    add_common_arguments(parser)
+    args = parser.parse_args(argv)
+    apply_common_arguments(args)
+
+    if args.data_dir is not None:
+        imap_data_access.config["DATA_DIR"] = args.data_dir
+
+    configurations = [Configuration.from_file(config_file) for config_file in args.config_files]
+    try:
+        summary = stage_in_dependencies(configurations)
+    except DownloadError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Staged {summary.file_count} files ({summary.total_bytes} bytes) into "
+          f"{imap_data_access.config['DATA_DIR']}: {summary.downloaded_count} downloaded "
+          f"({summary.downloaded_bytes} bytes), {summary.file_count - summary.downloaded_count} already present")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["prefetch"]:
+        run_prefetch(sys.argv[2:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('config_file', type=Path, help="Path to configuration file in YAML or JSON format")
+    add_common_arguments(parser)
+    parser.add_argument('--manifest', type=Path,
+                        help='Process from the dependencies recorded in this manifest and local files, '
+                             'without querying or downloading from the data archive')
+    parser.add_argument('--prefetch-lookahead', type=int, default=0,
+                        help='Number of upcoming maps whose dependencies are downloaded while the current map is '
+                             'being processed')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of maps to generate at once, each in its own worker process. Workers download '
+                             'their own dependencies, so --prefetch-lookahead only applies when this is 1')
+    parser.add_argument('--map-cache-dir', type=Path, default=map_cache.config["MAP_CACHE_DIR"],
+                        help='Keep generated intermediate and final maps in this directory and reuse them in later runs '
+                             'whose map, time window and input file versions are the same')
+    parser.add_argument('--map-cache-budget-gb', type=float,
+                        help='Evict the least recently used maps to keep the map cache under this size')
+    parser.add_argument('--preflight', action='store_true',
+                        help='Resolve the dependencies of every map before processing any of them, and report every '
+                             'missing dependency at once instead of starting a run that cannot finish')
+    args = parser.parse_args()
+    apply_common_arguments(args)
+    map_cache.config["MAP_CACHE_DIR"] = args.map_cache_dir
+    if args.map_cache_budget_gb is not None:
+        map_cache.config["MAP_CACHE_BUDGET_BYTES"] = int(args.map_cache_budget_gb * 1024 ** 3)
+
     configuration = Configuration.from_file(args.config_file)
 
-    do_mapping_tool(configuration)
+    replay_manifest = None
+    if args.manifest is not None:
+        replay_manifest = DependencyManifest.from_file(args.manifest)
+        data_access.config["OFFLINE"] = True
+
+    do_mapping_tool(configuration, RunOptions(write_manifest=True, replay_manifest=replay_manifest,
+                                              prefetch_lookahead=args.prefetch_lookahead, preflight=args.preflight,
+                                              jobs=args.jobs))
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial_limit: int, min_limit: int = 1, max_limit: int = 32,
+                 decrease_factor: float = 0.5, latency_spike_factor: float = 4.0, decrease_cooldown: float = 1.0,
+                 latency_window: int = 200, min_latency_samples: int = 20, log_interval: int = 50):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.min_latency_samples = min_latency_samples
+        self.log_interval = log_interval
+        self.in_flight = 0
+        self._latencies = deque(maxlen=latency_window)
+        self._completed = 0
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        with self._condition:
+            if len(self._latencies) < self.min_latency_samples:
+                return None
+            return float(np.percentile(self._latencies, percentile))
+
+    def record_latency(self, latency: float):
+        median_latency = self.latency_percentile(50)
+        if median_latency is not None and latency > self.latency_spike_factor * median_latency:
+            self.record_congestion(f"latency spike of {latency:.2f}s against a median of {median_latency:.2f}s")
+        else:
+            with self._condition:
+                # Additive increase: about one more request per round of `limit` successful requests
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+
+        with self._condition:
+            self._latencies.append(latency)
+            self._completed += 1
+            should_log = self._completed % self.log_interval == 0
+        if should_log:
+            self.log_status()
+
+    def record_congestion(self, reason: str):
+        with self._condition:
+            now = time.monotonic()
+            # One multiplicative decrease per congestion event, not one for every request caught up in it
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            limit = int(self.limit)
+        logger.info(f"Reduced data access concurrency limit to {limit} after {reason}")
+
+    def log_status(self):
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        latencies = f"latency p50 {p50:.2f}s p95 {p95:.2f}s" if p50 is not None else "latency not yet measured"
+        logger.info(f"Data access concurrency limit {int(self.limit)} with {self.in_flight} in flight, {latencies}")
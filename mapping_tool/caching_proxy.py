@@ -0,0 +1,206 @@
+import argparse
+import hashlib
+import hmac
+import os
+import json
+import logging
+import re
+import tarfile
+import threading
+from dataclasses import asdict
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path, PurePosixPath
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from mapping_tool import data_access
+from mapping_tool.data_access import DataBackend, UpstreamBackend, fetch_file, QueryRecord, BULK_CHECKSUM_HEADER, \
+    PROXY_TOKEN_HEADER
+from mapping_tool.query_records import FileRecord, SpiceFileRecord
+
+logger = logging.getLogger(__name__)
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-")
+
+
+class CachingProxy:
+    def __init__(self, cache_dir: Path, backend: Optional[DataBackend] = None):
+        self.cache_dir = cache_dir
+        self.backend = backend or UpstreamBackend()
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._checksums: dict[str, str] = {}
+
+    def query(self, query_params: dict) -> list[FileRecord]:
+        return self.backend.query(query_params)
+
+    def spice_query(self, query_params: dict) -> list[SpiceFileRecord]:
+        return self.backend.spice_query(query_params)
+
+    def get_file(self, relative_path: str) -> tuple[Path, str]:
+        if PurePosixPath(relative_path).is_absolute() or ".." in PurePosixPath(relative_path).parts:
+            raise ValueError(f"Invalid file path: {relative_path}")
+
+        with self._locks_lock:
+            lock = self._locks.setdefault(relative_path, threading.Lock())
+        # Concurrent requests for the same file wait for a single upstream fetch
+        with lock:
+            cached_path = self.cache_dir / relative_path
+            if not cached_path.exists():
+                logger.info(f"Fetching {relative_path} from upstream")
+                try:
+                    fetch_file(self.backend, relative_path, cached_path)
+                except requests.HTTPError as e:
+                    # Answered as a 404 rather than a 502, which clients would keep retrying
+                    if e.response is not None and e.response.status_code == HTTPStatus.NOT_FOUND:
+                        raise FileNotFoundError(f"{relative_path} is not in the data archive") from e
+                    raise
+            if relative_path not in self._checksums:
+                md5 = hashlib.md5()
+                with open(cached_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(data_access.DOWNLOAD_CHUNK_SIZE), b""):
+                        md5.update(chunk)
+                self._checksums[relative_path] = md5.hexdigest()
+            return cached_path, self._checksums[relative_path]
+
+
+def make_request_handler(proxy: CachingProxy, token: str) -> type[BaseHTTPRequestHandler]:
+    class CachingProxyRequestHandler(BaseHTTPRequestHandler):
+        def _is_authorized(self) -> bool:
+            # Archive data is fetched with the operator's credentials, so only clients holding the shared token may
+            # read it
+            if hmac.compare_digest(self.headers.get(PROXY_TOKEN_HEADER, "").encode(), token.encode()):
+                return True
+            self.send_error(HTTPStatus.UNAUTHORIZED)
+            return False
+
+        def do_GET(self):
+            if not self._is_authorized():
+                return
+            url = urlparse(self.path)
+            path = re.sub(r"^/(api-key|authorized)(?=/)", "", url.path)
+            query_params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            try:
+                if path == "/query":
+                    self._send_json(proxy.query(query_params))
+                elif path == "/spice-query":
+                    self._send_json(proxy.spice_query(query_params))
+                elif path.startswith("/download/"):
+                    self._send_file(*proxy.get_file(path.removeprefix("/download/")))
+                else:
+                    self.send_error(HTTPStatus.NOT_FOUND)
+            except FileNotFoundError as e:
+                self.send_error(HTTPStatus.NOT_FOUND, str(e))
+            except ValueError as e:
+                self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+            except Exception as e:
+                logger.exception(f"Failed to serve {self.path}")
+                self.send_error(HTTPStatus.BAD_GATEWAY, str(e))
+
+        def do_POST(self):
+            if not self._is_authorized():
+                return
+            path = re.sub(r"^/(api-key|authorized)(?=/)", "", urlparse(self.path).path)
+            if path != "/bulk-download":
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            try:
+                relative_paths = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["paths"]
+                files = []
+                for relative_path in relative_paths:
+                    try:
+                        files.append((relative_path, *proxy.get_file(relative_path)))
+                    except FileNotFoundError:
+                        # Files missing upstream are left out; the client downloads them one by one and gets the 404
+                        continue
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+                return
+            except Exception as e:
+                logger.exception(f"Failed to serve {self.path}")
+                self.send_error(HTTPStatus.BAD_GATEWAY, str(e))
+                return
+            self._send_archive(files)
+
+        def _send_json(self, records: list[QueryRecord]):
+            body = json.dumps([asdict(record) for record in records]).encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_file(self, path: Path, checksum: str):
+            size = path.stat().st_size
+            start = 0
+            range_match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+            if range_match:
+                start = int(range_match.group(1))
+                if start >= size:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+            else:
+                self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size - start))
+            self.send_header("ETag", f'"{checksum}"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                f.seek(start)
+                for chunk in iter(lambda: f.read(data_access.DOWNLOAD_CHUNK_SIZE), b""):
+                    self.wfile.write(chunk)
+
+        def _send_archive(self, files: list[tuple[str, Path, str]]):
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/x-tar")
+            self.end_headers()
+            # The archive is streamed without a Content-Length, so the end of the response is marked by closing
+            # the connection
+            self.close_connection = True
+            with tarfile.open(fileobj=self.wfile, mode="w|", format=tarfile.PAX_FORMAT) as archive:
+                for relative_path, path, checksum in files:
+                    member = archive.gettarinfo(path, arcname=relative_path)
+                    member.pax_headers = {BULK_CHECKSUM_HEADER: checksum}
+                    with open(path, "rb") as f:
+                        archive.addfile(member, f)
+
+        def log_message(self, format, *args):
+            logger.info(f"{self.address_string()} {format % args}")
+
+    return CachingProxyRequestHandler
+
+
+def create_server(proxy: CachingProxy, host: str, port: int, token: str) -> ThreadingHTTPServer:
+    if not token:
+        raise ValueError("The caching proxy requires a shared token")
+    return ThreadingHTTPServer((host, port), make_request_handler(proxy, token))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-through caching proxy for the IMAP data archive, shared by "
+                                                 "mapping tool runs on several nodes")
+    parser.add_argument('--host', default="127.0.0.1",
+                        help="Address to listen on. Use 0.0.0.0 to accept connections from other nodes")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on")
+    parser.add_argument('--token', default=os.getenv("MAPPING_TOOL_PROXY_TOKEN"),
+                        help="Shared token clients must send to use the proxy. Defaults to MAPPING_TOOL_PROXY_TOKEN")
+    parser.add_argument('--cache-dir', type=Path, required=True, help="Directory to cache downloaded files in")
+    parser.add_argument('-v', '--verbose', action='count', default=0, help='Increase verbosity')
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("a shared token is required, pass --token or set MAPPING_TOOL_PROXY_TOKEN")
+    logging.basicConfig(level=logging.INFO if args.verbose > 0 else logging.WARNING, force=True)
+
+    if data_access.config["QUERY_CACHE_DIR"] is None:
+        data_access.config["QUERY_CACHE_DIR"] = args.cache_dir / ".queries"
+
+    server = create_server(CachingProxy(args.cache_dir), args.host, args.port, args.token)
+    print(f"Serving the data archive from {args.cache_dir} on {args.host}:{server.server_port}")
+    server.serve_forever()
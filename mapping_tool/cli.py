@@ -1,12 +1,20 @@
 import logging
-import shutil
 import traceback
+from dataclasses import dataclass
 from datetime import datetime
+from typing import Optional
 
 import numpy as np
 
+from mapping_tool.data_access import download_files, get_local_store, get_local_path
+from mapping_tool.dependency_collector import DependencyCollector
+from mapping_tool.dependency_manifest import DependencyManifest
 from mapping_tool.generate_map import generate_map, get_data_level_for_descriptor
+from mapping_tool.map_workers import generate_maps_in_processes
 from mapping_tool.mapping_tool_descriptor import MappingToolDescriptor
+from mapping_tool.prefetch import MapPrefetcher, resolve_dependency_files
+from mapping_tool.preflight import PreflightError, run_preflight
+from mapping_tool.run_workspace import RunWorkspace
 logger = logging.getLogger(__name__)
 
 from pathlib import Path
@@ -22,19 +30,84 @@ def get_output_filename(descriptor: MappingToolDescriptor, start_date: datetime)
     return f"imap_{descriptor.instrument.name.lower()}_{data_level.value}_{descriptor.to_mapping_tool_string()}_{start_date.strftime('%Y%m%d')}_v000.cdf"
 
 
-def cleanup_l2_l3_dependencies(descriptor: MappingToolDescriptor):
-    l2_path = imap_data_access.config["DATA_DIR"] / 'imap' / descriptor.instrument.name.lower() / 'l2'
-    l3_path = imap_data_access.config["DATA_DIR"] / 'imap' / descriptor.instrument.name.lower() / 'l3'
+@dataclass
+class RunOptions:
+    write_manifest: bool = False
+    replay_manifest: Optional[DependencyManifest] = None
+    prefetch_lookahead: int = 0
+    preflight: bool = False
+    jobs: int = 1
 
-    if l2_path.exists():
-        logger.info(f"Cleaning up {l2_path}")
-        shutil.rmtree(l2_path)
-    if l3_path.exists():
-        logger.info(f"Cleaning up {l3_path}")
-        shutil.rmtree(l3_path)
 
+def generate_maps(descriptor: MappingToolDescriptor, map_date_ranges: list[tuple[datetime, datetime]],
+                  prefetch_lookahead: int = 0, jobs: int = 1) -> list[Path]:
+    if jobs > 1:
+        return generate_maps_in_processes(descriptor, map_date_ranges, jobs)
 
-def do_mapping_tool(config: Configuration):
+    output_map_paths = []
+    with MapPrefetcher(descriptor, map_date_ranges, prefetch_lookahead) as prefetcher:
+        for i, (start_date, end_date) in enumerate(map_date_ranges, start=1):
+            map_details = f'{descriptor.to_mapping_tool_string()} {start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}'
+
+            prefetcher.wait_for_map(i - 1)
+            print(f"Generating map {i}/{len(map_date_ranges)}...")
+            logger.info(f"Generating map: {map_details}")
+            generated_map_path = generate_map(descriptor, start_date, end_date)
+            output_map_paths.append(generated_map_path)
+    return output_map_paths
+
+
+@dataclass
+class StageInSummary:
+    file_count: int
+    total_bytes: int
+    downloaded_count: int
+    downloaded_bytes: int
+
+
+def get_manifest_path(output_path: Path) -> Path:
+    return output_path.with_suffix(".manifest.json")
+
+
+def stage_in_dependencies(configs: list[Configuration]) -> StageInSummary:
+    file_names = []
+    for config in configs:
+        map_date_ranges = config.get_map_date_ranges()
+        descriptor = config.get_map_descriptor()
+        span_start = min(start_date for start_date, _ in map_date_ranges)
+        span_end = max(end_date for _, end_date in map_date_ranges)
+
+        print(f"Resolving dependencies for {descriptor.to_mapping_tool_string()}...")
+        manifest = DependencyManifest()
+        with DependencyCollector.use_manifest(manifest), DependencyCollector.span_queries(span_start, span_end):
+            DependencyCollector.collect_spice_kernels_for_windows(map_date_ranges)
+            for start_date, end_date in map_date_ranges:
+                file_names.extend(resolve_dependency_files(descriptor, start_date, end_date))
+
+        output_path = config.output_directory / get_output_filename(descriptor, map_date_ranges[0][0])
+        manifest_path = get_manifest_path(output_path)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        manifest.to_file(manifest_path)
+        print(f"Wrote dependency manifest {manifest_path}")
+
+    file_names = list(dict.fromkeys(file_names))
+    already_present = {file_name for file_name in file_names if get_local_path(file_name).exists()}
+    with get_local_store().pinned(file_names):
+        paths = download_files(file_names, progress_label="dependencies")
+    print()
+
+    sizes = {file_name: path.stat().st_size for file_name, path in zip(file_names, paths)}
+    downloaded = [file_name for file_name in file_names if file_name not in already_present]
+    return StageInSummary(
+        file_count=len(file_names),
+        total_bytes=sum(sizes.values()),
+        downloaded_count=len(downloaded),
+        downloaded_bytes=sum(sizes[file_name] for file_name in downloaded),
+    )
+
+
+def do_mapping_tool(config: Configuration, options: Optional[RunOptions] = None):
+    options = options or RunOptions()
     map_date_ranges = config.get_map_date_ranges()
     descriptor = config.get_map_descriptor()
 
@@ -46,23 +119,27 @@ def do_mapping_tool(config: Configuration):
             print(f"Skipping generation of map: {output_filename}, because it already exists!")
             return
 
-        output_map_paths = []
-        for i, (start_date, end_date) in enumerate(map_date_ranges, start=1):
-            map_details = f'{descriptor.to_mapping_tool_string()} {start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}'
-
-            print(f"Generating map {i}/{len(map_date_ranges)}...")
-            logger.info(f"Generating map: {map_details}")
-            generated_map_path = generate_map(descriptor, start_date, end_date)
-            output_map_paths.append(generated_map_path)
-
-        sorted_paths = sort_cdfs_by_epoch(output_map_paths)
-        save_output_cdf(final_output_path, sorted_paths, config)
+        span_start = min(start_date for start_date, _ in map_date_ranges)
+        span_end = max(end_date for _, end_date in map_date_ranges)
+        manifest = options.replay_manifest or DependencyManifest()
+        with RunWorkspace(imap_data_access.config["DATA_DIR"], [descriptor.instrument.name.lower()]), \
+                DependencyCollector.use_manifest(manifest, replay=options.replay_manifest is not None), \
+                DependencyCollector.span_queries(span_start, span_end):
+            if options.preflight:
+                run_preflight(descriptor, map_date_ranges)
+            output_map_paths = generate_maps(descriptor, map_date_ranges, options.prefetch_lookahead, options.jobs)
+            sorted_paths = sort_cdfs_by_epoch(output_map_paths)
+            save_output_cdf(final_output_path, sorted_paths, config)
         print(f"Created file {final_output_path}")
+        if options.write_manifest:
+            manifest_path = get_manifest_path(final_output_path)
+            manifest.to_file(manifest_path)
+            print(f"Wrote dependency manifest {manifest_path}")
         return final_output_path
+    except PreflightError as e:
+        print(e)
     except Exception:
         logger.error(f"Failed to generate map: {descriptor.to_mapping_tool_string()} with error\n{traceback.format_exc()}")
-    finally:
-        cleanup_l2_l3_dependencies(descriptor)
 
 def sort_cdfs_by_epoch(cdf_files: list[Path]) -> list[Path]:
     sorted_epochs_and_paths = []
@@ -0,0 +1,658 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
+from pathlib import Path
+from dataclasses import asdict
+from typing import Callable, Optional, Union
+
+import imap_data_access
+import requests
+from imap_data_access.file_validation import generate_imap_file_path
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError
+
+from mapping_tool.adaptive_limiter import AdaptiveLimiter
+from mapping_tool.local_store import LocalStore
+from mapping_tool.query_cache import QueryCache
+from mapping_tool.query_records import FileRecord, SpiceFileRecord, iter_json_array
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+config = {
+    "MAX_CONCURRENT_DOWNLOADS": int(os.getenv("MAPPING_TOOL_MAX_CONCURRENT_DOWNLOADS") or 8),
+    "HTTP_POOL_SIZE": int(os.getenv("MAPPING_TOOL_HTTP_POOL_SIZE") or 16),
+    "HTTP_CONNECT_TIMEOUT": float(os.getenv("MAPPING_TOOL_HTTP_CONNECT_TIMEOUT") or 10),
+    "HTTP_READ_TIMEOUT": float(os.getenv("MAPPING_TOOL_HTTP_READ_TIMEOUT") or 300),
+    "INITIAL_CONCURRENCY": int(os.getenv("MAPPING_TOOL_INITIAL_CONCURRENCY") or 4),
+    "MIN_CONCURRENCY": int(os.getenv("MAPPING_TOOL_MIN_CONCURRENCY") or 1),
+    "MAX_CONCURRENCY": int(os.getenv("MAPPING_TOOL_MAX_CONCURRENCY") or 16),
+    "HEDGE_REQUESTS": os.getenv("MAPPING_TOOL_HEDGE_REQUESTS", "").lower() in ["1", "true", "yes"],
+    "HEDGE_PERCENTILE": float(os.getenv("MAPPING_TOOL_HEDGE_PERCENTILE") or 95),
+    "QUERY_CACHE_DIR": Path(os.getenv("MAPPING_TOOL_QUERY_CACHE_DIR")) if os.getenv(
+        "MAPPING_TOOL_QUERY_CACHE_DIR") else None,
+    "QUERY_CACHE_TTLS": {
+        "science": float(os.getenv("MAPPING_TOOL_SCIENCE_QUERY_TTL") or 6 * 3600),
+        "ancillary": float(os.getenv("MAPPING_TOOL_ANCILLARY_QUERY_TTL") or 6 * 3600),
+        "spice": float(os.getenv("MAPPING_TOOL_SPICE_QUERY_TTL") or 3600),
+    },
+    "REFRESH_QUERY_CACHE": False,
+    "OFFLINE": False,
+    "DOWNLOAD_ATTEMPTS": int(os.getenv("MAPPING_TOOL_DOWNLOAD_ATTEMPTS") or 5),
+    "DOWNLOAD_RETRY_BACKOFF": float(os.getenv("MAPPING_TOOL_DOWNLOAD_RETRY_BACKOFF") or 2),
+    "BACKEND": os.getenv("MAPPING_TOOL_BACKEND") or "upstream",
+    "MIRROR_DIR": Path(os.getenv("MAPPING_TOOL_MIRROR_DIR")) if os.getenv("MAPPING_TOOL_MIRROR_DIR") else None,
+    "PROXY_URL": os.getenv("MAPPING_TOOL_PROXY_URL"),
+    "PROXY_TOKEN": os.getenv("MAPPING_TOOL_PROXY_TOKEN"),
+    "SHARED_DATA_DIR": None,
+    "BULK_DOWNLOAD_BATCH_SIZE": int(os.getenv("MAPPING_TOOL_BULK_DOWNLOAD_BATCH_SIZE") or 100),
+    "LOCAL_STORE_BUDGET_BYTES": int(os.getenv("MAPPING_TOOL_LOCAL_STORE_BUDGET_BYTES")) if os.getenv(
+        "MAPPING_TOOL_LOCAL_STORE_BUDGET_BYTES") else None,
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_limiter: Optional[AdaptiveLimiter] = None
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_local_store: Optional[LocalStore] = None
+_local_store_lock = threading.Lock()
+_download_locks: dict[Path, threading.Lock] = {}
+_download_locks_lock = threading.Lock()
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+MD5_ETAG_PATTERN = re.compile(r"[0-9a-f]{32}")
+BULK_CHECKSUM_HEADER = "MAPPING_TOOL.md5"
+PROXY_TOKEN_HEADER = "X-Mapping-Tool-Proxy-Token"
+QUERY_CHUNK_SIZE = 64 * 1024
+
+QueryRecord = Union[FileRecord, SpiceFileRecord]
+
+
+class DownloadError(Exception):
+    def __init__(self, failures: dict[str, Exception]):
+        self.failures = failures
+        details = "\n".join(f"  {file_name}: {error}" for file_name, error in failures.items())
+        super().__init__(f"Failed to download {len(failures)} file(s):\n{details}")
+
+
+class DownloadVerificationError(Exception):
+    pass
+
+
+class IncompleteDownloadError(DownloadVerificationError):
+    pass
+
+
+class ImapAuth(requests.auth.AuthBase):
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        if imap_data_access.config["API_KEY"]:
+            request.headers["x-api-key"] = imap_data_access.config["API_KEY"]
+        elif imap_data_access.config["ACCESS_TOKEN"]:
+            request.headers["Authorization"] = f"Bearer {imap_data_access.config['ACCESS_TOKEN']}"
+        # The proxy's shared token is only ever sent to the proxy
+        proxy_url = config["PROXY_URL"]
+        if config["PROXY_TOKEN"] and proxy_url and request.url.startswith(proxy_url.rstrip("/") + "/"):
+            request.headers[PROXY_TOKEN_HEADER] = config["PROXY_TOKEN"]
+        return request
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config["HTTP_POOL_SIZE"], pool_maxsize=config["HTTP_POOL_SIZE"],
+                                  max_retries=3)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.auth = ImapAuth()
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session, _limiter
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        _limiter = None
+
+
+def get_base_url() -> str:
+    url = imap_data_access.config["DATA_ACCESS_URL"]
+    if imap_data_access.config["API_KEY"] and not url.endswith("/api-key"):
+        url = f"{url}/api-key"
+    elif imap_data_access.config["ACCESS_TOKEN"] and not url.endswith("/authorized"):
+        url = f"{url}/authorized"
+    return url
+
+
+def get_limiter() -> AdaptiveLimiter:
+    global _limiter
+    with _session_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(config["INITIAL_CONCURRENCY"], min_limit=config["MIN_CONCURRENCY"],
+                                       max_limit=config["MAX_CONCURRENCY"])
+        return _limiter
+
+
+def get(url: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+    return _send(url, lambda timeout: get_session().get(url, params=params, timeout=timeout, **kwargs),
+                 kwargs.get("stream", False))
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return _send(url, lambda timeout: get_session().post(url, timeout=timeout, **kwargs), kwargs.get("stream", False))
+
+
+def _send(url: str, send_request: Callable[[tuple[float, float]], requests.Response],
+          stream: bool = False) -> requests.Response:
+    limiter = get_limiter()
+    limiter.acquire()
+    try:
+        start_time = time.monotonic()
+        try:
+            response = send_request((config["HTTP_CONNECT_TIMEOUT"], config["HTTP_READ_TIMEOUT"]))
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code is not None and (status_code == 429 or status_code >= 500):
+                limiter.record_congestion(f"HTTP {status_code} from {url}")
+            raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            limiter.record_congestion(f"{type(e).__name__} from {url}")
+            raise
+        # Streamed downloads return once the headers arrive, so this is the time to first byte
+        limiter.record_latency(time.monotonic() - start_time)
+    except BaseException:
+        limiter.release()
+        raise
+
+    if stream:
+        # The body of a streamed response is transferred after this returns, so it stays outstanding until closed
+        _release_on_close(response, limiter.release)
+    else:
+        limiter.release()
+    return response
+
+
+def _release_on_close(response: requests.Response, release: Callable[[], None]):
+    close = response.close
+    not_yet_released = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            # Responses can be closed more than once, but the slot is only given back the first time
+            if not_yet_released.acquire(blocking=False):
+                release()
+
+    response.close = close_and_release
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _session_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=2 * config["HTTP_POOL_SIZE"],
+                                                 thread_name_prefix="hedged-request")
+        return _hedge_executor
+
+
+def get_hedged(url: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+    hedge_delay = get_limiter().latency_percentile(config["HEDGE_PERCENTILE"])
+    if not config["HEDGE_REQUESTS"] or hedge_delay is None:
+        return get(url, params=params, **kwargs)
+
+    executor = _get_hedge_executor()
+    requests_in_flight = [executor.submit(get, url, params, **kwargs)]
+    done, _ = wait(requests_in_flight, timeout=hedge_delay)
+    if not done:
+        logger.info(f"Sending a hedged request for {url} {params or ''} after {hedge_delay:.2f}s")
+        requests_in_flight.append(executor.submit(get, url, params, **kwargs))
+
+    # The first successful response wins; an error only counts once every request has failed
+    pending = set(requests_in_flight)
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for request in done:
+            if request.exception() is None:
+                for loser in requests_in_flight:
+                    if loser is not request:
+                        loser.cancel()
+                        loser.add_done_callback(_close_response)
+                return request.result()
+        if not pending:
+            raise requests_in_flight[0].exception()
+
+
+def _close_response(request: Future):
+    # A losing streamed response would otherwise keep its pooled connection checked out
+    if not request.cancelled() and request.exception() is None:
+        request.result().close()
+
+
+def get_data_dir() -> Path:
+    return config["SHARED_DATA_DIR"] or imap_data_access.config["DATA_DIR"]
+
+
+def get_query_cache() -> QueryCache:
+    cache_dir = config["QUERY_CACHE_DIR"] or get_data_dir() / ".mapping_tool_cache" / "queries"
+    return QueryCache(cache_dir, config["QUERY_CACHE_TTLS"])
+
+
+def get_local_store() -> LocalStore:
+    global _local_store
+    index_path = get_data_dir() / ".mapping_tool_cache" / "store.sqlite"
+    with _local_store_lock:
+        if _local_store is None or _local_store.index_path != index_path:
+            _local_store = LocalStore(index_path)
+        _local_store.budget_bytes = config["LOCAL_STORE_BUDGET_BYTES"]
+        return _local_store
+
+
+def get_records(url: str, params: Optional[dict], table: str, record_type: type[QueryRecord]) -> list[QueryRecord]:
+    query_cache = get_query_cache()
+    if not config["REFRESH_QUERY_CACHE"]:
+        cached_records = query_cache.open_records(table, url, params)
+        if cached_records is not None:
+            try:
+                with cached_records:
+                    records = [record_type(**item) for item in iter_json_array(cached_records)]
+                logger.info(f"Query cache hit for {url} {params or ''}")
+                return records
+            except (ValueError, TypeError):
+                logger.info(f"Ignoring unreadable query cache entry for {url} {params or ''}")
+
+    # Parse the response as it arrives so only the compact records, never the whole document, are held in memory
+    with get_hedged(url, params=params, stream=True) as response:
+        records = [record_type.from_json(item)
+                   for item in iter_json_array(response.iter_content(chunk_size=QUERY_CHUNK_SIZE))]
+    query_cache.put_records(table, url, params, (asdict(record) for record in records))
+    return records
+
+
+class DataBackend(ABC):
+    supports_bulk_fetch = False
+
+    @abstractmethod
+    def query(self, query_params: dict) -> list[FileRecord]:
+        pass
+
+    @abstractmethod
+    def spice_query(self, query_params: dict) -> list[SpiceFileRecord]:
+        pass
+
+    @abstractmethod
+    def fetch(self, relative_path: str, part_path: Path):
+        pass
+
+    def fetch_bulk(self, relative_paths: list[str], staging_dir: Path) -> list[str]:
+        raise NotImplementedError(f"{type(self).__name__} does not support bulk downloads")
+
+
+class UpstreamBackend(DataBackend):
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url
+
+    def _get_base_url(self) -> str:
+        return self.base_url or get_base_url()
+
+    def query(self, query_params: dict) -> list[FileRecord]:
+        return get_records(f"{self._get_base_url()}/query", query_params, query_params.get("table", "science"),
+                           FileRecord)
+
+    def spice_query(self, query_params: dict) -> list[SpiceFileRecord]:
+        base_url = self.base_url or imap_data_access.config["DATA_ACCESS_URL"]
+        return get_records(f"{base_url}/spice-query", query_params, "spice", SpiceFileRecord)
+
+    def fetch(self, relative_path: str, part_path: Path):
+        _download_part(f"{self._get_base_url()}/download/{relative_path}", part_path)
+
+
+class MirrorBackend(DataBackend):
+    supports_bulk_fetch = True
+
+    def __init__(self, mirror_dir: Path, metadata_backend: Optional[DataBackend] = None):
+        self.mirror_dir = mirror_dir
+        self.metadata_backend = metadata_backend or UpstreamBackend()
+
+    def query(self, query_params: dict) -> list[FileRecord]:
+        instrument = query_params.get("instrument")
+        if query_params.get("table", "science") == "ancillary":
+            search_dir = self.mirror_dir / "imap" / "ancillary"
+        else:
+            search_dir = self.mirror_dir / "imap"
+        if instrument is not None:
+            search_dir = search_dir / instrument
+
+        files = []
+        for path in sorted(search_dir.rglob("imap_*")):
+            try:
+                file_path = generate_imap_file_path(path.name)
+            except Exception:
+                continue
+            file = {key: value for key, value in vars(file_path).items()
+                    if isinstance(value, str) and key not in ["error_message", "mission"]}
+            if self._matches(file, query_params):
+                files.append(FileRecord(file_path=path.relative_to(self.mirror_dir).as_posix(),
+                                        start_date=file.get("start_date"), end_date=file.get("end_date"),
+                                        version=file.get("version"), descriptor=file.get("descriptor")))
+        return files
+
+    @staticmethod
+    def _matches(file: dict[str, str], query_params: dict) -> bool:
+        for key in ["instrument", "data_level", "descriptor", "version"]:
+            if key in query_params and file.get(key) != query_params[key]:
+                return False
+        # Same date semantics as the data archive: start dates on or after start_date and before end_date
+        if "start_date" in query_params and file.get("start_date", "") < query_params["start_date"]:
+            return False
+        if "end_date" in query_params and file.get("start_date", "") >= query_params["end_date"]:
+            return False
+        return True
+
+    def spice_query(self, query_params: dict) -> list[SpiceFileRecord]:
+        # Kernel coverage is not encoded in the file names, so it comes from the metadata backend
+        return self.metadata_backend.spice_query(query_params)
+
+    def fetch(self, relative_path: str, part_path: Path):
+        source = self.mirror_dir / relative_path
+        if not source.exists():
+            raise FileNotFoundError(f"{relative_path} is not in the mirror at {self.mirror_dir}")
+        shutil.copyfile(source, part_path)
+
+    def fetch_bulk(self, relative_paths: list[str], staging_dir: Path) -> list[str]:
+        fetched = []
+        for relative_path in relative_paths:
+            source = self.mirror_dir / relative_path
+            if source.exists():
+                (staging_dir / relative_path).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(source, staging_dir / relative_path)
+                fetched.append(relative_path)
+        return fetched
+
+
+class ProxyBackend(UpstreamBackend):
+    supports_bulk_fetch = True
+
+    def fetch_bulk(self, relative_paths: list[str], staging_dir: Path) -> list[str]:
+        requested = set(relative_paths)
+        fetched = []
+        with post(f"{self._get_base_url()}/bulk-download", json={"paths": relative_paths}, stream=True) as response:
+            response.raw.decode_content = True
+            with tarfile.open(fileobj=response.raw, mode="r|") as archive:
+                for member in archive:
+                    if not member.isfile() or member.name not in requested:
+                        raise DownloadVerificationError(f"unexpected entry {member.name} in bulk download")
+                    staged_path = staging_dir / member.name
+                    staged_path.parent.mkdir(parents=True, exist_ok=True)
+                    md5 = hashlib.md5()
+                    with archive.extractfile(member) as source, open(staged_path, "wb") as f:
+                        for chunk in iter(lambda: source.read(DOWNLOAD_CHUNK_SIZE), b""):
+                            md5.update(chunk)
+                            f.write(chunk)
+                    # A file that fails its checksum is left out and downloaded again on its own
+                    if md5.hexdigest() != member.pax_headers.get(BULK_CHECKSUM_HEADER):
+                        logger.warning(f"Checksum mismatch for {member.name} in bulk download, discarding it")
+                        staged_path.unlink()
+                        continue
+                    fetched.append(member.name)
+        return fetched
+
+
+def get_backend() -> DataBackend:
+    match config["BACKEND"]:
+        case "upstream":
+            return UpstreamBackend()
+        case "mirror":
+            return MirrorBackend(config["MIRROR_DIR"])
+        case "proxy":
+            return ProxyBackend(config["PROXY_URL"])
+        case backend:
+            raise ValueError(f"Unknown data access backend: {backend}")
+
+
+def query(**query_params) -> list[FileRecord]:
+    logger.info(f"Querying data archive for {query_params}")
+    return get_backend().query(query_params)
+
+
+def spice_query(**query_params) -> list[SpiceFileRecord]:
+    logger.info(f"Querying data archive for SPICE kernels {query_params}")
+    return get_backend().spice_query(query_params)
+
+
+def _get_download_lock(destination: Path) -> threading.Lock:
+    with _download_locks_lock:
+        return _download_locks.setdefault(destination, threading.Lock())
+
+
+def _lock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after about ten seconds, but a download can hold the lock for much longer
+            continue
+
+
+@contextmanager
+def download_lock(destination: Path):
+    # Worker processes and other runs sharing the data directory write to the same partial file, so the lock is
+    # held on a file next to the destination rather than only within this process
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with _get_download_lock(destination):
+        with open(destination.with_name(destination.name + ".lock"), "a+b") as lock_file:
+            _lock_file(lock_file)
+            yield
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, ChunkedEncodingError,
+                              DownloadVerificationError))
+
+
+def _get_expected_size(response: requests.Response) -> Optional[int]:
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range:
+        total_size = content_range.rsplit("/", 1)[-1]
+        return int(total_size) if total_size.isdigit() else None
+    content_length = response.headers.get("Content-Length")
+    return int(content_length) if content_length is not None else None
+
+
+def _verify_download(part_path: Path, expected_size: Optional[int], etag: str):
+    size = part_path.stat().st_size
+    if expected_size is not None and size < expected_size:
+        raise IncompleteDownloadError(f"received {size} of {expected_size} bytes")
+    if expected_size is not None and size > expected_size:
+        raise DownloadVerificationError(f"received {size} bytes but expected {expected_size}")
+
+    if MD5_ETAG_PATTERN.fullmatch(etag):
+        md5 = hashlib.md5()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                md5.update(chunk)
+        if md5.hexdigest() != etag:
+            raise DownloadVerificationError(f"checksum {md5.hexdigest()} does not match ETag {etag}")
+
+
+def _download_part(url: str, part_path: Path):
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    try:
+        response = get(url, headers=headers, stream=True)
+    except requests.HTTPError as e:
+        if offset and e.response is not None and e.response.status_code == 416:
+            part_path.unlink(missing_ok=True)
+            raise IncompleteDownloadError(f"cannot resume from byte {offset}, starting over") from e
+        raise
+    try:
+        # A server that ignores the range sends the whole file again, so the partial file is started over
+        mode = "ab" if response.status_code == 206 else "wb"
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    finally:
+        response.close()
+    _verify_download(part_path, _get_expected_size(response), response.headers.get("ETag", "").strip('"'))
+
+
+def get_local_path(file_name: str | Path) -> Path:
+    path = generate_imap_file_path(Path(file_name).name).construct_path()
+    return get_data_dir() / path.relative_to(imap_data_access.config["DATA_DIR"])
+
+
+def download(file_name: str | Path) -> Path:
+    destination = get_local_path(file_name)
+    if destination.exists():
+        logger.info(f"The file {destination} already exists, skipping download")
+        get_local_store().record_access(destination)
+        return destination
+
+    if config["OFFLINE"]:
+        raise FileNotFoundError(f"{destination} is not available locally and downloads are disabled")
+
+    with download_lock(destination):
+        if destination.exists():
+            logger.info(f"The file {destination} was downloaded by another process, skipping download")
+        else:
+            relative_path = destination.relative_to(get_data_dir()).as_posix()
+            fetch_file(get_backend(), relative_path, destination)
+
+    local_store = get_local_store()
+    local_store.record_access(destination)
+    with local_store.pinned([destination]):
+        local_store.enforce_budget()
+    return destination
+
+
+def fetch_file(backend: DataBackend, relative_path: str, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    # Partial downloads are kept next to the destination so an interrupted transfer can resume where it stopped
+    part_path = destination.with_name(destination.name + ".part")
+    initial_size = part_path.stat().st_size if part_path.exists() else 0
+    start_time = time.monotonic()
+
+    attempts = max(1, config["DOWNLOAD_ATTEMPTS"])
+    for attempt in range(1, attempts + 1):
+        try:
+            backend.fetch(relative_path, part_path)
+            break
+        except Exception as e:
+            if destination.exists():
+                # Something outside the download lock, such as the processing libraries, put the file in place
+                logger.info(f"The file {destination} appeared while it was being downloaded, using it")
+                part_path.unlink(missing_ok=True)
+                return
+            if isinstance(e, DownloadVerificationError) and not isinstance(e, IncompleteDownloadError):
+                part_path.unlink(missing_ok=True)
+            if attempt == attempts or not _is_retryable(e):
+                raise
+            logger.warning(f"Download of {destination.name} failed on attempt {attempt}/{attempts}, retrying: {e}")
+            time.sleep(config["DOWNLOAD_RETRY_BACKOFF"] * 2 ** (attempt - 1))
+
+    size = part_path.stat().st_size
+    os.replace(part_path, destination)
+    elapsed = time.monotonic() - start_time
+    transferred = max(0, size - initial_size)
+    logger.info(f"Downloaded {destination}: {transferred} bytes in {elapsed:.2f}s "
+                f"({transferred / max(elapsed, 1e-6):.0f} bytes/s)")
+
+
+def fetch_bulk(backend: DataBackend, file_names: list[str]) -> list[Path]:
+    local_paths = [get_local_path(file_name) for file_name in file_names]
+    destinations = {path.relative_to(get_data_dir()).as_posix(): path for path in local_paths}
+    staging_root = get_data_dir() / ".mapping_tool_cache" / "bulk"
+    staging_root.mkdir(parents=True, exist_ok=True)
+    # Staged on the same file system as the data directory so files can be renamed into place
+    staging_dir = Path(tempfile.mkdtemp(dir=staging_root))
+    start_time = time.monotonic()
+    try:
+        fetched = backend.fetch_bulk(list(destinations), staging_dir)
+        paths = []
+        for relative_path in fetched:
+            destination = destinations[relative_path]
+            with download_lock(destination):
+                if not destination.exists():
+                    os.replace(staging_dir / relative_path, destination)
+            paths.append(destination)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    elapsed = time.monotonic() - start_time
+    size = sum(path.stat().st_size for path in paths)
+    logger.info(f"Downloaded {len(paths)} of {len(file_names)} files in one bulk request: {size} bytes in "
+                f"{elapsed:.2f}s ({size / max(elapsed, 1e-6):.0f} bytes/s)")
+
+    local_store = get_local_store()
+    for path in paths:
+        local_store.record_access(path)
+    with local_store.pinned(paths):
+        local_store.enforce_budget()
+    return paths
+
+
+def _fetch_missing_files_in_bulk(backend: DataBackend, file_names: list[str]):
+    missing = [file_name for file_name in dict.fromkeys(file_names) if not get_local_path(file_name).exists()]
+    batch_size = max(1, config["BULK_DOWNLOAD_BATCH_SIZE"])
+    batches = [missing[start:start + batch_size] for start in range(0, len(missing), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(batches), config["MAX_CONCURRENT_DOWNLOADS"]))) as executor:
+        futures = {executor.submit(fetch_bulk, backend, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"Bulk download of {len(futures[future])} files failed, downloading them one by one: "
+                               f"{e}")
+
+
+def download_files(file_names: list[str], progress_label: Optional[str] = None) -> list[Path]:
+    backend = get_backend()
+    if backend.supports_bulk_fetch and not config["OFFLINE"] and len(file_names) > 1:
+        _fetch_missing_files_in_bulk(backend, file_names)
+
+    # Anything the bulk requests did not deliver is downloaded one file at a time, which also records every file
+    # in the local store
+    paths = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max(1, config["MAX_CONCURRENT_DOWNLOADS"])) as executor:
+        futures = {executor.submit(download, file_name): file_name for file_name in file_names}
+        for i, future in enumerate(as_completed(futures), start=1):
+            if progress_label is not None:
+                print(f"\rDownloading {progress_label} {i}/{len(file_names)}... ", end="")
+                sys.stdout.flush()
+            file_name = futures[future]
+            try:
+                paths[file_name] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to download {file_name}: {e}")
+                failures[file_name] = e
+
+    if failures:
+        raise DownloadError(failures)
+    return [paths[file_name] for file_name in file_names]
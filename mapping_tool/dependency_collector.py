@@ -1,15 +1,176 @@
 import os
-from datetime import datetime, timezone
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta, time
+from itertools import accumulate
 from pathlib import Path
+from typing import Optional, TYPE_CHECKING
 
-import imap_data_access
-import requests
+import numpy as np
 from imap_processing.ena_maps.utils.naming import MapDescriptor, MappableInstrumentShortName
 
+from mapping_tool import data_access
+from mapping_tool.query_records import FileRecord, SpiceFileRecord
+
+if TYPE_CHECKING:
+    from mapping_tool.dependency_manifest import DependencyManifest
+
+
+def to_utc_datetime64(date: datetime) -> np.datetime64:
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(date, "s")
+
+
+class KernelIntervalIndex:
+    def __init__(self, spice_files: list[SpiceFileRecord]):
+        self._file_names = np.array([Path(spice_file.file_name).name for spice_file in spice_files], dtype=object)
+        starts = np.array([spice_file.min_date_datetime.replace(", ", "T") for spice_file in spice_files],
+                          dtype="datetime64[s]")
+        ends = np.array([spice_file.max_date_datetime.replace(", ", "T") for spice_file in spice_files],
+                        dtype="datetime64[s]")
+        self._order = np.argsort(starts, kind="stable")
+        self._starts = starts[self._order]
+        self._ends = ends[self._order]
+
+    def overlapping(self, windows: list[tuple[datetime, datetime]]) -> list[list[str]]:
+        window_starts = np.array([to_utc_datetime64(start) for start, _ in windows], dtype="datetime64[s]")
+        window_ends = np.array([to_utc_datetime64(end) for _, end in windows], dtype="datetime64[s]")
+        candidate_counts = np.searchsorted(self._starts, window_ends, side="right")
+
+        results = []
+        for window_start, candidate_count in zip(window_starts, candidate_counts):
+            overlaps = self._order[:candidate_count][self._ends[:candidate_count] > window_start]
+            results.append(list(self._file_names[np.sort(overlaps)]))
+        return results
+
+
+class SpiceKernelCatalog:
+    KERNEL_TYPES = ["leapseconds", "spacecraft_clock", "pointing_attitude", "imap_frames", "science_frames"]
+
+    def __init__(self):
+        self._indexes: dict[str, KernelIntervalIndex] = {}
+        self._kernel_type_locks = {kernel_type: threading.Lock() for kernel_type in self.KERNEL_TYPES}
+
+    def get_index(self, kernel_type: str) -> KernelIntervalIndex:
+        with self._kernel_type_locks[kernel_type]:
+            if kernel_type not in self._indexes:
+                # The whole listing is requested and narrowed to each window here. A date window applied by the
+                # server could leave out kernels like leapseconds whose coverage starts long before the map
+                spice_files = data_access.spice_query(type=kernel_type, start_time=0)
+                self._indexes[kernel_type] = KernelIntervalIndex(spice_files)
+            return self._indexes[kernel_type]
+
+    def get_kernels(self, start_date: datetime, end_date: datetime) -> list[str]:
+        return self.get_kernels_for_windows([(start_date, end_date)])[0]
+
+    def get_kernels_for_windows(self, windows: list[tuple[datetime, datetime]]) -> list[list[str]]:
+        with ThreadPoolExecutor(max_workers=len(self.KERNEL_TYPES)) as executor:
+            indexes = list(executor.map(self.get_index, self.KERNEL_TYPES))
+
+        file_names = [[] for _ in windows]
+        for index in indexes:
+            for window_file_names, overlapping in zip(file_names, index.overlapping(windows)):
+                window_file_names.extend(overlapping)
+        return file_names
+
+    def refresh(self):
+        for kernel_type in self.KERNEL_TYPES:
+            with self._kernel_type_locks[kernel_type]:
+                self._indexes.pop(kernel_type, None)
+
+
+@dataclass
+class MapDependencies:
+    psets: list[str]
+    ancillary_dependencies: list[str]
+    spice_kernels: list[str]
+
+
+class AncillaryIndex:
+    def __init__(self, files: list[FileRecord]):
+        entries_by_descriptor: dict[str, list[tuple[str, str, int, str]]] = {}
+        for position, file in enumerate(files):
+            entries_by_descriptor.setdefault(file.descriptor, []).append(
+                (file.start_date, file.version, -position, Path(file.file_path).name))
+
+        self._start_dates: dict[str, list[str]] = {}
+        self._entries: dict[str, list[tuple[str, str, int, str]]] = {}
+        self._first_positions: dict[str, list[int]] = {}
+        for file_descriptor, entries in entries_by_descriptor.items():
+            entries.sort()
+            self._entries[file_descriptor] = entries
+            self._start_dates[file_descriptor] = [start_date for start_date, _, _, _ in entries]
+            self._first_positions[file_descriptor] = list(accumulate((-position for _, _, position, _ in entries), min))
+
+    def resolve(self, end_date: datetime) -> list[str]:
+        if end_date.tzinfo is not None:
+            end_date = end_date.astimezone(timezone.utc)
+        # A file is valid from midnight UTC of its start date, so files starting on the end date count only if
+        # the map ends after midnight
+        cutoff_date = end_date.date() if end_date.time() == time(0) else end_date.date() + timedelta(days=1)
+        cutoff = cutoff_date.strftime("%Y%m%d")
+
+        selected = []
+        for file_descriptor, start_dates in self._start_dates.items():
+            valid_count = bisect_left(start_dates, cutoff)
+            if valid_count > 0:
+                _, _, _, file_name = self._entries[file_descriptor][valid_count - 1]
+                selected.append((self._first_positions[file_descriptor][valid_count - 1], file_name))
+        return [file_name for _, file_name in sorted(selected)]
+
 
 class DependencyCollector:
-    @staticmethod
-    def get_pointing_sets(descriptor: MapDescriptor, start_date: datetime, end_date: datetime) -> list[str]:
+    spice_kernel_catalog = SpiceKernelCatalog()
+    query_span: Optional[tuple[datetime, datetime]] = None
+    _pset_listings: dict[tuple[str, str, str, str], list[dict]] = {}
+    _pset_listing_locks: dict[tuple[str, str, str, str], threading.Lock] = {}
+    _pset_listings_lock = threading.Lock()
+    _ancillary_indexes: dict[tuple[str, str, str], AncillaryIndex] = {}
+    _ancillary_indexes_lock = threading.Lock()
+    _window_spice_kernels: dict[tuple[datetime, datetime], list[str]] = {}
+    _window_spice_kernels_lock = threading.Lock()
+    manifest: Optional["DependencyManifest"] = None
+    replay_manifest: bool = False
+
+    @classmethod
+    @contextmanager
+    def use_manifest(cls, manifest: "DependencyManifest", replay: bool = False):
+        previous_manifest, previous_replay = cls.manifest, cls.replay_manifest
+        cls.manifest, cls.replay_manifest = manifest, replay
+        try:
+            yield manifest
+        finally:
+            cls.manifest, cls.replay_manifest = previous_manifest, previous_replay
+
+    @classmethod
+    @contextmanager
+    def span_queries(cls, start_date: datetime, end_date: datetime):
+        previous_span = cls.query_span
+        cls.query_span = (start_date, end_date)
+        try:
+            yield
+        finally:
+            cls.query_span = previous_span
+            with cls._pset_listings_lock:
+                cls._pset_listings.clear()
+                cls._pset_listing_locks.clear()
+            with cls._ancillary_indexes_lock:
+                cls._ancillary_indexes.clear()
+            with cls._window_spice_kernels_lock:
+                cls._window_spice_kernels.clear()
+
+    @classmethod
+    def _get_covering_span(cls, start_date: datetime, end_date: datetime) -> Optional[tuple[datetime, datetime]]:
+        if cls.query_span is not None and cls.query_span[0] <= start_date and end_date <= cls.query_span[1]:
+            return cls.query_span
+        return None
+
+    @classmethod
+    def get_pointing_sets(cls, descriptor: MapDescriptor, start_date: datetime, end_date: datetime) -> list[str]:
         map_instrument_pset_descriptors = []
 
         if descriptor.instrument == MappableInstrumentShortName.HI:
@@ -30,80 +191,118 @@ class DependencyCollector:
 
         assert len(map_instrument_pset_descriptors) > 0
         instrument_for_query = descriptor.instrument.name.lower()
+        span = cls._get_covering_span(start_date, end_date)
+        query_start_date, query_end_date = span if span is not None else (start_date, end_date)
+        query_start_date = query_start_date.strftime("%Y%m%d")
+        query_end_date = query_end_date.strftime("%Y%m%d")
         start_date = start_date.strftime("%Y%m%d")
         end_date = end_date.strftime("%Y%m%d")
 
         def filter_files_by_highest_version(files: list):
             dates_to_files = {}
             for file in files:
-                if file["start_date"] not in dates_to_files or file["version"] > dates_to_files[file["start_date"]][
-                    "version"]:
-                    dates_to_files[file["start_date"]] = file
+                if file.start_date not in dates_to_files or file.version > dates_to_files[file.start_date].version:
+                    dates_to_files[file.start_date] = file
             return dates_to_files.values()
 
-        files = []
-        for pset_descriptor in map_instrument_pset_descriptors:
-            files.extend(filter_files_by_highest_version(imap_data_access.query(instrument=instrument_for_query,
-                                                                                start_date=start_date,
-                                                                                end_date=end_date,
-                                                                                data_level="l1c",
-                                                                                descriptor=pset_descriptor)))
+        def query_pset_descriptor(pset_descriptor: str):
+            return list(filter_files_by_highest_version(data_access.query(instrument=instrument_for_query,
+                                                                          start_date=query_start_date,
+                                                                          end_date=query_end_date,
+                                                                          data_level="l1c",
+                                                                          descriptor=pset_descriptor)))
+
+        def query_pset_descriptor_for_span(pset_descriptor: str):
+            key = (instrument_for_query, pset_descriptor, query_start_date, query_end_date)
+            with cls._pset_listings_lock:
+                listing_lock = cls._pset_listing_locks.setdefault(key, threading.Lock())
+            with listing_lock:
+                if key not in cls._pset_listings:
+                    cls._pset_listings[key] = query_pset_descriptor(pset_descriptor)
+            # The span query used the archive's date semantics: start dates on or after start_date, before end_date
+            return [file for file in cls._pset_listings[key] if start_date <= file.start_date < end_date]
 
-        return [Path(pset['file_path']).name for pset in files]
+        with ThreadPoolExecutor(max_workers=len(map_instrument_pset_descriptors)) as executor:
+            query_function = query_pset_descriptor_for_span if span is not None else query_pset_descriptor
+            files = [file for descriptor_files in executor.map(query_function, map_instrument_pset_descriptors)
+                     for file in descriptor_files]
+
+        return [Path(pset.file_path).name for pset in files]
+
+    @classmethod
+    def resolve_map_dependencies(cls, descriptor: MapDescriptor, start_date: datetime,
+                                 end_date: datetime) -> MapDependencies:
+        if cls.manifest is not None and cls.replay_manifest:
+            return cls.manifest.lookup(descriptor, start_date, end_date)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            psets = executor.submit(cls.get_pointing_sets, descriptor, start_date, end_date)
+            ancillary_dependencies = executor.submit(cls.get_ancillary_dependencies, descriptor, end_date)
+            spice_kernels = executor.submit(cls.collect_spice_kernels, start_date=start_date, end_date=end_date)
+            dependencies = MapDependencies(psets=psets.result(),
+                                           ancillary_dependencies=ancillary_dependencies.result(),
+                                           spice_kernels=spice_kernels.result())
+
+        if cls.manifest is not None:
+            cls.manifest.record(descriptor, start_date, end_date, dependencies)
+        return dependencies
+
+    @classmethod
+    def resolve_l3_map_dependencies(cls, descriptor: MapDescriptor, start_date: datetime,
+                                    end_date: datetime) -> MapDependencies:
+        if cls.manifest is not None and cls.replay_manifest:
+            return cls.manifest.lookup(descriptor, start_date, end_date)
+
+        dependencies = MapDependencies(psets=[], ancillary_dependencies=[],
+                                       spice_kernels=cls.collect_spice_kernels(start_date=start_date,
+                                                                               end_date=end_date))
+        if cls.manifest is not None:
+            cls.manifest.record(descriptor, start_date, end_date, dependencies)
+        return dependencies
 
     @classmethod
     def collect_spice_kernels(cls, start_date: datetime, end_date: datetime) -> list[str]:
-        file_names = []
-        auth_headers = {"Authorization": f"Bearer {imap_data_access.config['ACCESS_TOKEN']}"}
-        for kernel_type in ["leapseconds", "spacecraft_clock", "pointing_attitude", "imap_frames", "science_frames"]:
-            response = requests.get(
-                imap_data_access.config["DATA_ACCESS_URL"] + f"/spice-query?type={kernel_type}&start_time=0",
-                headers=auth_headers
-            )
-            response.raise_for_status()
-            file_json = response.json()
-            for spice_file in file_json:
-                spice_start_date = datetime.strptime(spice_file["min_date_datetime"], "%Y-%m-%d, %H:%M:%S")
-                spice_start_date = spice_start_date.replace(tzinfo=timezone.utc)
-                spice_end_date = datetime.strptime(spice_file["max_date_datetime"], "%Y-%m-%d, %H:%M:%S")
-                spice_end_date = spice_end_date.replace(tzinfo=timezone.utc)
-                if spice_start_date <= end_date and start_date < spice_end_date:
-                    file_names.append(Path(spice_file["file_name"]).name)
-        return file_names
+        return cls.collect_spice_kernels_for_windows([(start_date, end_date)])[0]
+
+    @classmethod
+    def collect_spice_kernels_for_windows(cls, windows: list[tuple[datetime, datetime]]) -> list[list[str]]:
+        if cls._get_covering_span(min(start for start, _ in windows), max(end for _, end in windows)) is None:
+            return cls.spice_kernel_catalog.get_kernels_for_windows(windows)
+
+        # Within a run's span the kernels of each window are kept, so resolving every window in one batch up front
+        # answers each map's later lookup
+        with cls._window_spice_kernels_lock:
+            missing_windows = [window for window in dict.fromkeys(windows) if window not in cls._window_spice_kernels]
+        if missing_windows:
+            kernels = cls.spice_kernel_catalog.get_kernels_for_windows(missing_windows)
+            with cls._window_spice_kernels_lock:
+                cls._window_spice_kernels.update(zip(missing_windows, kernels))
+        with cls._window_spice_kernels_lock:
+            return [list(cls._window_spice_kernels[window]) for window in windows]
 
     @classmethod
-    def _filter_ancillary_dependencies(cls, descriptor: MapDescriptor, files: list[dict[str, str]]) -> list[
-        dict[str, str]]:
+    def _filter_ancillary_dependencies(cls, descriptor: MapDescriptor, files: list[FileRecord]) -> list[FileRecord]:
         if descriptor.instrument == MappableInstrumentShortName.HI:
-            return [f for f in files if f"{descriptor.sensor}sensor" in f['file_path']]
+            return [f for f in files if f"{descriptor.sensor}sensor" in f.file_path]
         return files
 
     @classmethod
     def get_ancillary_dependencies(cls, descriptor: MapDescriptor, end_date: datetime) -> list[
         str]:
-        ancillaries = imap_data_access.query(table="ancillary", instrument=descriptor.instrument.name.lower())
-        ancillaries = cls._filter_ancillary_dependencies(descriptor, ancillaries)
-
-        def filter_files_by_highest_version(files: list):
-            dates_to_files = {}
-            valid_files = []
-            for f in files:
-                utc_start_time = datetime.strptime(f["start_date"], "%Y%m%d").replace(tzinfo=timezone.utc)
-                if utc_start_time < end_date:
-                    valid_files.append(f)
-
-            for file in valid_files:
-                file_descriptor = file["descriptor"]
-                if file_descriptor not in dates_to_files:
-                    dates_to_files[file_descriptor] = file
-                else:
-                    if dates_to_files[file_descriptor]["start_date"] == file["start_date"]:
-                        if dates_to_files[file_descriptor]["version"] < file["version"]:
-                            dates_to_files[file_descriptor] = file
-
-                    if dates_to_files[file_descriptor]["start_date"] < file["start_date"]:
-                        dates_to_files[file_descriptor] = file
-
-            return dates_to_files.values()
+        instrument_for_query = descriptor.instrument.name.lower()
+        span = cls._get_covering_span(end_date, end_date)
+        if span is None:
+            ancillaries = data_access.query(table="ancillary", instrument=instrument_for_query)
+            return AncillaryIndex(cls._filter_ancillary_dependencies(descriptor, ancillaries)).resolve(end_date)
 
-        return [Path(file['file_path']).name for file in filter_files_by_highest_version(ancillaries)]
+        # Only files starting before the end of the run can be selected, so the listing is narrowed by date
+        query_end_date = (span[1] + timedelta(days=1)).strftime("%Y%m%d")
+        key = (instrument_for_query, descriptor.sensor, query_end_date)
+        with cls._ancillary_indexes_lock:
+            if key not in cls._ancillary_indexes:
+                ancillaries = data_access.query(table="ancillary", instrument=instrument_for_query,
+                                                end_date=query_end_date)
+                cls._ancillary_indexes[key] = AncillaryIndex(cls._filter_ancillary_dependencies(descriptor,
+                                                                                                ancillaries))
+            ancillary_index = cls._ancillary_indexes[key]
+        return ancillary_index.resolve(end_date)
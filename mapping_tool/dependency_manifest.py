@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+
+from imap_processing.ena_maps.utils.naming import MapDescriptor
+
+from mapping_tool.dependency_collector import MapDependencies
+
+
+class DependencyManifest:
+    def __init__(self, maps: dict[str, MapDependencies] = None):
+        self.maps = maps or {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(descriptor: MapDescriptor, start_date: datetime, end_date: datetime) -> str:
+        return f"{descriptor.to_string()} {start_date.isoformat()} {end_date.isoformat()}"
+
+    def record(self, descriptor: MapDescriptor, start_date: datetime, end_date: datetime,
+               dependencies: MapDependencies):
+        with self._lock:
+            self.maps[self.make_key(descriptor, start_date, end_date)] = dependencies
+
+    def update(self, maps: dict[str, MapDependencies]):
+        with self._lock:
+            self.maps.update(maps)
+
+    def lookup(self, descriptor: MapDescriptor, start_date: datetime, end_date: datetime) -> MapDependencies:
+        key = self.make_key(descriptor, start_date, end_date)
+        if key not in self.maps:
+            raise ValueError(f"Dependency manifest has no entry for {key}")
+        return self.maps[key]
+
+    def to_file(self, manifest_path: Path):
+        with self._lock:
+            maps = {key: asdict(dependencies) for key, dependencies in self.maps.items()}
+        manifest_path.write_text(json.dumps({"maps": maps}, indent=2))
+
+    @classmethod
+    def from_file(cls, manifest_path: Path) -> DependencyManifest:
+        manifest = json.loads(manifest_path.read_text())
+        return cls({key: MapDependencies(**dependencies) for key, dependencies in manifest["maps"].items()})
@@ -1,11 +1,14 @@
-import sys
-from dataclasses import replace
+from dataclasses import dataclass, replace
+import hashlib
+import importlib.metadata
+import json
 import logging
+import os
+import shutil
 from datetime import datetime
 from pathlib import Path
-from unittest.mock import patch
+from typing import Optional
 
-import imap_data_access
 
 from mapping_tool.configuration import DataLevel
 from imap_processing.ena_maps.utils.naming import MapDescriptor, MappableInstrumentShortName
@@ -14,9 +17,13 @@ from imap_l3_processing.hi.hi_processor import HiProcessor
 from imap_l3_processing.ultra.l3.ultra_processor import UltraProcessor
 from imap_l3_processing.lo.lo_processor import LoProcessor
 from imap_processing.cli import Hi, Lo, Ultra
-from imap_data_access import ProcessingInputCollection, ScienceInput, SPICEInput, AncillaryInput, download
+from imap_data_access import ProcessingInputCollection, ScienceInput, SPICEInput, AncillaryInput
+from imap_data_access.file_validation import generate_imap_file_path
 
+from mapping_tool.data_access import download, download_files, get_local_store
 from mapping_tool.dependency_collector import DependencyCollector
+from mapping_tool.map_cache import MapCache, get_map_cache
+from mapping_tool.map_coord_frame import use_map_coord_frame
 import spiceypy
 
 from mapping_tool.mapping_tool_descriptor import MappingToolDescriptor
@@ -94,23 +101,173 @@ def get_data_level_for_descriptor(descriptor: MappingToolDescriptor):
         return DataLevel.L2
 
 
-def generate_map(descriptor: MappingToolDescriptor, start: datetime, end: datetime) -> Path:
-    logger.info("preparing to generate map %s", descriptor.to_mapping_tool_string())
-    data_level = get_data_level_for_descriptor(descriptor)
+def get_map_dependency_descriptors(descriptor: MappingToolDescriptor) -> list[MappingToolDescriptor]:
+    descriptors = {}
+    _collect_map_dependency_descriptors(descriptor, descriptors)
+    return list(descriptors.values())
+
+
+def _collect_map_dependency_descriptors(descriptor: MappingToolDescriptor,
+                                        descriptors: dict[str, MappingToolDescriptor]):
+    if descriptor.to_mapping_tool_string() in descriptors:
+        return
+    if get_data_level_for_descriptor(descriptor) == DataLevel.L3:
+        for dependency in get_dependencies_for_l3_map(descriptor):
+            _collect_map_dependency_descriptors(dependency, descriptors)
+    descriptors[descriptor.to_mapping_tool_string()] = descriptor
+
+
+MapNodeKey = tuple[str, datetime, datetime]
+
+
+def get_map_node_key(descriptor: MappingToolDescriptor, start: datetime, end: datetime) -> MapNodeKey:
+    return descriptor.to_mapping_tool_string(), start, end
+
+
+@dataclass
+class MapNode:
+    descriptor: MappingToolDescriptor
+    start: datetime
+    end: datetime
+    dependencies: list[MapNodeKey]
+
+    @property
+    def key(self) -> MapNodeKey:
+        return get_map_node_key(self.descriptor, self.start, self.end)
+
+
+def plan_map_generation(maps: list[tuple[MappingToolDescriptor, datetime, datetime]]) -> dict[MapNodeKey, MapNode]:
+    plan = {}
+    for descriptor, start, end in maps:
+        # Dependencies come before the maps built from them, so the plan's order is an order the maps can be made in
+        for map_descriptor in get_map_dependency_descriptors(descriptor):
+            key = get_map_node_key(map_descriptor, start, end)
+            if key in plan:
+                continue
+            dependencies = []
+            if get_data_level_for_descriptor(map_descriptor) == DataLevel.L3:
+                dependencies = [get_map_node_key(dependency, start, end)
+                                for dependency in get_dependencies_for_l3_map(map_descriptor)]
+            plan[key] = MapNode(map_descriptor, start, end, dependencies)
+    return plan
+
+
+def generate_map_node(node: MapNode, input_maps: list[Path]) -> Path:
+    data_level = get_data_level_for_descriptor(node.descriptor)
     if data_level == DataLevel.L2:
-        logger.info("generating l2 map %s", descriptor.to_mapping_tool_string())
-        return generate_l2_map(descriptor, start, end)
+        logger.info("generating l2 map %s", node.descriptor.to_mapping_tool_string())
+        return generate_l2_map(node.descriptor, node.start, node.end)
     elif data_level == DataLevel.L3:
-        map_deps = []
-        deps = get_dependencies_for_l3_map(descriptor)
-        logger.info("identified dependencies %s", deps)
-        for dependency in deps:
-            print(f"Generating intermediate map {dependency.to_mapping_tool_string()}")
-            map_deps.append(generate_map(dependency, start, end))
-        logger.info("generating l3 map %s", descriptor.to_mapping_tool_string())
-        return generate_l3_map(descriptor, start, end, map_deps)
+        logger.info("generating l3 map %s", node.descriptor.to_mapping_tool_string())
+        return generate_l3_map(node.descriptor, node.start, node.end, input_maps)
     else:
-        raise ValueError(f"Cannot produce map for instrument: {descriptor.instrument_descriptor}")
+        raise ValueError(f"Cannot produce map for instrument: {node.descriptor.instrument_descriptor}")
+
+
+def get_processing_version(package: str) -> str:
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def get_file_hash(path: Optional[Path]) -> Optional[str]:
+    if path is None:
+        return None
+    # Custom kernels are edited in place, so their contents rather than their path identify them
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_map_input_files(node: MapNode) -> list[str]:
+    match get_data_level_for_descriptor(node.descriptor):
+        case DataLevel.L2:
+            dependencies = DependencyCollector.resolve_map_dependencies(node.descriptor, node.start, node.end)
+            return [*dependencies.psets, *dependencies.ancillary_dependencies, *dependencies.spice_kernels]
+        case DataLevel.L3:
+            return DependencyCollector.resolve_l3_map_dependencies(node.descriptor, node.start, node.end).spice_kernels
+        case _:
+            raise ValueError(f"Cannot produce map for instrument: {node.descriptor.instrument_descriptor}")
+
+
+def get_map_cache_keys(plan: dict[MapNodeKey, MapNode]) -> dict[MapNodeKey, str]:
+    input_hashes = {}
+    cache_keys = {}
+    for key, node in plan.items():
+        # Input file names carry their versions, and an L3 map's inputs include everything its input maps were made
+        # from, so reprocessing any file upstream of a map gives it a new key
+        inputs = {
+            "descriptor": node.descriptor.to_mapping_tool_string(),
+            "spice_frame": str(node.descriptor.spice_frame),
+            "kernel": get_file_hash(node.descriptor.kernel_path),
+            "files": sorted(get_map_input_files(node)),
+            "input_maps": [input_hashes[dependency] for dependency in node.dependencies],
+            "imap_processing": get_processing_version("imap-processing"),
+            "imap_l3_processing": get_processing_version("imap-l3-processing"),
+        }
+        input_hashes[key] = hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+        cache_keys[key] = MapCache.make_key(*key, input_hashes[key])
+    return cache_keys
+
+
+def find_cached_maps(plan: dict[MapNodeKey, MapNode], targets: list[MapNodeKey], map_cache: MapCache,
+                     cache_keys: dict[MapNodeKey, str]) -> tuple[dict[MapNodeKey, Path], dict[MapNodeKey, MapNode]]:
+    cached_maps = {}
+    needed = set()
+    # Maps are only needed to build the targets, so nothing below a cached map has to be made or even looked up
+    pending = list(targets)
+    while pending:
+        key = pending.pop()
+        if key in cached_maps or key in needed:
+            continue
+        cached_path = map_cache.get(cache_keys[key])
+        if cached_path is not None:
+            cached_maps[key] = cached_path
+        else:
+            needed.add(key)
+            pending.extend(plan[key].dependencies)
+    return cached_maps, {key: node for key, node in plan.items() if key in needed}
+
+
+def copy_cached_map(cached_path: Path, destination: Path) -> Path:
+    # A hard link is as cheap as a symlink but keeps working after the cache evicts its copy
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(cached_path, destination)
+    except OSError:
+        shutil.copyfile(cached_path, destination)
+    return destination
+
+
+def run_map_plan(plan: dict[MapNodeKey, MapNode], targets: list[MapNodeKey]) -> dict[MapNodeKey, Path]:
+    results = {}
+    map_cache = get_map_cache()
+    if map_cache is not None:
+        cache_keys = get_map_cache_keys(plan)
+        cached_maps, plan = find_cached_maps(plan, targets, map_cache, cache_keys)
+        for key, cached_path in cached_maps.items():
+            print(f"Using cached map {key[0]}")
+            results[key] = copy_cached_map(cached_path, generate_imap_file_path(cached_path.name).construct_path())
+
+    for key, node in plan.items():
+        if key not in targets:
+            print(f"Generating intermediate map {node.descriptor.to_mapping_tool_string()}")
+        results[key] = generate_map_node(node, [results[dependency] for dependency in node.dependencies])
+        if map_cache is not None:
+            map_cache.put(cache_keys[key], results[key])
+    return results
+
+
+def generate_map(descriptor: MappingToolDescriptor, start: datetime, end: datetime) -> Path:
+    logger.info("preparing to generate map %s", descriptor.to_mapping_tool_string())
+    plan = plan_map_generation([(descriptor, start, end)])
+    logger.info("planned %d maps: %s", len(plan), [node.descriptor.to_mapping_tool_string() for node in plan.values()])
+    target = get_map_node_key(descriptor, start, end)
+    return run_map_plan(plan, [target])[target]
 
 
 def generate_l3_map(descriptor: MappingToolDescriptor, start: datetime, end: datetime, input_maps: list[Path]) -> Path:
@@ -129,29 +286,30 @@ def generate_l3_map(descriptor: MappingToolDescriptor, start: datetime, end: dat
         descriptor=descriptor.to_string(),
     )
 
-    spice_kernel_paths = DependencyCollector.collect_spice_kernels(start_date=start, end_date=end)
-    for kernel in spice_kernel_paths:
-        kernel_path = imap_data_access.download(kernel)
-        spiceypy.furnsh(str(kernel_path))
-    if descriptor.kernel_path is not None:
-        spiceypy.furnsh(str(descriptor.kernel_path))
+    spice_kernel_paths = DependencyCollector.resolve_l3_map_dependencies(descriptor, start, end).spice_kernels
+    with get_local_store().pinned(spice_kernel_paths):
+        for kernel in spice_kernel_paths:
+            kernel_path = download(kernel)
+            spiceypy.furnsh(str(kernel_path))
+        if descriptor.kernel_path is not None:
+            spiceypy.furnsh(str(descriptor.kernel_path))
 
-    processing_input_collection = ProcessingInputCollection(*[ScienceInput(dep.name) for dep in input_maps])
+        processing_input_collection = ProcessingInputCollection(*[ScienceInput(dep.name) for dep in input_maps])
 
-    processor = processor_class(
-        processing_input_collection,
-        input_metadata
-    )
+        processor = processor_class(
+            processing_input_collection,
+            input_metadata
+        )
 
-    try:
-        processed_files = processor.process(descriptor.spice_frame)
-    except Exception as e:
-        note = f"Processing for {descriptor.to_string()} failed"
-        if hasattr(e, "add_note"):
-            e.add_note(note)
-        else:
-            e.__notes__ = [note]
-        raise e
+        try:
+            processed_files = processor.process(descriptor.spice_frame)
+        except Exception as e:
+            note = f"Processing for {descriptor.to_string()} failed"
+            if hasattr(e, "add_note"):
+                e.add_note(note)
+            else:
+                e.__notes__ = [note]
+            raise e
 
     if len(processed_files) < 1:
         raise ValueError("L3 processing did not return any files!")
@@ -162,61 +320,55 @@ def generate_l3_map(descriptor: MappingToolDescriptor, start: datetime, end: dat
 
 
 def generate_l2_map(descriptor: MappingToolDescriptor, start_date: datetime, end_date: datetime) -> Path:
-    spice_kernel_names = DependencyCollector.collect_spice_kernels(start_date=start_date, end_date=end_date)
-
     map_details = f'{descriptor.to_string()} {start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}'
-    psets = DependencyCollector.get_pointing_sets(descriptor, start_date, end_date)
+    dependencies = DependencyCollector.resolve_map_dependencies(descriptor, start_date, end_date)
+    psets = dependencies.psets
+    ancillary_dependencies = dependencies.ancillary_dependencies
+    spice_kernel_names = dependencies.spice_kernels
     if len(psets) == 0:
         raise ValueError(f"No pointing sets found for {map_details}")
-    for i, pset in enumerate(psets, start=1):
-        print(f"\rDownloading psets {i}/{len(psets)}... ", end="")
-        sys.stdout.flush()
-        download(pset)
-
-    ancillary_dependencies = DependencyCollector.get_ancillary_dependencies(descriptor, end_date)
-    for dependency in ancillary_dependencies:
-        download(dependency)
-
-    processing_input_collection = ProcessingInputCollection(
-        *[ScienceInput(pset) for pset in psets],
-        *[SPICEInput(kernel) for kernel in spice_kernel_names],
-        *[AncillaryInput(dependency) for dependency in ancillary_dependencies]
-    )
 
-    processor_classes = {
-        MappableInstrumentShortName.HI: Hi,
-        MappableInstrumentShortName.LO: Lo,
-        MappableInstrumentShortName.ULTRA: Ultra,
-    }
-    processor_class = processor_classes[descriptor.instrument]
+    with get_local_store().pinned([*psets, *ancillary_dependencies, *spice_kernel_names]):
+        download_files([*psets, *ancillary_dependencies, *spice_kernel_names], progress_label="dependencies")
 
-    with patch('imap_processing.ena_maps.utils.naming.MapDescriptor.get_map_coord_frame') as mock_coord_frame:
-        mock_coord_frame.return_value = descriptor.spice_frame
-
-        processor = processor_class(
-            data_level="l2", data_descriptor=descriptor.to_string(),
-            dependency_str=processing_input_collection.serialize(),
-            start_date=start_date.strftime("%Y%m%d"),
-            repointing=None,
-            version="0",
-            upload_to_sdc=False
+        processing_input_collection = ProcessingInputCollection(
+            *[ScienceInput(pset) for pset in psets],
+            *[SPICEInput(kernel) for kernel in spice_kernel_names],
+            *[AncillaryInput(dependency) for dependency in ancillary_dependencies]
         )
 
-        downloaded_deps = processor.pre_processing()
-        if descriptor.kernel_path:
-            spiceypy.furnsh(str(descriptor.kernel_path))
-        try:
-            results = processor.do_processing(downloaded_deps)
-            paths = processor.post_processing(results, downloaded_deps)
-        except Exception as e:
-            note = f"Processing for {descriptor.to_string()} failed"
-            if hasattr(e, "add_note"):
-                e.add_note(note)
-            else:
-                e.__notes__ = [note]
-            raise e
-        finally:
-            processor.cleanup()
+        processor_classes = {
+            MappableInstrumentShortName.HI: Hi,
+            MappableInstrumentShortName.LO: Lo,
+            MappableInstrumentShortName.ULTRA: Ultra,
+        }
+        processor_class = processor_classes[descriptor.instrument]
+
+        with use_map_coord_frame(descriptor.spice_frame):
+            processor = processor_class(
+                data_level="l2", data_descriptor=descriptor.to_string(),
+                dependency_str=processing_input_collection.serialize(),
+                start_date=start_date.strftime("%Y%m%d"),
+                repointing=None,
+                version="0",
+                upload_to_sdc=False
+            )
+
+            downloaded_deps = processor.pre_processing()
+            if descriptor.kernel_path:
+                spiceypy.furnsh(str(descriptor.kernel_path))
+            try:
+                results = processor.do_processing(downloaded_deps)
+                paths = processor.post_processing(results, downloaded_deps)
+            except Exception as e:
+                note = f"Processing for {descriptor.to_string()} failed"
+                if hasattr(e, "add_note"):
+                    e.add_note(note)
+                else:
+                    e.__notes__ = [note]
+                raise e
+            finally:
+                processor.cleanup()
 
     if len(paths) > 1:
         raise ValueError("L2 processing returned too many files!")
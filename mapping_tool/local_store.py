@@ -0,0 +1,130 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional
+
+from mapping_tool.lru_index import LruIndex
+
+logger = logging.getLogger(__name__)
+
+PIN_LEASE_SECONDS = 600
+PIN_HEARTBEAT_SECONDS = 60
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class LocalStore(LruIndex):
+    def __init__(self, index_path: Path, budget_bytes: Optional[int] = None):
+        super().__init__(index_path, "files", budget_bytes)
+        self._owner = uuid.uuid4().hex
+        self._heartbeat: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        with self._connect() as connection:
+            # Pins live in the shared index as leases, so a run never evicts files another run on the same data
+            # directory is still using. A lease lapses when its holder stops renewing it or, on this host, exits
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases (owner TEXT PRIMARY KEY, host TEXT NOT NULL, pid INTEGER NOT NULL, "
+                "expires REAL NOT NULL)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS pins (owner TEXT NOT NULL, name TEXT NOT NULL, count INTEGER NOT NULL, "
+                "PRIMARY KEY (owner, name))")
+
+    @staticmethod
+    def _file_name(file: str | Path) -> str:
+        return Path(file).name
+
+    def record_access(self, path: Path):
+        self._record(path.name, path)
+
+    def pin(self, files: Iterable[str | Path]):
+        counts = Counter(self._file_name(file) for file in files)
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                "INSERT INTO leases (owner, host, pid, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET expires=excluded.expires",
+                (self._owner, socket.gethostname(), os.getpid(), time.time() + PIN_LEASE_SECONDS))
+            connection.executemany(
+                "INSERT INTO pins (owner, name, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(owner, name) DO UPDATE SET count=count + excluded.count",
+                [(self._owner, name, count) for name, count in counts.items()])
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._renew_lease, name="local-store-lease", daemon=True)
+                self._heartbeat.start()
+
+    def unpin(self, files: Iterable[str | Path]):
+        counts = Counter(self._file_name(file) for file in files)
+        with self._lock, self._connect() as connection:
+            connection.executemany("UPDATE pins SET count=count - ? WHERE owner = ? AND name = ?",
+                                   [(count, self._owner, name) for name, count in counts.items()])
+            connection.execute("DELETE FROM pins WHERE owner = ? AND count <= 0", (self._owner,))
+            connection.execute("DELETE FROM leases WHERE owner = ? AND NOT EXISTS "
+                               "(SELECT 1 FROM pins WHERE pins.owner = leases.owner)", (self._owner,))
+
+    def _renew_lease(self):
+        while not self._closed.wait(PIN_HEARTBEAT_SECONDS):
+            with self._lock, self._connect() as connection:
+                renewed = connection.execute("UPDATE leases SET expires = ? WHERE owner = ?",
+                                             (time.time() + PIN_LEASE_SECONDS, self._owner)).rowcount
+                # The lease is dropped once nothing is pinned, and the next pin starts a new heartbeat
+                if renewed == 0:
+                    self._heartbeat = None
+                    return
+
+    def close(self):
+        self._closed.set()
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM pins WHERE owner = ?", (self._owner,))
+            connection.execute("DELETE FROM leases WHERE owner = ?", (self._owner,))
+
+    @contextmanager
+    def pinned(self, files: Iterable[str | Path]):
+        files = list(files)
+        self.pin(files)
+        try:
+            yield
+        finally:
+            self.unpin(files)
+
+    @staticmethod
+    def _expire_leases(connection: sqlite3.Connection):
+        host = socket.gethostname()
+        expired = [owner for owner, lease_host, pid, expires in
+                   connection.execute("SELECT owner, host, pid, expires FROM leases").fetchall()
+                   if expires <= time.time() or (lease_host == host and not is_process_alive(pid))]
+        connection.executemany("DELETE FROM pins WHERE owner = ?", [(owner,) for owner in expired])
+        connection.executemany("DELETE FROM leases WHERE owner = ?", [(owner,) for owner in expired])
+
+    def _protected_names(self, connection: sqlite3.Connection) -> set[str]:
+        self._expire_leases(connection)
+        return {name for name, in connection.execute("SELECT DISTINCT name FROM pins WHERE count > 0").fetchall()}
+
+    def is_pinned(self, file: str | Path) -> bool:
+        with self._lock, self._connect() as connection:
+            return self._file_name(file) in self._protected_names(connection)
+
+    def enforce_budget(self) -> list[Path]:
+        if self.budget_bytes is None:
+            return []
+
+        evicted, total_size = self._evict_least_recently_used()
+        for path in evicted:
+            logger.info(f"Evicted {path} from the local store")
+        if total_size > self.budget_bytes:
+            logger.warning(f"Local store holds {total_size} bytes, over its budget of {self.budget_bytes} bytes, "
+                           f"because the remaining files are in use")
+        return evicted
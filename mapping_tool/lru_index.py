@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, closing
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+class LruIndex:
+    def __init__(self, index_path: Path, table: str, budget_bytes: Optional[int] = None):
+        self.index_path = index_path
+        self.table = table
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (name TEXT PRIMARY KEY, path TEXT NOT NULL, "
+                f"size INTEGER NOT NULL, last_access REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.index_path, timeout=30)) as connection:
+            with connection:
+                yield connection
+
+    def _record(self, name: str, path: Path):
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                f"INSERT INTO {self.table} (name, path, size, last_access) VALUES (?, ?, ?, ?) "
+                f"ON CONFLICT(name) DO UPDATE SET path=excluded.path, size=excluded.size, "
+                f"last_access=excluded.last_access",
+                (name, str(path), path.stat().st_size, time.time()))
+
+    def _lookup(self, name: str) -> Optional[Path]:
+        with self._lock, self._connect() as connection:
+            row = connection.execute(f"SELECT path FROM {self.table} WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            path = Path(row[0])
+            if not path.exists():
+                connection.execute(f"DELETE FROM {self.table} WHERE name = ?", (name,))
+                return None
+            connection.execute(f"UPDATE {self.table} SET last_access = ? WHERE name = ?", (time.time(), name))
+            return path
+
+    def total_size(self) -> int:
+        with self._connect() as connection:
+            return connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def _protected_names(self, connection: sqlite3.Connection) -> set[str]:
+        return set()
+
+    def _remove(self, path: Path):
+        path.unlink(missing_ok=True)
+
+    def _evict_least_recently_used(self, keep: Iterable[str] = ()) -> tuple[list[Path], int]:
+        evicted = []
+        with self._lock, self._connect() as connection:
+            total_size = connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total_size <= self.budget_bytes:
+                return [], total_size
+
+            protected_names = self._protected_names(connection) | set(keep)
+            least_recently_used = connection.execute(
+                f"SELECT name, path, size FROM {self.table} ORDER BY last_access").fetchall()
+            for name, path, size in least_recently_used:
+                if total_size <= self.budget_bytes:
+                    break
+                if name in protected_names:
+                    continue
+                self._remove(Path(path))
+                connection.execute(f"DELETE FROM {self.table} WHERE name = ?", (name,))
+                total_size -= size
+                evicted.append(Path(path))
+        return evicted, total_size
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from mapping_tool.lru_index import LruIndex
+
+logger = logging.getLogger(__name__)
+
+config = {
+    "MAP_CACHE_DIR": Path(os.getenv("MAPPING_TOOL_MAP_CACHE_DIR")) if os.getenv("MAPPING_TOOL_MAP_CACHE_DIR") else None,
+    "MAP_CACHE_BUDGET_BYTES": int(os.getenv("MAPPING_TOOL_MAP_CACHE_BUDGET_BYTES") or 100 * 1024 ** 3),
+}
+
+
+class MapCache(LruIndex):
+    def __init__(self, cache_dir: Path, budget_bytes: Optional[int] = None):
+        super().__init__(cache_dir / "index.sqlite", "maps", budget_bytes)
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def make_key(descriptor_string: str, start_date: datetime, end_date: datetime, input_hash: str) -> str:
+        entry = json.dumps([descriptor_string, start_date.isoformat(), end_date.isoformat(), input_hash])
+        return hashlib.sha256(entry.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self._lookup(key)
+        if path is not None:
+            logger.info(f"Map cache hit for {path.name}")
+        return path
+
+    def put(self, key: str, map_path: Path) -> Path:
+        entry_dir = self.cache_dir / key[:2] / key
+        entry_dir.mkdir(parents=True, exist_ok=True)
+        cached_path = entry_dir / map_path.name
+        # Readers only ever see complete maps because the copy is swapped in with an atomic rename
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=entry_dir, suffix=".tmp")
+        os.close(file_descriptor)
+        try:
+            shutil.copyfile(map_path, temporary_path)
+            os.replace(temporary_path, cached_path)
+        except BaseException:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+
+        self._record(key, cached_path)
+        self.enforce_budget(keep=key)
+        return cached_path
+
+    def _remove(self, path: Path):
+        shutil.rmtree(path.parent, ignore_errors=True)
+
+    def enforce_budget(self, keep: Optional[str] = None) -> list[Path]:
+        if self.budget_bytes is None:
+            return []
+
+        evicted, _ = self._evict_least_recently_used([keep] if keep is not None else [])
+        for path in evicted:
+            logger.info(f"Evicted {path.name} from the map cache")
+        return evicted
+
+
+def get_map_cache() -> Optional[MapCache]:
+    if config["MAP_CACHE_DIR"] is None:
+        return None
+    return MapCache(config["MAP_CACHE_DIR"], config["MAP_CACHE_BUDGET_BYTES"])
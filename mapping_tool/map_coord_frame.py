@@ -0,0 +1,39 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from imap_processing.ena_maps.utils.naming import MapDescriptor
+from imap_processing.spice.geometry import SpiceFrame
+
+_map_coord_frame: ContextVar[Optional[SpiceFrame]] = ContextVar("map_coord_frame", default=None)
+_install_lock = threading.Lock()
+_original_get_map_coord_frame = None
+
+
+def _get_map_coord_frame(frame_str) -> SpiceFrame:
+    frame = _map_coord_frame.get()
+    if frame is not None:
+        return frame
+    return _original_get_map_coord_frame(frame_str)
+
+
+def install_map_coord_frame_hook():
+    global _original_get_map_coord_frame
+    with _install_lock:
+        if _original_get_map_coord_frame is not None:
+            return
+        # The processors only take the frame from the descriptor string, so the lookup is replaced once with one that
+        # returns the frame set for the current thread or task, and otherwise behaves as before
+        _original_get_map_coord_frame = MapDescriptor.get_map_coord_frame
+        MapDescriptor.get_map_coord_frame = staticmethod(_get_map_coord_frame)
+
+
+@contextmanager
+def use_map_coord_frame(frame: SpiceFrame):
+    install_map_coord_frame_hook()
+    token = _map_coord_frame.set(frame)
+    try:
+        yield
+    finally:
+        _map_coord_frame.reset(token)
@@ -0,0 +1,151 @@
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import imap_data_access
+import spiceypy
+from imap_data_access.file_validation import generate_imap_file_path
+
+from mapping_tool import data_access, map_cache
+from mapping_tool.dependency_collector import DependencyCollector, MapDependencies
+from mapping_tool.dependency_manifest import DependencyManifest
+from mapping_tool.generate_map import MapNode, MapNodeKey, generate_map_node, get_map_node_key, plan_map_generation, \
+    get_map_cache_keys, find_cached_maps, copy_cached_map
+from mapping_tool.mapping_tool_descriptor import MappingToolDescriptor
+from mapping_tool.run_workspace import RunWorkspace
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WorkerSettings:
+    data_access_config: dict
+    imap_data_access_config: dict
+    log_level: int
+
+    @classmethod
+    def capture(cls) -> "WorkerSettings":
+        return cls(dict(data_access.config), dict(imap_data_access.config), logging.getLogger().getEffectiveLevel())
+
+
+def initialize_worker(settings: WorkerSettings):
+    data_access.config.update(settings.data_access_config)
+    imap_data_access.config.update(settings.imap_data_access_config)
+    logging.basicConfig(level=settings.log_level, force=True)
+    logging.captureWarnings(True)
+    spiceypy.kclear()
+
+
+@dataclass
+class MapNodeTask:
+    node: MapNode
+    input_maps: list[Path]
+    shared_data_dir: Path
+    output_dir: Path
+    query_span: Optional[tuple[datetime, datetime]]
+    replay_maps: Optional[dict[str, MapDependencies]]
+
+
+@dataclass
+class MapNodeResult:
+    path: Path
+    recorded_maps: dict[str, MapDependencies]
+
+
+def link_into_workspace(map_path: Path) -> Path:
+    # Processors look their inputs up by file name under the data directory, which is this worker's workspace
+    workspace_path = generate_imap_file_path(map_path.name).construct_path()
+    workspace_path.parent.mkdir(parents=True, exist_ok=True)
+    workspace_path.symlink_to(map_path)
+    return workspace_path
+
+
+def run_map_node_task(task: MapNodeTask) -> MapNodeResult:
+    replay = task.replay_maps is not None
+    manifest = DependencyManifest(dict(task.replay_maps) if replay else None)
+    query_span = task.query_span or (task.node.start, task.node.end)
+    with RunWorkspace(task.shared_data_dir, [task.node.descriptor.instrument.name.lower()]), \
+            DependencyCollector.use_manifest(manifest, replay=replay), \
+            DependencyCollector.span_queries(*query_span):
+        try:
+            input_maps = [link_into_workspace(input_map) for input_map in task.input_maps]
+            map_path = generate_map_node(task.node, input_maps)
+            # The workspace is removed on exit, so the map is moved to where the parent process collects it
+            output_path = task.output_dir / map_path.name
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(map_path, output_path)
+        finally:
+            # Kernels loaded for this map must not leak into the next map run by this worker
+            spiceypy.kclear()
+    return MapNodeResult(output_path, {} if replay else manifest.maps)
+
+
+def run_map_plan_in_processes(plan: dict[MapNodeKey, MapNode], targets: list[MapNodeKey],
+                              jobs: int) -> dict[MapNodeKey, Path]:
+    manifest = DependencyCollector.manifest
+    replay_maps = dict(manifest.maps) if manifest is not None and DependencyCollector.replay_manifest else None
+    shared_data_dir = data_access.get_data_dir()
+    output_dir = Path(tempfile.mkdtemp(prefix="maps-", dir=imap_data_access.config["DATA_DIR"]))
+    node_indexes = {key: i for i, key in enumerate(plan)}
+
+    def create_task(node: MapNode, results: dict[MapNodeKey, Path]) -> MapNodeTask:
+        return MapNodeTask(node, [results[dependency] for dependency in node.dependencies], shared_data_dir,
+                           output_dir / f"map-{node_indexes[node.key]}", DependencyCollector.query_span, replay_maps)
+
+    results = {}
+    cache = map_cache.get_map_cache()
+    if cache is not None:
+        cache_keys = get_map_cache_keys(plan)
+        cached_maps, plan = find_cached_maps(plan, targets, cache, cache_keys)
+        for key, cached_path in cached_maps.items():
+            print(f"Using cached map {key[0]}")
+            results[key] = copy_cached_map(cached_path, output_dir / f"cached-{node_indexes[key]}" / cached_path.name)
+
+    waiting = dict(plan)
+    running: dict[Future, MapNodeKey] = {}
+    workers = max(1, min(jobs, len(plan)))
+    print(f"Generating {len(plan)} maps in {workers} worker processes...")
+    # Spawned rather than forked workers, so none of them inherits the kernel pool, threads or open connections of
+    # this process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=initialize_worker, initargs=(WorkerSettings.capture(),)) as executor:
+        try:
+            while waiting or running:
+                # Independent maps, such as the sibling branches of an L3 map, run at the same time; a map starts
+                # as soon as every map it is built from is done
+                for key, node in list(waiting.items()):
+                    if all(dependency in results for dependency in node.dependencies):
+                        if key not in targets:
+                            print(f"Generating intermediate map {node.descriptor.to_mapping_tool_string()}")
+                        running[executor.submit(run_map_node_task, create_task(node, results))] = key
+                        del waiting[key]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    result = future.result()
+                    results[key] = result.path
+                    if cache is not None:
+                        cache.put(cache_keys[key], result.path)
+                    if manifest is not None:
+                        manifest.update(result.recorded_maps)
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    data_access.get_local_store().enforce_budget()
+    return results
+
+
+def generate_maps_in_processes(descriptor: MappingToolDescriptor, map_date_ranges: list[tuple[datetime, datetime]],
+                               jobs: int) -> list[Path]:
+    plan = plan_map_generation([(descriptor, start_date, end_date) for start_date, end_date in map_date_ranges])
+    targets = [get_map_node_key(descriptor, start_date, end_date) for start_date, end_date in map_date_ranges]
+    results = run_map_plan_in_processes(plan, targets, jobs)
+    return [results[target] for target in targets]
@@ -0,0 +1,83 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+
+from mapping_tool.configuration import DataLevel
+from mapping_tool.data_access import download_files, get_local_store
+from mapping_tool.dependency_collector import DependencyCollector
+from mapping_tool.generate_map import get_map_dependency_descriptors, get_data_level_for_descriptor
+from mapping_tool.mapping_tool_descriptor import MappingToolDescriptor
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_dependency_files(descriptor: MappingToolDescriptor, start_date: datetime, end_date: datetime) -> list[str]:
+    file_names = []
+    for map_descriptor in get_map_dependency_descriptors(descriptor):
+        data_level = get_data_level_for_descriptor(map_descriptor)
+        if data_level == DataLevel.L2:
+            dependencies = DependencyCollector.resolve_map_dependencies(map_descriptor, start_date, end_date)
+            file_names.extend([*dependencies.psets, *dependencies.ancillary_dependencies,
+                               *dependencies.spice_kernels])
+        elif data_level == DataLevel.L3:
+            dependencies = DependencyCollector.resolve_l3_map_dependencies(map_descriptor, start_date, end_date)
+            file_names.extend(dependencies.spice_kernels)
+    return list(dict.fromkeys(file_names))
+
+
+def prefetch_map_dependencies(descriptor: MappingToolDescriptor, start_date: datetime,
+                              end_date: datetime) -> list[str]:
+    file_names = resolve_dependency_files(descriptor, start_date, end_date)
+    local_store = get_local_store()
+    local_store.pin(file_names)
+    try:
+        download_files(file_names)
+    except BaseException:
+        local_store.unpin(file_names)
+        raise
+    return file_names
+
+
+class MapPrefetcher:
+    def __init__(self, descriptor: MappingToolDescriptor, map_date_ranges: list[tuple[datetime, datetime]],
+                 lookahead: int):
+        self.descriptor = descriptor
+        self.map_date_ranges = map_date_ranges
+        self.lookahead = lookahead
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") if lookahead > 0 else None
+        self._futures: dict[int, Future] = {}
+        self._pinned_files: dict[int, list[str]] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            for index, future in self._futures.items():
+                if not future.cancelled() and future.exception() is None:
+                    self._pinned_files[index] = future.result()
+            self._release_maps_before(len(self.map_date_ranges))
+
+    def _release_maps_before(self, map_index: int):
+        for index in [index for index in self._pinned_files if index < map_index]:
+            get_local_store().unpin(self._pinned_files.pop(index))
+
+    def wait_for_map(self, map_index: int):
+        if self._executor is None:
+            return
+
+        last_index = min(map_index + self.lookahead, len(self.map_date_ranges) - 1)
+        for index in range(map_index, last_index + 1):
+            if index not in self._futures:
+                start_date, end_date = self.map_date_ranges[index]
+                logger.info(f"Prefetching dependencies for map {index + 1}/{len(self.map_date_ranges)}")
+                self._futures[index] = self._executor.submit(prefetch_map_dependencies, self.descriptor,
+                                                             start_date, end_date)
+
+        self._release_maps_before(map_index)
+        try:
+            self._pinned_files[map_index] = self._futures.pop(map_index).result()
+        except Exception as e:
+            # The map resolves and downloads its own dependencies as well, which reports the failure properly
+            logger.warning(f"Prefetching dependencies for map {map_index + 1} failed: {e}")
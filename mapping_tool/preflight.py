@@ -0,0 +1,84 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from mapping_tool.configuration import DataLevel
+from mapping_tool.dependency_collector import DependencyCollector
+from mapping_tool.generate_map import get_map_dependency_descriptors, get_data_level_for_descriptor
+from mapping_tool.mapping_tool_descriptor import MappingToolDescriptor
+
+logger = logging.getLogger(__name__)
+
+PREFLIGHT_WORKERS = 16
+
+
+@dataclass
+class DependencyGap:
+    descriptor: MappingToolDescriptor
+    start_date: datetime
+    end_date: datetime
+    problem: str
+
+    def __str__(self):
+        return (f'{self.descriptor.to_mapping_tool_string()} {self.start_date.strftime("%Y-%m-%d")} to '
+                f'{self.end_date.strftime("%Y-%m-%d")}: {self.problem}')
+
+
+class PreflightError(Exception):
+    def __init__(self, gaps: list[DependencyGap]):
+        self.gaps = gaps
+        details = "\n".join(f"  {gap}" for gap in gaps)
+        super().__init__(f"Preflight check found {len(gaps)} missing dependencies, not starting the run:\n{details}")
+
+
+def find_map_dependency_problems(descriptor: MappingToolDescriptor, start_date: datetime,
+                                 end_date: datetime) -> list[str]:
+    match get_data_level_for_descriptor(descriptor):
+        case DataLevel.L2:
+            dependencies = DependencyCollector.resolve_map_dependencies(descriptor, start_date, end_date)
+            problems = []
+            if len(dependencies.psets) == 0:
+                problems.append("no pointing sets found")
+            if len(dependencies.ancillary_dependencies) == 0:
+                problems.append("no ancillary files found")
+        case DataLevel.L3:
+            dependencies = DependencyCollector.resolve_l3_map_dependencies(descriptor, start_date, end_date)
+            problems = []
+        case _:
+            return [f"cannot produce maps for instrument {descriptor.instrument.name}"]
+    if len(dependencies.spice_kernels) == 0:
+        problems.append("no SPICE kernels cover the map window")
+    return problems
+
+
+def find_dependency_gaps(descriptor: MappingToolDescriptor,
+                         map_date_ranges: list[tuple[datetime, datetime]]) -> list[DependencyGap]:
+    descriptors = list({map_descriptor.to_mapping_tool_string(): map_descriptor
+                        for map_descriptor in get_map_dependency_descriptors(descriptor)}.values())
+    checks = [(map_descriptor, start_date, end_date) for start_date, end_date in map_date_ranges
+              for map_descriptor in descriptors]
+
+    def check(map_descriptor: MappingToolDescriptor, start_date: datetime, end_date: datetime) -> list[DependencyGap]:
+        try:
+            problems = find_map_dependency_problems(map_descriptor, start_date, end_date)
+        except Exception as e:
+            problems = [f"failed to resolve dependencies: {e}"]
+        return [DependencyGap(map_descriptor, start_date, end_date, problem) for problem in problems]
+
+    logger.info(f"Preflight checking dependencies of {len(checks)} maps")
+    if not DependencyCollector.replay_manifest:
+        try:
+            # The kernels of every window are looked up in one batch, which each check below then reuses
+            DependencyCollector.collect_spice_kernels_for_windows(map_date_ranges)
+        except Exception as e:
+            logger.info(f"Batched SPICE kernel lookup failed, checking each map on its own: {e}")
+    with ThreadPoolExecutor(max_workers=max(1, min(len(checks), PREFLIGHT_WORKERS))) as executor:
+        return [gap for gaps in executor.map(lambda args: check(*args), checks) for gap in gaps]
+
+
+def run_preflight(descriptor: MappingToolDescriptor, map_date_ranges: list[tuple[datetime, datetime]]):
+    gaps = find_dependency_gaps(descriptor, map_date_ranges)
+    if gaps:
+        raise PreflightError(gaps)
+    print(f"Preflight check found dependencies for all {len(map_date_ranges)} maps")
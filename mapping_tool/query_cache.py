@@ -0,0 +1,52 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache:
+    def __init__(self, cache_dir: Path, ttls: dict[str, float]):
+        self.cache_dir = cache_dir
+        self.ttls = ttls
+
+    @staticmethod
+    def make_key(url: str, params: Optional[dict]) -> str:
+        request_description = json.dumps({"url": url, "params": params or {}}, sort_keys=True, default=str)
+        return hashlib.sha256(request_description.encode()).hexdigest()
+
+    def _entry_path(self, table: str, url: str, params: Optional[dict]) -> Path:
+        return self.cache_dir / table / f"{self.make_key(url, params)}.records.json"
+
+    def open_records(self, table: str, url: str, params: Optional[dict]) -> Optional[TextIO]:
+        entry_path = self._entry_path(table, url, params)
+        try:
+            if time.time() - entry_path.stat().st_mtime > self.ttls.get(table, 0):
+                return None
+            return open(entry_path)
+        except OSError:
+            return None
+
+    def put_records(self, table: str, url: str, params: Optional[dict], records: Iterable[dict]):
+        entry_path = self._entry_path(table, url, params)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        # Readers only ever see complete entries because the file is swapped in with an atomic rename
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=entry_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as f:
+                f.write("[")
+                for i, record in enumerate(records):
+                    if i > 0:
+                        f.write(",\n")
+                    json.dump(record, f, default=str)
+                f.write("]")
+            os.replace(temporary_path, entry_path)
+        except BaseException:
+            Path(temporary_path).unlink(missing_ok=True)
+            raise
+
@@ -0,0 +1,66 @@
+import codecs
+import json
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Optional
+
+JSON_SEPARATORS = " \t\r\n,"
+
+
+@dataclass(slots=True)
+class FileRecord:
+    file_path: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    version: Optional[str] = None
+    descriptor: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, item: dict[str, Any]) -> "FileRecord":
+        return cls(file_path=item["file_path"], start_date=item.get("start_date"), end_date=item.get("end_date"),
+                   version=item.get("version"), descriptor=item.get("descriptor"))
+
+
+@dataclass(slots=True)
+class SpiceFileRecord:
+    file_name: str
+    min_date_datetime: str
+    max_date_datetime: str
+
+    @classmethod
+    def from_json(cls, item: dict[str, Any]) -> "SpiceFileRecord":
+        return cls(file_name=item["file_name"], min_date_datetime=item["min_date_datetime"],
+                   max_date_datetime=item["max_date_datetime"])
+
+
+def iter_json_array(chunks: Iterable[str | bytes]) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    array_started = False
+    for chunk in chunks:
+        buffer = buffer[position:] + (text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+                position += 1
+            if position >= len(buffer):
+                break
+            if not array_started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array")
+                array_started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            # An item running to the end of the buffer may be cut off (e.g. a number), so wait for the next chunk
+            if end >= len(buffer):
+                break
+            yield item
+            position = end
+    raise ValueError("Incomplete JSON array")
@@ -0,0 +1,72 @@
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import imap_data_access
+
+from mapping_tool import data_access
+
+logger = logging.getLogger(__name__)
+
+INTERMEDIATE_DATA_LEVELS = ["l2", "l3"]
+SHARED_DATA_DIRS = ["ancillary", "spice"]
+
+
+class RunWorkspace:
+    def __init__(self, shared_data_dir: Path, instruments: list[str]):
+        self.shared_data_dir = shared_data_dir
+        self.instruments = instruments
+        self.path: Optional[Path] = None
+        self._previous_data_dir: Optional[Path] = None
+        self._previous_shared_data_dir: Optional[Path] = None
+
+    def __enter__(self):
+        runs_dir = self.shared_data_dir / ".mapping_tool_runs"
+        runs_dir.mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix="run-", dir=runs_dir))
+        self._link_shared_data()
+
+        self._previous_data_dir = imap_data_access.config["DATA_DIR"]
+        self._previous_shared_data_dir = data_access.config["SHARED_DATA_DIR"]
+        # Processors write their output under DATA_DIR, so intermediate maps land in the workspace, while
+        # downloads still go to the shared data directory
+        imap_data_access.config["DATA_DIR"] = self.path
+        data_access.config["SHARED_DATA_DIR"] = self.shared_data_dir
+        logger.info(f"Using run workspace {self.path}")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        imap_data_access.config["DATA_DIR"] = self._previous_data_dir
+        data_access.config["SHARED_DATA_DIR"] = self._previous_shared_data_dir
+        logger.info(f"Cleaning up {self.path}")
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _link_shared_data(self):
+        shared_imap_dir = self.shared_data_dir / "imap"
+        shared_imap_dir.mkdir(parents=True, exist_ok=True)
+        workspace_imap_dir = self.path / "imap"
+        workspace_imap_dir.mkdir()
+
+        # Shared directories are created before they are linked, so anything the processors download during the run
+        # lands in the shared data directory rather than in the workspace
+        top_level_dirs = {*SHARED_DATA_DIRS, *imap_data_access.VALID_INSTRUMENTS, *self.instruments,
+                          *_list_dirs(shared_imap_dir)}
+        for name in sorted(top_level_dirs):
+            shared_dir = shared_imap_dir / name
+            shared_dir.mkdir(exist_ok=True)
+            if name not in self.instruments:
+                (workspace_imap_dir / name).symlink_to(shared_dir, target_is_directory=True)
+                continue
+
+            # Only the intermediate levels of the instruments being mapped are kept apart from other runs
+            (workspace_imap_dir / name).mkdir()
+            levels = {*imap_data_access.VALID_DATALEVELS, *_list_dirs(shared_dir)} - set(INTERMEDIATE_DATA_LEVELS)
+            for level in sorted(levels):
+                (shared_dir / level).mkdir(exist_ok=True)
+                (workspace_imap_dir / name / level).symlink_to(shared_dir / level, target_is_directory=True)
+
+
+def _list_dirs(directory: Path) -> list[str]:
+    return [path.name for path in directory.iterdir() if path.is_dir()]
@@ -0,0 +1,86 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from mapping_tool.adaptive_limiter import AdaptiveLimiter
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_limit_grows_additively_with_successful_requests(self):
+        limiter = AdaptiveLimiter(initial_limit=2, max_limit=4)
+
+        for _ in range(3):
+            limiter.record_latency(0.1)
+        self.assertEqual(3, int(limiter.limit))
+
+        for _ in range(100):
+            limiter.record_latency(0.1)
+        self.assertEqual(4, limiter.limit)
+
+    @patch("mapping_tool.adaptive_limiter.time.monotonic")
+    def test_congestion_halves_the_limit_once_per_cooldown(self, mock_monotonic):
+        limiter = AdaptiveLimiter(initial_limit=16, max_limit=16, decrease_cooldown=1.0)
+
+        mock_monotonic.return_value = 100.0
+        with self.assertLogs("mapping_tool.adaptive_limiter", level="INFO") as log_context:
+            limiter.record_congestion("HTTP 429")
+        limiter.record_congestion("HTTP 503")
+        self.assertEqual(8, limiter.limit)
+        self.assertIn("Reduced data access concurrency limit to 8 after HTTP 429", log_context.output[0])
+
+        mock_monotonic.return_value = 101.5
+        limiter.record_congestion("HTTP 503")
+        self.assertEqual(4, limiter.limit)
+
+        for _ in range(10):
+            mock_monotonic.return_value += 2
+            limiter.record_congestion("HTTP 503")
+        self.assertEqual(1, limiter.limit)
+
+    def test_latency_spikes_count_as_congestion(self):
+        limiter = AdaptiveLimiter(initial_limit=8, max_limit=8, min_latency_samples=5, latency_spike_factor=4)
+        for _ in range(5):
+            limiter.record_latency(0.1)
+
+        limiter.record_latency(0.35)
+        self.assertEqual(8, limiter.limit)
+
+        limiter.record_latency(1.0)
+        self.assertEqual(4, limiter.limit)
+
+    def test_reports_tail_latencies_once_enough_requests_completed(self):
+        limiter = AdaptiveLimiter(initial_limit=4, min_latency_samples=10, log_interval=20)
+        self.assertIsNone(limiter.latency_percentile(95))
+
+        with self.assertLogs("mapping_tool.adaptive_limiter", level="INFO") as log_context:
+            for latency in range(1, 21):
+                limiter.record_latency(latency / 100)
+
+        self.assertAlmostEqual(0.105, limiter.latency_percentile(50))
+        self.assertAlmostEqual(0.1905, limiter.latency_percentile(95))
+        self.assertIn("latency p50 0.11s p95 0.19s", log_context.output[-1])
+
+    def test_slot_blocks_requests_beyond_the_current_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=2)
+        entered = threading.Semaphore(0)
+        release = threading.Event()
+        max_in_flight = []
+
+        def request():
+            with limiter.slot():
+                max_in_flight.append(limiter.in_flight)
+                entered.release()
+                release.wait(timeout=5)
+
+        threads = [threading.Thread(target=request) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        entered.acquire(timeout=5)
+        entered.acquire(timeout=5)
+        self.assertFalse(entered.acquire(timeout=0.2))
+
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(2, max(max_in_flight))
+        self.assertEqual(0, limiter.in_flight)
@@ -0,0 +1,180 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import imap_data_access
+import requests
+
+from mapping_tool import data_access
+from mapping_tool.caching_proxy import CachingProxy, create_server
+from mapping_tool.data_access import DataBackend, close_session, download, download_files, DownloadError, \
+    PROXY_TOKEN_HEADER
+from mapping_tool.query_records import FileRecord, SpiceFileRecord
+
+
+class RecordingBackend(DataBackend):
+    def __init__(self, files: dict[str, bytes]):
+        self.files = files
+        self.fetched = []
+        self.queries = []
+        self.raise_http_errors = False
+
+    def query(self, query_params: dict) -> list[FileRecord]:
+        self.queries.append(query_params)
+        return [FileRecord(file_path=relative_path) for relative_path in self.files]
+
+    def spice_query(self, query_params: dict) -> list[SpiceFileRecord]:
+        self.queries.append(query_params)
+        return [SpiceFileRecord(file_name="ck/kernel.ah.bc", min_date_datetime="2025-01-01, 00:00:00",
+                                max_date_datetime="2025-02-01, 00:00:00")]
+
+    def fetch(self, relative_path: str, part_path: Path):
+        self.fetched.append(relative_path)
+        if relative_path not in self.files:
+            if self.raise_http_errors:
+                # The data archive reports a missing file as an HTTP 404
+                response = requests.Response()
+                response.status_code = 404
+                raise requests.HTTPError("404 Not Found", response=response)
+            raise FileNotFoundError(relative_path)
+        part_path.write_bytes(self.files[relative_path])
+
+
+class TestCachingProxy(unittest.TestCase):
+    def setUp(self):
+        original_config = data_access.config.copy()
+        self.addCleanup(data_access.config.update, original_config)
+        original_imap_config = imap_data_access.config.copy()
+        self.addCleanup(imap_data_access.config.update, original_imap_config)
+        imap_data_access.config["API_KEY"] = None
+        imap_data_access.config["ACCESS_TOKEN"] = None
+        close_session()
+        self.addCleanup(close_session)
+
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = Path(temporary_directory.name)
+        data_access.config["QUERY_CACHE_DIR"] = self.directory / "queries"
+
+        self.pset_path = "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf"
+        self.ancillary_path = "imap/ancillary/hi/imap_hi_90sensor-cal-prod_20240101_v002.csv"
+        self.backend = RecordingBackend({self.pset_path: b"pset contents", self.ancillary_path: b"calibration"})
+        self.token = "shared token"
+        data_access.config["PROXY_TOKEN"] = self.token
+        self.headers = {PROXY_TOKEN_HEADER: self.token}
+        server = create_server(CachingProxy(self.directory / "proxy", self.backend), "127.0.0.1", 0, self.token)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.proxy_url = f"http://127.0.0.1:{server.server_port}"
+
+    def test_downloads_through_the_proxy_fetch_each_file_from_upstream_once(self):
+        data_access.config["BACKEND"] = "proxy"
+        data_access.config["PROXY_URL"] = self.proxy_url
+
+        for node in ["node_1", "node_2"]:
+            imap_data_access.config["DATA_DIR"] = self.directory / node
+            path = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+            self.assertEqual(b"pset contents", path.read_bytes())
+
+        self.assertEqual([self.pset_path], self.backend.fetched)
+        self.assertEqual(b"pset contents", (self.directory / "proxy" / self.pset_path).read_bytes())
+
+    @patch("mapping_tool.data_access.time.sleep")
+    def test_download_files_fetches_a_dependency_set_through_the_bulk_endpoint(self, mock_sleep):
+        data_access.config["BACKEND"] = "proxy"
+        data_access.config["PROXY_URL"] = self.proxy_url
+
+        # A file missing upstream is left out of the batch whether the backend reports it as missing or as a 404
+        for raise_http_errors in [False, True]:
+            with self.subTest(raise_http_errors=raise_http_errors):
+                self.backend.raise_http_errors = raise_http_errors
+                node_dir = self.directory / f"node_{raise_http_errors}"
+                imap_data_access.config["DATA_DIR"] = node_dir
+
+                with patch("mapping_tool.data_access._download_part",
+                           wraps=data_access._download_part) as download_part:
+                    with self.assertRaises(DownloadError) as context:
+                        download_files(["imap_hi_l1c_90sensor-pset_20250101_v001.cdf",
+                                        "imap_hi_90sensor-cal-prod_20240101_v002.csv",
+                                        "imap_hi_l1c_90sensor-pset_20250102_v001.cdf"])
+
+                self.assertEqual(["imap_hi_l1c_90sensor-pset_20250102_v001.cdf"], list(context.exception.failures))
+                self.assertEqual(b"pset contents", (node_dir / self.pset_path).read_bytes())
+                self.assertEqual(b"calibration", (node_dir / self.ancillary_path).read_bytes())
+                # Only the file the bulk response left out is requested on its own
+                self.assertEqual(1, download_part.call_count)
+                self.assertIn("20250102", download_part.call_args.args[0])
+                self.assertEqual([], list((node_dir / ".mapping_tool_cache" / "bulk").iterdir()))
+                mock_sleep.assert_not_called()
+
+    def test_proxy_serves_ranges_of_cached_files(self):
+        response = requests.get(f"{self.proxy_url}/download/{self.pset_path}",
+                                headers={"Range": "bytes=5-", **self.headers})
+
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(b"contents", response.content)
+        self.assertEqual("bytes 5-12/13", response.headers["Content-Range"])
+
+    def test_proxy_forwards_queries(self):
+        data_access.config["BACKEND"] = "proxy"
+        data_access.config["PROXY_URL"] = self.proxy_url
+
+        self.assertEqual([FileRecord(file_path=self.pset_path), FileRecord(file_path=self.ancillary_path)],
+                         data_access.query(instrument="hi", data_level="l1c"))
+        self.assertEqual([SpiceFileRecord(file_name="ck/kernel.ah.bc", min_date_datetime="2025-01-01, 00:00:00",
+                                          max_date_datetime="2025-02-01, 00:00:00")],
+                         data_access.spice_query(type="pointing_attitude"))
+        self.assertEqual([{"instrument": "hi", "data_level": "l1c"}, {"type": "pointing_attitude"}],
+                         self.backend.queries)
+
+    def test_proxy_reports_missing_files_and_rejects_paths_outside_the_cache(self):
+        self.assertEqual(404, requests.get(f"{self.proxy_url}/download/imap/hi/l1c/missing.cdf",
+                                           headers=self.headers).status_code)
+        self.assertEqual(400, requests.post(f"{self.proxy_url}/bulk-download", json={"paths": ["../secrets.txt"]},
+                                            headers=self.headers).status_code)
+        with self.assertRaises(ValueError):
+            CachingProxy(self.directory / "proxy", self.backend).get_file("../secrets.txt")
+
+    @patch("mapping_tool.data_access.time.sleep")
+    def test_proxy_reports_files_missing_upstream_as_not_found(self, mock_sleep):
+        self.backend.raise_http_errors = True
+        data_access.config["BACKEND"] = "proxy"
+        data_access.config["PROXY_URL"] = self.proxy_url
+        imap_data_access.config["DATA_DIR"] = self.directory / "node"
+        missing_path = "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250102_v001.cdf"
+
+        self.assertEqual(404, requests.get(f"{self.proxy_url}/download/{missing_path}",
+                                           headers=self.headers).status_code)
+        with self.assertRaises(requests.HTTPError) as context:
+            download("imap_hi_l1c_90sensor-pset_20250102_v001.cdf")
+
+        self.assertEqual(404, context.exception.response.status_code)
+        self.assertEqual([missing_path, missing_path], self.backend.fetched)
+        mock_sleep.assert_not_called()
+
+    def test_proxy_rejects_requests_without_the_shared_token(self):
+        for headers in [{}, {PROXY_TOKEN_HEADER: "wrong token"}]:
+            with self.subTest(headers=headers):
+                self.assertEqual(401, requests.get(f"{self.proxy_url}/query", headers=headers).status_code)
+                self.assertEqual(401, requests.get(f"{self.proxy_url}/spice-query", headers=headers).status_code)
+                self.assertEqual(401, requests.get(f"{self.proxy_url}/download/{self.pset_path}",
+                                                   headers=headers).status_code)
+                self.assertEqual(401, requests.post(f"{self.proxy_url}/bulk-download",
+                                                    json={"paths": [self.pset_path]}, headers=headers).status_code)
+        self.assertEqual([], self.backend.fetched)
+        self.assertEqual([], self.backend.queries)
+
+    def test_create_server_requires_a_shared_token(self):
+        with self.assertRaises(ValueError):
+            create_server(CachingProxy(self.directory / "proxy", self.backend), "127.0.0.1", 0, "")
+
+    def test_proxy_token_is_not_sent_to_other_hosts(self):
+        data_access.config["PROXY_URL"] = self.proxy_url
+
+        request = data_access.ImapAuth()(requests.Request("GET", "https://api.dev.imap-mission.com/query").prepare())
+
+        self.assertNotIn(PROXY_TOKEN_HEADER, request.headers)
+
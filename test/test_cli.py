@@ -14,22 +14,29 @@ from imap_processing.ena_maps.utils.naming import MappableInstrumentShortName
 from spacepy.pycdf import CDF
 
 import mapping_tool.cli as cli
-from mapping_tool.cli import do_mapping_tool, cleanup_l2_l3_dependencies
+from mapping_tool.cli import do_mapping_tool, RunOptions
 from mapping_tool.configuration import TimeRange
-from mapping_tool.mapping_tool_descriptor import MappingToolDescriptor
+from mapping_tool.dependency_collector import DependencyCollector, MapDependencies
+from mapping_tool.dependency_manifest import DependencyManifest
+from mapping_tool.preflight import DependencyGap, PreflightError
 from test.test_builders import create_map_descriptor, create_configuration, create_canonical_map_period
 from test.test_helpers import run_periodically, get_example_config_path, get_test_cdf_file_path, utcdatetime
 
 
 class TestCli(unittest.TestCase):
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        data_dir_patch = patch.dict(imap_data_access.config, {"DATA_DIR": Path(data_dir.name)})
+        data_dir_patch.start()
+        self.addCleanup(data_dir_patch.stop)
 
     @patch('mapping_tool.cli.print')
     @patch('mapping_tool.cli.CDF')
-    @patch('mapping_tool.cli.shutil.copy')
     @patch('mapping_tool.cli.generate_map')
-    @patch('mapping_tool.cli.cleanup_l2_l3_dependencies')
+    @patch('mapping_tool.cli.RunWorkspace')
     @patch('mapping_tool.cli.sort_cdfs_by_epoch')
-    def test_do_mapping_tool(self, mock_sort_cdfs_by_epoch, mock_cleanup, mock_generate_map, mock_copy_file, mock_cdf, mock_print):
+    def test_do_mapping_tool(self, mock_sort_cdfs_by_epoch, mock_run_workspace, mock_generate_map, mock_cdf, mock_print):
         self.assertTrue(hasattr(cli, "logger"))
         cli.logger.info = Mock()
 
@@ -108,7 +115,8 @@ class TestCli(unittest.TestCase):
         self.assertEqual('L3_h90-enaTEST-h-sf-sp-ram-hae-2deg-6mo-mapper>other_stuff',
                          mock_cdf_file_1.attrs["Data_type"])
 
-        mock_cleanup.assert_called_once_with(hi_descriptor)
+        mock_run_workspace.assert_called_once_with(imap_data_access.config["DATA_DIR"], ["hi"])
+        mock_run_workspace.return_value.__exit__.assert_called_once()
         mock_print.assert_has_calls([
             call(f"Created file {output_map_path}")
         ])
@@ -190,12 +198,11 @@ class TestCli(unittest.TestCase):
 
 
     @patch('mapping_tool.cli.CDF')
-    @patch('mapping_tool.cli.shutil.copy')
-    @patch('mapping_tool.cli.cleanup_l2_l3_dependencies')
+    @patch('mapping_tool.cli.RunWorkspace')
     @patch('mapping_tool.cli.generate_map')
     @patch('mapping_tool.cli.sort_cdfs_by_epoch')
-    def test_generate_maps_raises_exception_when_one_map_fails(self, mock_sort_cdfs_by_epoch, mock_generate_map, mock_cleanup_l2_l3_dependencies,
-                                                       _mock_copy, _mock_cdf):
+    def test_generate_maps_raises_exception_when_one_map_fails(self, mock_sort_cdfs_by_epoch, mock_generate_map, mock_run_workspace,
+                                                       _mock_cdf):
         config = create_configuration(canonical_map_period=create_canonical_map_period(number_of_maps=3))
 
         mock_generate_map.side_effect = [Path('path/to/imap_l3_hi_h90-enaCUSTOM-h-sf-nsp-ram-eclipj2000-4deg-6mo'),
@@ -207,59 +214,7 @@ class TestCli(unittest.TestCase):
         self.assertIn("Failed to generate map:", log_message )
         self.assertIn("Expected failure generating map", log_message )
 
-        map_descriptor = MappingToolDescriptor.from_string("h90-ena-h-sf-nsp-ram-eclipj2000-4deg-6mo")
-
-
-        mock_cleanup_l2_l3_dependencies.assert_called_once_with(map_descriptor)
-
-    def test_cleanup_dependencies(self):
-        for one_of_the_deps_failed_to_generate in [True, False]:
-            with self.subTest(f"One of the dependencies failed to generate: {one_of_the_deps_failed_to_generate}"):
-                original_imap_data_dir = imap_data_access.config["DATA_DIR"]
-                try:
-                    with tempfile.TemporaryDirectory() as tmpdir:
-                        test_deletes_stuff_here = Path(tmpdir)
-                        imap_data_access.config["DATA_DIR"] = test_deletes_stuff_here
-
-                        descriptor = MappingToolDescriptor.from_string("h90-ena-h-sf-sp-full-custom-4deg-6mo")
-
-                        l1c_dir = test_deletes_stuff_here / "imap/hi/l1c/2025/06"
-                        l2_imap_data_folder_path = test_deletes_stuff_here / "imap/hi/l2/2025/06/"
-                        l3_imap_data_folder_path = test_deletes_stuff_here / "imap/hi/l3/2025/06/"
-                        lo_l2_dir = test_deletes_stuff_here / "imap/lo/l2"
-                        l1c_dir.mkdir(parents=True)
-                        l2_imap_data_folder_path.mkdir(parents=True)
-                        lo_l2_dir.mkdir(parents=True)
-
-                        l3 = l3_imap_data_folder_path / "imap_hi_l3_h90-ena-h-sf-sp-full-custom-4deg-6mo_20250606_v000.cdf"
-                        l2_ram = l2_imap_data_folder_path / "imap_hi_l2_h90-ena-h-sf-nsp-ram-custom-4deg-6mo_20250606_v000.cdf"
-                        l2_anti = l2_imap_data_folder_path / "imap_hi_l2_h90-ena-h-sf-nsp-anti-custom-4deg-6mo_20250606_v000.cdf"
-                        l1c = l1c_dir / "imap_hi_l1c_pset_20250606_v000.cdf"
-
-                        if not one_of_the_deps_failed_to_generate:
-                            l3_imap_data_folder_path.mkdir(parents=True)
-                            l3.touch()
-
-                        l2_ram.touch()
-                        l2_anti.touch()
-                        l1c.touch()
-
-                        cleanup_l2_l3_dependencies(descriptor)
-
-                        data_folder = test_deletes_stuff_here / "imap"
-                        expected_folder_structure = {
-                            data_folder / "hi",
-                            data_folder / "lo",
-                            data_folder / "hi/l1c",
-                            data_folder / "lo/l2",
-                            data_folder / "hi/l1c/2025",
-                            data_folder / "hi/l1c/2025/06",
-                            data_folder / "hi/l1c/2025/06/imap_hi_l1c_pset_20250606_v000.cdf",
-                        }
-
-                        self.assertEqual(expected_folder_structure, set(data_folder.rglob("*")))
-                finally:
-                    imap_data_access.config["DATA_DIR"] = original_imap_data_dir
+        mock_run_workspace.return_value.__exit__.assert_called_once()
 
     @patch("mapping_tool.cli.generate_map")
     def test_tool_does_not_generate_map_if_file_already_exists(self, mock_generate_map):
@@ -276,9 +231,10 @@ class TestCli(unittest.TestCase):
 
     @patch("mapping_tool.cli.generate_map")
     @patch("mapping_tool.cli.save_output_cdf")
-    @patch("mapping_tool.cli.cleanup_l2_l3_dependencies")
+    @patch("mapping_tool.cli.RunWorkspace")
     @patch("mapping_tool.cli.CDF")
-    def test_cleanup_is_called_after_exception_on_save(self, mock_cdf, mock_cleanup, mock_save_output_cdf, mock_generate_map):
+    def test_workspace_is_cleaned_up_after_exception_on_save(self, mock_cdf, mock_run_workspace, mock_save_output_cdf,
+                                                             mock_generate_map):
         config = create_configuration()
 
         mock_generate_map.return_value = Path("")
@@ -287,4 +243,106 @@ class TestCli(unittest.TestCase):
         with self.assertLogs(cli.logger, logging.ERROR) as log_context:
             do_mapping_tool(config)
 
-        mock_cleanup.assert_called_once_with(config.get_map_descriptor())
+        mock_run_workspace.return_value.__exit__.assert_called_once()
+
+    @patch("mapping_tool.cli.generate_map")
+    @patch("mapping_tool.cli.sort_cdfs_by_epoch")
+    @patch("mapping_tool.cli.save_output_cdf")
+    @patch("mapping_tool.cli.RunWorkspace")
+    def test_do_mapping_tool_writes_dependency_manifest_next_to_output(self, mock_run_workspace, mock_save_output_cdf,
+                                                                       mock_sort_cdfs_by_epoch, mock_generate_map):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            config = create_configuration(output_directory=Path(tmpdir))
+            dependencies = MapDependencies(psets=["imap_hi_l1c_90sensor-pset_20250101_v001.cdf"],
+                                           ancillary_dependencies=[], spice_kernels=["naif0012.tls"])
+
+            def record_dependencies(descriptor, start_date, end_date):
+                DependencyCollector.manifest.record(descriptor, start_date, end_date, dependencies)
+                return Path("map.cdf")
+
+            mock_generate_map.side_effect = record_dependencies
+
+            output_path = do_mapping_tool(config, RunOptions(write_manifest=True))
+
+            manifest = DependencyManifest.from_file(output_path.with_suffix(".manifest.json"))
+            start_date, end_date = config.get_map_date_ranges()[0]
+            self.assertEqual(dependencies, manifest.lookup(config.get_map_descriptor(), start_date, end_date))
+
+
+    @patch("mapping_tool.cli.generate_map")
+    @patch("mapping_tool.cli.generate_maps_in_processes")
+    def test_generate_maps_uses_worker_processes_when_more_than_one_job_is_requested(
+            self, mock_generate_maps_in_processes, mock_generate_map):
+        descriptor = create_map_descriptor()
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 4, 1)), (datetime(2025, 4, 1), datetime(2025, 7, 1))]
+
+        self.assertEqual(mock_generate_maps_in_processes.return_value,
+                         cli.generate_maps(descriptor, map_date_ranges, jobs=4))
+
+        mock_generate_maps_in_processes.assert_called_once_with(descriptor, map_date_ranges, 4)
+        mock_generate_map.assert_not_called()
+
+    @patch("mapping_tool.cli.print")
+    @patch("mapping_tool.cli.generate_map")
+    @patch("mapping_tool.cli.RunWorkspace")
+    @patch("mapping_tool.preflight.find_dependency_gaps")
+    def test_preflight_refuses_to_start_a_run_with_missing_dependencies(self, mock_find_dependency_gaps,
+                                                                        mock_run_workspace, mock_generate_map,
+                                                                        mock_print):
+        config = create_configuration()
+        start_date, end_date = config.get_map_date_ranges()[0]
+        gap = DependencyGap(config.get_map_descriptor(), start_date, end_date, "no pointing sets found")
+        mock_find_dependency_gaps.return_value = [gap]
+
+        self.assertIsNone(do_mapping_tool(config, RunOptions(preflight=True)))
+
+        mock_find_dependency_gaps.assert_called_once_with(config.get_map_descriptor(), config.get_map_date_ranges())
+        mock_generate_map.assert_not_called()
+        printed_error = mock_print.call_args.args[0]
+        self.assertIsInstance(printed_error, PreflightError)
+        self.assertIn(str(gap), str(printed_error))
+
+    @patch("mapping_tool.cli.print")
+    @patch("mapping_tool.cli.get_local_store")
+    @patch("mapping_tool.cli.download_files")
+    @patch("mapping_tool.cli.resolve_dependency_files")
+    def test_stage_in_dependencies_downloads_every_dependency_once_and_writes_manifests(
+            self, mock_resolve_dependency_files, mock_download_files, mock_get_local_store, mock_print):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            data_dir_patch = patch.dict(imap_data_access.config, {"DATA_DIR": Path(tmpdir) / "data"})
+            data_dir_patch.start()
+            self.addCleanup(data_dir_patch.stop)
+            first_config = create_configuration(output_directory=Path(tmpdir) / "first")
+            second_config = create_configuration(output_directory=Path(tmpdir) / "second", instrument="Hi 45")
+            existing_pset = Path(tmpdir) / "data/imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf"
+            existing_pset.parent.mkdir(parents=True)
+            existing_pset.write_bytes(b"x" * 10)
+            new_pset = Path(tmpdir) / "data/imap/hi/l1c/2025/01/imap_hi_l1c_45sensor-pset_20250101_v001.cdf"
+
+            def resolve(descriptor, start_date, end_date):
+                DependencyCollector.manifest.record(descriptor, start_date, end_date, MapDependencies(
+                    psets=[existing_pset.name], ancillary_dependencies=[], spice_kernels=[]))
+                return [existing_pset.name, f"imap_hi_l1c_{descriptor.sensor}sensor-pset_20250101_v001.cdf"]
+
+            def download(file_names, progress_label):
+                new_pset.write_bytes(b"x" * 25)
+                return [existing_pset, new_pset]
+
+            mock_resolve_dependency_files.side_effect = resolve
+            mock_download_files.side_effect = download
+
+            summary = cli.stage_in_dependencies([first_config, second_config])
+
+            mock_download_files.assert_called_once_with([existing_pset.name, new_pset.name],
+                                                        progress_label="dependencies")
+            mock_get_local_store.return_value.pinned.assert_called_once_with([existing_pset.name, new_pset.name])
+            self.assertEqual(cli.StageInSummary(file_count=2, total_bytes=35, downloaded_count=1,
+                                                downloaded_bytes=25), summary)
+
+            for config in [first_config, second_config]:
+                start_date, end_date = config.get_map_date_ranges()[0]
+                output_filename = cli.get_output_filename(config.get_map_descriptor(), start_date)
+                manifest_path = config.output_directory / output_filename.replace(".cdf", ".manifest.json")
+                manifest = DependencyManifest.from_file(manifest_path)
+                self.assertEqual([existing_pset.name],
+                                 manifest.lookup(config.get_map_descriptor(), start_date, end_date).psets)
@@ -0,0 +1,484 @@
+import hashlib
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch, call, Mock, MagicMock
+
+import imap_data_access
+import requests
+
+from mapping_tool import data_access
+from mapping_tool.data_access import download_files, DownloadError, get_session, close_session, query, download, \
+    get_local_store, get_local_path, fetch_file
+from mapping_tool.query_records import FileRecord
+
+
+def create_download_response(content: bytes, status_code: int = 200, headers: dict = None,
+                             fail_after: int = None) -> Mock:
+    def iter_content(chunk_size):
+        if fail_after is not None:
+            yield content[:fail_after]
+            raise requests.exceptions.ChunkedEncodingError("connection broken")
+        yield content
+
+    response = Mock(status_code=status_code, headers=headers or {})
+    response.iter_content.side_effect = iter_content
+    return response
+
+
+def create_query_response(items: list[dict], chunk_size: int = 7) -> MagicMock:
+    body = json.dumps(items).encode()
+    response = MagicMock(status_code=200)
+    response.__enter__.return_value = response
+    # Small chunks split the JSON mid-record, as a streamed response would
+    response.iter_content.side_effect = lambda **kwargs: (body[start:start + chunk_size]
+                                                           for start in range(0, len(body), chunk_size))
+    return response
+
+
+class TestDataAccess(unittest.TestCase):
+    def setUp(self):
+        original_config = data_access.config.copy()
+        self.addCleanup(data_access.config.update, original_config)
+        original_imap_config = imap_data_access.config.copy()
+        self.addCleanup(imap_data_access.config.update, original_imap_config)
+        imap_data_access.config["API_KEY"] = None
+        imap_data_access.config["ACCESS_TOKEN"] = None
+        close_session()
+        self.addCleanup(close_session)
+        query_cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(query_cache_dir.cleanup)
+        data_access.config["QUERY_CACHE_DIR"] = Path(query_cache_dir.name)
+
+    def test_get_session_returns_one_shared_pooled_session(self):
+        data_access.config["HTTP_POOL_SIZE"] = 4
+
+        session = get_session()
+
+        self.assertIs(session, get_session())
+        adapter = session.get_adapter("https://api.imap-mission.com")
+        self.assertEqual(4, adapter._pool_maxsize)
+
+    def test_session_authenticates_with_the_current_access_token(self):
+        imap_data_access.config["ACCESS_TOKEN"] = "first-token"
+        request = get_session().prepare_request(requests.Request("GET", "https://example.com/query"))
+        self.assertEqual("Bearer first-token", request.headers["Authorization"])
+
+        imap_data_access.config["ACCESS_TOKEN"] = "second-token"
+        request = get_session().prepare_request(requests.Request("GET", "https://example.com/query"))
+        self.assertEqual("Bearer second-token", request.headers["Authorization"])
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_query_uses_the_shared_session(self, mock_get_session):
+        data_access.config["HTTP_CONNECT_TIMEOUT"] = 1
+        data_access.config["HTTP_READ_TIMEOUT"] = 2
+        imap_data_access.config["DATA_ACCESS_URL"] = "https://expected-url"
+        imap_data_access.config["ACCESS_TOKEN"] = "token"
+        mock_get_session.return_value.get.return_value = create_query_response(
+            [{"file_path": "file", "start_date": "20250101", "version": "v001", "instrument": "hi"}])
+
+        result = query(instrument="hi", data_level="l1c")
+
+        mock_get_session.return_value.get.assert_called_once_with(
+            "https://expected-url/authorized/query", params={"instrument": "hi", "data_level": "l1c"}, timeout=(1, 2),
+            stream=True)
+        mock_get_session.return_value.get.return_value.raise_for_status.assert_called_once()
+        self.assertEqual([FileRecord(file_path="file", start_date="20250101", version="v001")], result)
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_query_responses_are_cached_until_refresh_is_requested(self, mock_get_session):
+        imap_data_access.config["DATA_ACCESS_URL"] = "https://expected-url"
+        mock_get_session.return_value.get.side_effect = [create_query_response([{"file_path": "first"}]),
+                                                         create_query_response([{"file_path": "second"}])]
+
+        first_result = query(table="ancillary", instrument="hi")
+        with self.assertLogs(data_access.logger, "INFO") as log_context:
+            cached_result = query(table="ancillary", instrument="hi")
+        self.assertIn("Query cache hit for https://expected-url/query", log_context.output[-1])
+
+        data_access.config["REFRESH_QUERY_CACHE"] = True
+        refreshed_result = query(table="ancillary", instrument="hi")
+        data_access.config["REFRESH_QUERY_CACHE"] = False
+        result_after_refresh = query(table="ancillary", instrument="hi")
+
+        self.assertEqual([FileRecord(file_path="first")], first_result)
+        self.assertEqual([FileRecord(file_path="first")], cached_result)
+        self.assertEqual([FileRecord(file_path="second")], refreshed_result)
+        self.assertEqual([FileRecord(file_path="second")], result_after_refresh)
+        self.assertEqual(2, mock_get_session.return_value.get.call_count)
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_unreadable_query_cache_entries_are_queried_again(self, mock_get_session):
+        imap_data_access.config["DATA_ACCESS_URL"] = "https://expected-url"
+        mock_get_session.return_value.get.side_effect = [create_query_response([{"file_path": "first"}]),
+                                                         create_query_response([{"file_path": "second"}])]
+        query(table="ancillary", instrument="hi")
+        next(data_access.config["QUERY_CACHE_DIR"].glob("ancillary/*.json")).write_text('[{"file_path": ')
+
+        self.assertEqual([FileRecord(file_path="second")], query(table="ancillary", instrument="hi"))
+        self.assertEqual(2, mock_get_session.return_value.get.call_count)
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_writes_file_into_the_data_dir_and_skips_existing_files(self, mock_get_session):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            imap_data_access.config["DATA_ACCESS_URL"] = "https://expected-url"
+            mock_get_session.return_value.get.return_value = create_download_response(b"pset contents")
+
+            path = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+            path_again = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+
+            expected_path = Path(tmpdir) / "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf"
+            self.assertEqual(expected_path, path)
+            self.assertEqual(expected_path, path_again)
+            self.assertEqual(b"pset contents", path.read_bytes())
+            mock_get_session.return_value.get.assert_called_once()
+            self.assertEqual("https://expected-url/download/imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf",
+                             mock_get_session.return_value.get.call_args.args[0])
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_keeps_the_local_store_under_its_budget(self, mock_get_session):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            data_access.config["LOCAL_STORE_BUDGET_BYTES"] = 15
+            mock_get_session.return_value.get.return_value = create_download_response(b"x" * 10)
+
+            first_path = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+            with get_local_store().pinned([first_path]):
+                with self.assertLogs("mapping_tool.local_store", level="WARNING"):
+                    second_path = download("imap_hi_l1c_90sensor-pset_20250102_v001.cdf")
+                self.assertTrue(first_path.exists())
+                self.assertTrue(second_path.exists())
+
+            third_path = download("imap_hi_l1c_90sensor-pset_20250103_v001.cdf")
+            self.assertFalse(first_path.exists())
+            self.assertFalse(second_path.exists())
+            self.assertTrue(third_path.exists())
+            self.assertEqual(10, get_local_store().total_size())
+
+    @patch('mapping_tool.data_access.time.sleep')
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_resumes_an_interrupted_transfer_with_a_range_request(self, mock_get_session, mock_sleep):
+        content = b"0123456789"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            mock_get_session.return_value.get.side_effect = [
+                create_download_response(content, headers={"Content-Length": "10"}, fail_after=4),
+                create_download_response(content[4:], status_code=206,
+                                         headers={"Content-Range": "bytes 4-9/10",
+                                                  "ETag": f'"{hashlib.md5(content).hexdigest()}"'}),
+            ]
+
+            with self.assertLogs("mapping_tool.data_access", level="INFO") as log_context:
+                path = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+
+            self.assertEqual(content, path.read_bytes())
+            self.assertFalse(path.with_name(path.name + ".part").exists())
+            first_call, second_call = mock_get_session.return_value.get.call_args_list
+            self.assertEqual({}, first_call.kwargs["headers"])
+            self.assertEqual({"Range": "bytes=4-"}, second_call.kwargs["headers"])
+            self.assertTrue(second_call.kwargs["stream"])
+            mock_sleep.assert_called_once()
+            self.assertTrue(any("10 bytes in" in message and "bytes/s" in message
+                                for message in log_context.output))
+
+    @patch('mapping_tool.data_access.time.sleep')
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_starts_over_when_the_checksum_does_not_match(self, mock_get_session, mock_sleep):
+        content = b"pset contents"
+        etag = {"ETag": f'"{hashlib.md5(content).hexdigest()}"'}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            mock_get_session.return_value.get.side_effect = [
+                create_download_response(b"pset c0ntents", headers=etag),
+                create_download_response(content, headers=etag),
+            ]
+
+            path = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+
+            self.assertEqual(content, path.read_bytes())
+            self.assertEqual({}, mock_get_session.return_value.get.call_args_list[1].kwargs["headers"])
+
+    @patch('mapping_tool.data_access.time.sleep')
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_gives_up_after_the_configured_attempts_and_keeps_the_partial_file(self, mock_get_session,
+                                                                                        mock_sleep):
+        data_access.config["DOWNLOAD_ATTEMPTS"] = 2
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            mock_get_session.return_value.get.side_effect = [
+                create_download_response(b"0123456789", headers={"Content-Length": "10"}, fail_after=2),
+                requests.ConnectionError("connection reset"),
+            ]
+
+            with self.assertRaises(requests.ConnectionError):
+                download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+
+            part_path = Path(tmpdir) / "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf.part"
+            self.assertEqual(b"01", part_path.read_bytes())
+            self.assertEqual(2, mock_get_session.return_value.get.call_count)
+
+    @patch('mapping_tool.data_access.time.sleep')
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_does_not_retry_client_errors(self, mock_get_session, mock_sleep):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            not_found = requests.HTTPError("404 Not Found", response=Mock(status_code=404))
+            mock_get_session.return_value.get.return_value.raise_for_status.side_effect = not_found
+
+            with self.assertRaises(requests.HTTPError):
+                download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+
+            mock_get_session.return_value.get.assert_called_once()
+            mock_sleep.assert_not_called()
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_waits_for_another_process_downloading_the_same_file(self, mock_get_session):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            destination = get_local_path("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+            destination.parent.mkdir(parents=True)
+            paths = []
+
+            # A separate open of the lock file holds the lock the way another process would
+            with open(destination.with_name(destination.name + ".lock"), "a+b") as lock_file:
+                data_access._lock_file(lock_file)
+                downloading = threading.Thread(target=lambda: paths.append(download(destination.name)))
+                downloading.start()
+                downloading.join(timeout=0.2)
+                self.assertTrue(downloading.is_alive())
+                destination.write_bytes(b"pset contents")
+            downloading.join(timeout=5)
+
+            self.assertEqual([destination], paths)
+            mock_get_session.assert_not_called()
+
+    def test_fetch_file_uses_a_destination_that_appeared_while_downloading(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            destination = Path(tmpdir) / "imap_hi_l1c_90sensor-pset_20250101_v001.cdf"
+            part_path = destination.with_name(destination.name + ".part")
+
+            def fetch(relative_path, path):
+                path.write_bytes(b"pset")
+                destination.write_bytes(b"pset contents")
+                raise FileNotFoundError(path)
+
+            backend = Mock()
+            backend.fetch.side_effect = fetch
+
+            fetch_file(backend, "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf", destination)
+
+            self.assertEqual(b"pset contents", destination.read_bytes())
+            self.assertFalse(part_path.exists())
+            backend.fetch.assert_called_once()
+
+    def test_mirror_backend_answers_queries_from_file_names_and_serves_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mirror_dir = Path(tmpdir) / "mirror"
+            mirrored_files = [
+                "imap/hi/l1c/2024/12/imap_hi_l1c_90sensor-pset_20241231_v001.cdf",
+                "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf",
+                "imap/hi/l1c/2025/01/imap_hi_l1c_45sensor-pset_20250101_v001.cdf",
+                "imap/ancillary/hi/imap_hi_90sensor-cal-prod_20240101_v002.csv",
+            ]
+            for mirrored_file in mirrored_files:
+                (mirror_dir / mirrored_file).parent.mkdir(parents=True, exist_ok=True)
+                (mirror_dir / mirrored_file).write_bytes(b"contents")
+            data_access.config["BACKEND"] = "mirror"
+            data_access.config["MIRROR_DIR"] = mirror_dir
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir) / "data"
+
+            psets = query(instrument="hi", data_level="l1c", descriptor="90sensor-pset", start_date="20250101",
+                          end_date="20250201")
+            ancillaries = query(table="ancillary", instrument="hi")
+
+            self.assertEqual([FileRecord(file_path=mirrored_files[1], start_date="20250101", version="v001",
+                                         descriptor="90sensor-pset")], psets)
+            self.assertEqual([mirrored_files[3]], [ancillary.file_path for ancillary in ancillaries])
+            self.assertEqual("20240101", ancillaries[0].start_date)
+
+            path = download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf")
+            self.assertEqual(Path(tmpdir) / "data" / mirrored_files[1], path)
+            self.assertEqual(b"contents", path.read_bytes())
+            with self.assertRaises(FileNotFoundError):
+                download("imap_hi_l1c_90sensor-pset_20250102_v001.cdf")
+
+    def test_download_files_fetches_missing_files_in_bulk_batches_and_falls_back_to_single_downloads(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            mirror_dir = Path(tmpdir) / "mirror"
+            file_names = [f"imap_hi_l1c_90sensor-pset_202501{day:02}_v001.cdf" for day in range(1, 6)]
+            for file_name in file_names:
+                mirrored_path = mirror_dir / "imap/hi/l1c/2025/01" / file_name
+                mirrored_path.parent.mkdir(parents=True, exist_ok=True)
+                mirrored_path.write_bytes(file_name.encode())
+            data_access.config["BACKEND"] = "mirror"
+            data_access.config["MIRROR_DIR"] = mirror_dir
+            data_access.config["BULK_DOWNLOAD_BATCH_SIZE"] = 2
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir) / "data"
+            get_local_path(file_names[0]).parent.mkdir(parents=True)
+            get_local_path(file_names[0]).write_bytes(b"already present")
+
+            original_fetch_bulk = data_access.MirrorBackend.fetch_bulk
+            original_fetch = data_access.MirrorBackend.fetch
+            batches = []
+            single_downloads = []
+
+            def fetch_bulk(backend, relative_paths, staging_dir):
+                batches.append([Path(relative_path).name for relative_path in relative_paths])
+                if file_names[4] in batches[-1]:
+                    raise requests.ConnectionError("bulk endpoint unavailable")
+                return original_fetch_bulk(backend, relative_paths, staging_dir)
+
+            def fetch(backend, relative_path, part_path):
+                single_downloads.append(Path(relative_path).name)
+                original_fetch(backend, relative_path, part_path)
+
+            with patch.object(data_access.MirrorBackend, "fetch_bulk", autospec=True, side_effect=fetch_bulk), \
+                    patch.object(data_access.MirrorBackend, "fetch", autospec=True, side_effect=fetch):
+                paths = download_files(file_names)
+
+            self.assertCountEqual([file_names[1:3], file_names[3:5]], batches)
+            self.assertEqual([get_local_path(file_name) for file_name in file_names], paths)
+            self.assertEqual(b"already present", paths[0].read_bytes())
+            self.assertEqual([file_name.encode() for file_name in file_names[1:]],
+                             [path.read_bytes() for path in paths[1:]])
+            self.assertCountEqual(file_names[3:5], single_downloads)
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_get_backs_off_when_the_server_throttles(self, mock_get_session):
+        data_access.config["INITIAL_CONCURRENCY"] = 8
+        throttled = Mock(status_code=429)
+        throttled.raise_for_status.side_effect = requests.HTTPError("429 Too Many Requests", response=throttled)
+        mock_get_session.return_value.get.return_value = throttled
+
+        with self.assertRaises(requests.HTTPError):
+            data_access.get("https://example.com/query")
+
+        self.assertEqual(4, data_access.get_limiter().limit)
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_streamed_responses_count_against_the_limit_until_they_are_closed(self, mock_get_session):
+        limiter = data_access.get_limiter()
+        close = mock_get_session.return_value.get.return_value.close
+
+        data_access.get("https://example.com/query")
+        self.assertEqual(0, limiter.in_flight)
+
+        response = data_access.get("https://example.com/download/file.cdf", stream=True)
+        self.assertEqual(1, limiter.in_flight)
+
+        response.close()
+        response.close()
+        self.assertEqual(0, limiter.in_flight)
+        self.assertEqual(2, close.call_count)
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_get_records_sends_a_hedged_request_when_the_first_is_in_the_slow_tail(self, mock_get_session):
+        data_access.config["HEDGE_REQUESTS"] = True
+        limiter = data_access.get_limiter()
+        for _ in range(limiter.min_latency_samples):
+            limiter.record_latency(0.01)
+        slow_request_release = threading.Event()
+        self.addCleanup(slow_request_release.set)
+        slow_response = create_query_response([{"file_path": "slow"}])
+        slow_response_closed = threading.Event()
+        slow_response.close.side_effect = slow_response_closed.set
+
+        def respond(url, params, timeout, stream):
+            if mock_get_session.return_value.get.call_count == 1:
+                slow_request_release.wait(timeout=5)
+                return slow_response
+            return create_query_response([{"file_path": "hedged"}])
+
+        mock_get_session.return_value.get.side_effect = respond
+
+        with self.assertLogs("mapping_tool.data_access", level="INFO") as log_context:
+            records = data_access.get_records("https://example.com/query", {"instrument": "hi"}, "science",
+                                              FileRecord)
+
+        self.assertEqual([FileRecord(file_path="hedged")], records)
+        self.assertEqual(2, mock_get_session.return_value.get.call_count)
+        self.assertTrue(any("Sending a hedged request" in message for message in log_context.output))
+        # The losing response is closed once it arrives, returning its connection to the pool
+        slow_request_release.set()
+        self.assertTrue(slow_response_closed.wait(timeout=5))
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_get_records_does_not_hedge_unless_enabled(self, mock_get_session):
+        limiter = data_access.get_limiter()
+        for _ in range(limiter.min_latency_samples):
+            limiter.record_latency(0.01)
+        mock_get_session.return_value.get.return_value = create_query_response([{"file_path": "response"}])
+
+        self.assertEqual([FileRecord(file_path="response")],
+                         data_access.get_records("https://example.com/query", {"instrument": "lo"}, "science",
+                                                 FileRecord))
+        mock_get_session.return_value.get.assert_called_once()
+
+    @patch('mapping_tool.data_access.print')
+    @patch('mapping_tool.data_access.download')
+    def test_download_files_returns_paths_in_request_order(self, mock_download, mock_print):
+        mock_download.side_effect = lambda file_name: Path("data") / file_name
+
+        paths = download_files(["pset_1.cdf", "pset_2.cdf", "ancillary.csv"], progress_label="dependencies")
+
+        self.assertEqual([Path("data/pset_1.cdf"), Path("data/pset_2.cdf"), Path("data/ancillary.csv")], paths)
+        mock_download.assert_has_calls([call("pset_1.cdf"), call("pset_2.cdf"), call("ancillary.csv")],
+                                       any_order=True)
+        mock_print.assert_has_calls([
+            call("\rDownloading dependencies 1/3... ", end=""),
+            call("\rDownloading dependencies 2/3... ", end=""),
+            call("\rDownloading dependencies 3/3... ", end=""),
+        ])
+
+    @patch('mapping_tool.data_access.download')
+    def test_download_files_runs_up_to_the_configured_number_of_downloads_at_once(self, mock_download):
+        data_access.config["MAX_CONCURRENT_DOWNLOADS"] = 3
+        barrier = threading.Barrier(3, timeout=5)
+
+        def wait_for_other_downloads(file_name):
+            barrier.wait()
+            return Path(file_name)
+
+        mock_download.side_effect = wait_for_other_downloads
+
+        paths = download_files(["a.cdf", "b.cdf", "c.cdf"])
+
+        self.assertEqual([Path("a.cdf"), Path("b.cdf"), Path("c.cdf")], paths)
+
+    @patch('mapping_tool.data_access.download')
+    def test_download_files_reports_every_failed_file(self, mock_download):
+        errors = {"b.cdf": ValueError("404 Not Found"), "c.cdf": ConnectionError("connection reset")}
+
+        def fail_some(file_name):
+            if file_name in errors:
+                raise errors[file_name]
+            return Path(file_name)
+
+        mock_download.side_effect = fail_some
+
+        with self.assertLogs(data_access.logger) as log_context:
+            with self.assertRaises(DownloadError) as exception_context:
+                download_files(["a.cdf", "b.cdf", "c.cdf"])
+
+        self.assertEqual(errors, exception_context.exception.failures)
+        self.assertIn("b.cdf: 404 Not Found", str(exception_context.exception))
+        self.assertIn("c.cdf: connection reset", str(exception_context.exception))
+        self.assertEqual(2, len(log_context.output))
+
+    @patch('mapping_tool.data_access.get_session')
+    def test_download_raises_error_instead_of_downloading_when_offline(self, mock_get_session):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imap_data_access.config["DATA_DIR"] = Path(tmpdir)
+            data_access.config["OFFLINE"] = True
+            local_file = Path(tmpdir) / "imap/hi/l1c/2025/01/imap_hi_l1c_90sensor-pset_20250101_v001.cdf"
+            local_file.parent.mkdir(parents=True)
+            local_file.touch()
+
+            self.assertEqual(local_file, download("imap_hi_l1c_90sensor-pset_20250101_v001.cdf"))
+            with self.assertRaises(FileNotFoundError):
+                download("imap_hi_l1c_90sensor-pset_20250102_v001.cdf")
+
+            mock_get_session.assert_not_called()
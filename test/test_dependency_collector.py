@@ -1,4 +1,5 @@
 import json
+import threading
 import unittest
 from datetime import datetime, timezone
 from pathlib import Path
@@ -8,16 +9,22 @@ import imap_data_access
 import requests
 from imap_processing.ena_maps.utils.naming import MapDescriptor, MappableInstrumentShortName
 
-from mapping_tool.dependency_collector import DependencyCollector
+from mapping_tool.dependency_collector import DependencyCollector, KernelIntervalIndex, MapDependencies, \
+    AncillaryIndex
+from mapping_tool.dependency_manifest import DependencyManifest
+from mapping_tool.query_records import FileRecord, SpiceFileRecord
+from test.test_builders import create_map_descriptor
 
 
 class TestDependencyCollector(unittest.TestCase):
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    def setUp(self):
+        DependencyCollector.spice_kernel_catalog.refresh()
+
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_pointing_sets(self, mock_query):
         expected_pointing_sets = ["pset_1", "pset_2", "pset_3"]
-        mock_query.return_value = [{"file_path": f"path/to/{file_name}", "start_date": file_name, "version": "v000"} for
-                                   file_name in
-                                   expected_pointing_sets]
+        mock_query.return_value = [FileRecord(file_path=f"path/to/{file_name}", start_date=file_name, version="v000")
+                                   for file_name in expected_pointing_sets]
 
         start_date = datetime(2025, 1, 1)
         end_date = datetime(2025, 2, 1)
@@ -58,15 +65,16 @@ class TestDependencyCollector(unittest.TestCase):
                 )
                 self.assertEqual(expected_pointing_sets, pointing_sets)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_pointing_sets_for_ultra_combined(self, mock_query):
         expected_pointing_sets = ["u45-pset1", "u45-pset2", "u90-pset1", "u90-pset2"]
-        mock_query.side_effect = [
-            [{"file_path": "u45-pset1", "start_date": "u45-pset1", "version": "v000"},
-             {"file_path": "u45-pset2", "start_date": "u45-pset2", "version": "v000"}],
-            [{"file_path": "u90-pset1", "start_date": "u90-pset1", "version": "v000"},
-             {"file_path": "u90-pset2", "start_date": "u90-pset2", "version": "v000"}]
-        ]
+        query_responses = {
+            "45sensor-spacecraftpset": [FileRecord(file_path="u45-pset1", start_date="u45-pset1", version="v000"),
+                                        FileRecord(file_path="u45-pset2", start_date="u45-pset2", version="v000")],
+            "90sensor-spacecraftpset": [FileRecord(file_path="u90-pset1", start_date="u90-pset1", version="v000"),
+                                        FileRecord(file_path="u90-pset2", start_date="u90-pset2", version="v000")]
+        }
+        mock_query.side_effect = lambda **kwargs: query_responses[kwargs["descriptor"]]
 
         descriptor = MapDescriptor(
             frame_descriptor="sf",
@@ -89,23 +97,24 @@ class TestDependencyCollector(unittest.TestCase):
                  end_date="20250201"),
             call(instrument="ultra", data_level="l1c", descriptor="90sensor-spacecraftpset", start_date="20250101",
                  end_date="20250201")
-        ])
+        ], any_order=True)
 
         self.assertEqual(expected_pointing_sets, pointing_sets)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_pointing_sets_for_hi_combined(self, mock_query):
         expected_pointing_sets = [
             "h45-pset1", "h45-pset2",
             "h90-pset1", "h90-pset2",
         ]
 
-        mock_query.side_effect = [
-            [{"file_path": "h45-pset1", "start_date": "h45-pset1", "version": "v000"},
-             {"file_path": "h45-pset2", "start_date": "h45-pset2", "version": "v000"}],
-            [{"file_path": "h90-pset1", "start_date": "h90-pset1", "version": "v000"},
-             {"file_path": "h90-pset2", "start_date": "h90-pset2", "version": "v000"}]
-        ]
+        query_responses = {
+            "45sensor-pset": [FileRecord(file_path="h45-pset1", start_date="h45-pset1", version="v000"),
+                              FileRecord(file_path="h45-pset2", start_date="h45-pset2", version="v000")],
+            "90sensor-pset": [FileRecord(file_path="h90-pset1", start_date="h90-pset1", version="v000"),
+                              FileRecord(file_path="h90-pset2", start_date="h90-pset2", version="v000")]
+        }
+        mock_query.side_effect = lambda **kwargs: query_responses[kwargs["descriptor"]]
 
         descriptor = MapDescriptor(
             frame_descriptor="sf",
@@ -128,19 +137,19 @@ class TestDependencyCollector(unittest.TestCase):
                  end_date="20250201"),
             call(instrument="hi", data_level="l1c", descriptor="90sensor-pset", start_date="20250101",
                  end_date="20250201")
-        ])
+        ], any_order=True)
 
         self.assertEqual(expected_pointing_sets, pointing_sets)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_pointing_sets_for_lo_survival_corrected(self, mock_query):
         expected_pointing_sets = [
             "l90-pset1", "l90-pset2",
         ]
 
         mock_query.side_effect = [
-            [{"file_path": "l90-pset1", "start_date": "l90-pset1", "version": "v000"},
-             {"file_path": "l90-pset2", "start_date": "l90-pset2", "version": "v000"}],
+            [FileRecord(file_path="l90-pset1", start_date="l90-pset1", version="v000"),
+             FileRecord(file_path="l90-pset2", start_date="l90-pset2", version="v000")],
         ]
 
         descriptor = MapDescriptor(
@@ -162,16 +171,46 @@ class TestDependencyCollector(unittest.TestCase):
         mock_query.assert_has_calls([
             call(instrument="lo", data_level="l1c", descriptor="pset", start_date="20250101",
                  end_date="20250201")
-        ])
+        ], any_order=True)
 
         self.assertEqual(expected_pointing_sets, pointing_sets)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
+    def test_get_pointing_sets_queries_run_span_once_and_partitions_by_map_window(self, mock_query):
+        mock_query.return_value = [
+            FileRecord(file_path="imap_hi_l1c_90sensor-pset_20250101_v001.cdf", version="v001", start_date="20250101"),
+            FileRecord(file_path="imap_hi_l1c_90sensor-pset_20250101_v002.cdf", version="v002", start_date="20250101"),
+            FileRecord(file_path="imap_hi_l1c_90sensor-pset_20250331_v001.cdf", version="v001", start_date="20250331"),
+            FileRecord(file_path="imap_hi_l1c_90sensor-pset_20250401_v001.cdf", version="v001", start_date="20250401"),
+            FileRecord(file_path="imap_hi_l1c_90sensor-pset_20250630_v001.cdf", version="v001", start_date="20250630"),
+        ]
+        descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90")
+
+        first_quarter = (datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 4, 1, tzinfo=timezone.utc))
+        second_quarter = (datetime(2025, 4, 1, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc))
+
+        with DependencyCollector.span_queries(first_quarter[0], second_quarter[1]):
+            first_quarter_psets = DependencyCollector.get_pointing_sets(descriptor, *first_quarter)
+            second_quarter_psets = DependencyCollector.get_pointing_sets(descriptor, *second_quarter)
+
+        mock_query.assert_called_once_with(instrument="hi", start_date="20250101", end_date="20250701",
+                                           data_level="l1c", descriptor="90sensor-pset")
+        self.assertEqual(["imap_hi_l1c_90sensor-pset_20250101_v002.cdf",
+                          "imap_hi_l1c_90sensor-pset_20250331_v001.cdf"], first_quarter_psets)
+        self.assertEqual(["imap_hi_l1c_90sensor-pset_20250401_v001.cdf",
+                          "imap_hi_l1c_90sensor-pset_20250630_v001.cdf"], second_quarter_psets)
+
+        DependencyCollector.get_pointing_sets(descriptor, *first_quarter)
+        self.assertEqual(2, mock_query.call_count)
+        mock_query.assert_called_with(instrument="hi", start_date="20250101", end_date="20250401",
+                                      data_level="l1c", descriptor="90sensor-pset")
+
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_files_returns_latest_file_versions(self, mock_query):
         mock_query.side_effect = [
-            [{"file_path": "imap_hi_l1c_45sensor-pset_20260101_v001.cdf", "version": "v001", "start_date": "20260101"},
-             {"file_path": "imap_hi_l1c_45sensor-pset_20260101_v002.cdf", "version": "v002", "start_date": "20260101"},
-             {"file_path": "imap_hi_l1c_45sensor-pset_20260102_v001.cdf", "version": "v001", "start_date": "20260102"}]
+            [FileRecord(file_path="imap_hi_l1c_45sensor-pset_20260101_v001.cdf", version="v001", start_date="20260101"),
+             FileRecord(file_path="imap_hi_l1c_45sensor-pset_20260101_v002.cdf", version="v002", start_date="20260101"),
+             FileRecord(file_path="imap_hi_l1c_45sensor-pset_20260102_v001.cdf", version="v001", start_date="20260102")]
         ]
         descriptor = MapDescriptor(
             frame_descriptor="sf",
@@ -193,7 +232,7 @@ class TestDependencyCollector(unittest.TestCase):
         expected_psets = ["imap_hi_l1c_45sensor-pset_20260101_v002.cdf", "imap_hi_l1c_45sensor-pset_20260102_v001.cdf"]
         self.assertEqual(expected_psets, psets)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_latest_version_of_ancillary_dependencies(self, mock_query):
         sensors = ["90", "45"]
 
@@ -239,7 +278,7 @@ class TestDependencyCollector(unittest.TestCase):
 
                 self.assertEqual(expected_ancillary_dependencies, ancillary_dependencies)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_ancillary_dependencies_finds_nearest_files_to_map_end_date(self, mock_query):
         mock_query.side_effect = [
             [
@@ -271,7 +310,7 @@ class TestDependencyCollector(unittest.TestCase):
 
         self.assertEqual(expected_ancillary_dependencies, ancillary_dependencies)
 
-    @patch('mapping_tool.dependency_collector.imap_data_access.query')
+    @patch('mapping_tool.dependency_collector.data_access.query')
     def test_get_ancillary_dependencies_does_not_filter_by_sensor_if_not_hi(self, mock_query):
         mock_query.side_effect = [
             [
@@ -304,88 +343,177 @@ class TestDependencyCollector(unittest.TestCase):
 
         self.assertEqual(expected_ancillary_dependencies, ancillary_dependencies)
 
-    @patch('mapping_tool.dependency_collector.requests')
-    def test_furnish_spice(self, mock_requests):
+    @patch('mapping_tool.dependency_collector.data_access.query')
+    def test_get_ancillary_dependencies_shares_one_narrowed_query_across_a_run_span(self, mock_query):
+        mock_query.return_value = [
+            create_imap_query_response_item(descriptor="90sensor-cal-prod", version="v001", start_date="20240101"),
+            create_imap_query_response_item(descriptor="90sensor-cal-prod", version="v001", start_date="20250301"),
+            create_imap_query_response_item(descriptor="45sensor-cal-prod", version="v001", start_date="20240101"),
+        ]
+        descriptor_90 = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90")
+        descriptor_45 = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="45")
+
+        first_map_end = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        second_map_end = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        with DependencyCollector.span_queries(datetime(2025, 1, 1, tzinfo=timezone.utc), second_map_end):
+            first_map = DependencyCollector.get_ancillary_dependencies(descriptor_90, first_map_end)
+            second_map = DependencyCollector.get_ancillary_dependencies(descriptor_90, second_map_end)
+            other_sensor = DependencyCollector.get_ancillary_dependencies(descriptor_45, second_map_end)
+
+        self.assertEqual(["imap_hi_90sensor-cal-prod_20240101_v001.csv"], first_map)
+        self.assertEqual(["imap_hi_90sensor-cal-prod_20250301_v001.csv"], second_map)
+        self.assertEqual(["imap_hi_45sensor-cal-prod_20240101_v001.csv"], other_sensor)
+        mock_query.assert_has_calls([
+            call(table="ancillary", instrument="hi", end_date="20250602"),
+            call(table="ancillary", instrument="hi", end_date="20250602"),
+        ])
+        self.assertEqual(2, mock_query.call_count)
+
+    @patch('mapping_tool.dependency_collector.DependencyCollector.collect_spice_kernels')
+    @patch('mapping_tool.dependency_collector.DependencyCollector.get_ancillary_dependencies')
+    @patch('mapping_tool.dependency_collector.DependencyCollector.get_pointing_sets')
+    def test_resolve_map_dependencies_issues_queries_concurrently(self, mock_spice_query_pointing_sets,
+                                                                  mock_spice_query_ancillary_dependencies,
+                                                                  mock_collect_spice_kernels):
+        all_queries_in_flight = threading.Barrier(3, timeout=5)
+
+        def respond_when_all_queries_are_in_flight(result):
+            def side_effect(*args, **kwargs):
+                all_queries_in_flight.wait()
+                return result
+
+            return side_effect
+
+        mock_spice_query_pointing_sets.side_effect = respond_when_all_queries_are_in_flight(["pset"])
+        mock_spice_query_ancillary_dependencies.side_effect = respond_when_all_queries_are_in_flight(["ancillary"])
+        mock_collect_spice_kernels.side_effect = respond_when_all_queries_are_in_flight(["kernel"])
+
+        descriptor = create_map_descriptor()
+        start_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        end_date = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+        dependencies = DependencyCollector.resolve_map_dependencies(descriptor, start_date, end_date)
+
+        self.assertEqual(MapDependencies(psets=["pset"], ancillary_dependencies=["ancillary"],
+                                         spice_kernels=["kernel"]), dependencies)
+        mock_spice_query_pointing_sets.assert_called_once_with(descriptor, start_date, end_date)
+        mock_spice_query_ancillary_dependencies.assert_called_once_with(descriptor, end_date)
+        mock_collect_spice_kernels.assert_called_once_with(start_date=start_date, end_date=end_date)
+
+    @patch('mapping_tool.dependency_collector.DependencyCollector.collect_spice_kernels')
+    @patch('mapping_tool.dependency_collector.DependencyCollector.get_ancillary_dependencies')
+    @patch('mapping_tool.dependency_collector.DependencyCollector.get_pointing_sets')
+    def test_resolved_dependencies_are_recorded_into_and_replayed_from_a_manifest(self, mock_get_pointing_sets,
+                                                                                   mock_get_ancillary_dependencies,
+                                                                                   mock_collect_spice_kernels):
+        mock_get_pointing_sets.return_value = ["pset"]
+        mock_get_ancillary_dependencies.return_value = ["ancillary"]
+        mock_collect_spice_kernels.return_value = ["kernel"]
+
+        l2_descriptor = create_map_descriptor(survival_corrected="nsp")
+        l3_descriptor = create_map_descriptor(survival_corrected="sp")
+        start_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        end_date = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+        manifest = DependencyManifest()
+        with DependencyCollector.use_manifest(manifest):
+            DependencyCollector.resolve_map_dependencies(l2_descriptor, start_date, end_date)
+            DependencyCollector.resolve_l3_map_dependencies(l3_descriptor, start_date, end_date)
+
+        self.assertEqual(MapDependencies(["pset"], ["ancillary"], ["kernel"]),
+                         manifest.lookup(l2_descriptor, start_date, end_date))
+        self.assertEqual(MapDependencies([], [], ["kernel"]), manifest.lookup(l3_descriptor, start_date, end_date))
+        self.assertIsNone(DependencyCollector.manifest)
+
+        for mock in [mock_get_pointing_sets, mock_get_ancillary_dependencies, mock_collect_spice_kernels]:
+            mock.reset_mock()
+
+        with DependencyCollector.use_manifest(manifest, replay=True):
+            replayed_l2 = DependencyCollector.resolve_map_dependencies(l2_descriptor, start_date, end_date)
+            replayed_l3 = DependencyCollector.resolve_l3_map_dependencies(l3_descriptor, start_date, end_date)
+
+        self.assertEqual(MapDependencies(["pset"], ["ancillary"], ["kernel"]), replayed_l2)
+        self.assertEqual(MapDependencies([], [], ["kernel"]), replayed_l3)
+        mock_get_pointing_sets.assert_not_called()
+        mock_get_ancillary_dependencies.assert_not_called()
+        mock_collect_spice_kernels.assert_not_called()
+
+    @patch('mapping_tool.dependency_collector.data_access.spice_query')
+    def test_furnish_spice(self, mock_spice_query):
         desired_spice_start = datetime(2025, 1, 1, tzinfo=timezone.utc)
         desired_spice_end = datetime(2025, 3, 1, tzinfo=timezone.utc)
 
         mock_naif_json = [
-            {
-                "file_name": "lsk/naif0012.tls",
-                "min_date_datetime": "2024-12-01, 00:00:00",
-                "max_date_datetime": "2025-05-01, 00:00:00"
-            },
+            SpiceFileRecord(
+                file_name="lsk/naif0012.tls",
+                min_date_datetime="2024-12-01, 00:00:00",
+                max_date_datetime="2025-05-01, 00:00:00"
+            ),
         ]
 
         mock_sclk_json = [
-            {
-                "file_name": "lsk/imap_sclk_0000.tsc",
-                "min_date_datetime": "2024-12-01, 00:00:00",
-                "max_date_datetime": "2025-05-01, 00:00:00"
-            },
+            SpiceFileRecord(
+                file_name="lsk/imap_sclk_0000.tsc",
+                min_date_datetime="2024-12-01, 00:00:00",
+                max_date_datetime="2025-05-01, 00:00:00"
+            ),
         ]
 
         mock_dps_json = [
-            {
-                "file_name": "ck/imap_dps_2024_270_2026_335_01.ah.bc",
-                "min_date_datetime": "2024-09-01, 00:00:00",
-                "max_date_datetime": "2024-12-01, 00:00:00",
-            },
-            {
-                "file_name": "ck/imap_dps_2024_335_2025_031_01.ah.bc",
-                "min_date_datetime": "2024-12-01, 00:00:00",
-                "max_date_datetime": "2025-02-01, 00:00:00",
-            },
-            {
-                "file_name": "ck/imap_dps_2025_031_2025_120_01.ah.bc",
-                "min_date_datetime": "2025-02-01, 00:00:00",
-                "max_date_datetime": "2025-05-01, 00:00:00",
-            },
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2024_270_2026_335_01.ah.bc",
+                min_date_datetime="2024-09-01, 00:00:00",
+                max_date_datetime="2024-12-01, 00:00:00",
+            ),
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2024_335_2025_031_01.ah.bc",
+                min_date_datetime="2024-12-01, 00:00:00",
+                max_date_datetime="2025-02-01, 00:00:00",
+            ),
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2025_031_2025_120_01.ah.bc",
+                min_date_datetime="2025-02-01, 00:00:00",
+                max_date_datetime="2025-05-01, 00:00:00",
+            ),
         ]
 
         mock_imap_frame_json = [
-            {
-                "file_name": "fk/imap_001.tf",
-                "min_date_datetime": "2024-12-01, 00:00:00",
-                "max_date_datetime": "2025-05-01, 00:00:00"
-            },
+            SpiceFileRecord(
+                file_name="fk/imap_001.tf",
+                min_date_datetime="2024-12-01, 00:00:00",
+                max_date_datetime="2025-05-01, 00:00:00"
+            ),
         ]
 
         mock_science_frame_json = [
-            {
-                "file_name": "fk/imap_science_0001.tf",
-                "min_date_datetime": "2024-12-01, 00:00:00",
-                "max_date_datetime": "2025-05-01, 00:00:00"
-            }
+            SpiceFileRecord(
+                file_name="fk/imap_science_0001.tf",
+                min_date_datetime="2024-12-01, 00:00:00",
+                max_date_datetime="2025-05-01, 00:00:00"
+            )
         ]
 
-        mock_naif_response = Mock(json=Mock(return_value=mock_naif_json))
-        mock_sclk_response = Mock(json=Mock(return_value=mock_sclk_json))
-        mock_dps_response = Mock(json=Mock(return_value=mock_dps_json))
-        mock_imap_frame_response = Mock(json=Mock(return_value=mock_imap_frame_json))
-        mock_science_frame_response = Mock(json=Mock(return_value=mock_science_frame_json))
-
-        mock_requests.get.side_effect = [
-            mock_naif_response,
-            mock_sclk_response,
-            mock_dps_response,
-            mock_imap_frame_response,
-            mock_science_frame_response
-        ]
+        responses = {
+            "leapseconds": mock_naif_json,
+            "spacecraft_clock": mock_sclk_json,
+            "pointing_attitude": mock_dps_json,
+            "imap_frames": mock_imap_frame_json,
+            "science_frames": mock_science_frame_json,
+        }
+        mock_spice_query.side_effect = lambda **params: responses[params["type"]]
 
         imap_data_access.config["DATA_ACCESS_URL"] = "expected-url"
         imap_data_access.config["ACCESS_TOKEN"] = "expected-access-token"
 
         spice_kernels = DependencyCollector.collect_spice_kernels(desired_spice_start, desired_spice_end)
 
-        expected_auth_header = {"Authorization": r"Bearer expected-access-token"}
-        mock_requests.get.assert_has_calls([
-            call("expected-url/spice-query?type=leapseconds&start_time=0", headers=expected_auth_header),
-            call("expected-url/spice-query?type=spacecraft_clock&start_time=0", headers=expected_auth_header),
-            call("expected-url/spice-query?type=pointing_attitude&start_time=0", headers=expected_auth_header),
-            call("expected-url/spice-query?type=imap_frames&start_time=0", headers=expected_auth_header),
-            call("expected-url/spice-query?type=science_frames&start_time=0", headers=expected_auth_header)
-        ])
+        mock_spice_query.assert_has_calls([
+            call(type="leapseconds", start_time=0),
+            call(type="spacecraft_clock", start_time=0),
+            call(type="pointing_attitude", start_time=0),
+            call(type="imap_frames", start_time=0),
+            call(type="science_frames", start_time=0)
+        ], any_order=True)
         self.assertEqual(["naif0012.tls",
                           "imap_sclk_0000.tsc",
                           "imap_dps_2024_335_2025_031_01.ah.bc",
@@ -393,13 +521,125 @@ class TestDependencyCollector(unittest.TestCase):
                           "imap_001.tf",
                           "imap_science_0001.tf"], spice_kernels)
 
-    @patch('mapping_tool.dependency_collector.requests')
-    def test_raises_error_if_http_request_fails(self, mock_requests):
+    @patch('mapping_tool.dependency_collector.data_access.spice_query')
+    def test_collect_spice_kernels_fetches_each_kernel_type_once_until_refreshed(self, mock_spice_query):
+        mock_spice_query.return_value = [
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2025_001_2025_120_01.ah.bc",
+                min_date_datetime="2025-01-01, 00:00:00",
+                max_date_datetime="2025-05-01, 00:00:00",
+            ),
+        ]
+
+        imap_data_access.config["DATA_ACCESS_URL"] = "expected-url"
+        imap_data_access.config["ACCESS_TOKEN"] = "expected-access-token"
+
+        first_window = DependencyCollector.collect_spice_kernels(datetime(2025, 1, 1, tzinfo=timezone.utc),
+                                                                 datetime(2025, 2, 1, tzinfo=timezone.utc))
+        second_window = DependencyCollector.collect_spice_kernels(datetime(2025, 2, 1, tzinfo=timezone.utc),
+                                                                  datetime(2025, 3, 1, tzinfo=timezone.utc))
+        outside_window = DependencyCollector.collect_spice_kernels(datetime(2025, 6, 1, tzinfo=timezone.utc),
+                                                                   datetime(2025, 7, 1, tzinfo=timezone.utc))
+
+        self.assertEqual(5, mock_spice_query.call_count)
+        self.assertEqual(["imap_dps_2025_001_2025_120_01.ah.bc"] * 5, first_window)
+        self.assertEqual(first_window, second_window)
+        self.assertEqual([], outside_window)
+
+        DependencyCollector.spice_kernel_catalog.refresh()
+        DependencyCollector.collect_spice_kernels(datetime(2025, 1, 1, tzinfo=timezone.utc),
+                                                  datetime(2025, 2, 1, tzinfo=timezone.utc))
+
+        self.assertEqual(10, mock_spice_query.call_count)
+
+    @patch('mapping_tool.dependency_collector.data_access.spice_query')
+    def test_collect_spice_kernels_keeps_kernels_whose_coverage_starts_before_the_window(self, mock_spice_query):
+        mock_spice_query.return_value = [
+            SpiceFileRecord(
+                file_name="lsk/naif0012.tls",
+                min_date_datetime="2010-01-01, 00:00:00",
+                max_date_datetime="2099-12-31, 00:00:00",
+            ),
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2024_001_2024_120_01.ah.bc",
+                min_date_datetime="2024-01-01, 00:00:00",
+                max_date_datetime="2024-05-01, 00:00:00",
+            ),
+        ]
+
+        spice_kernels = DependencyCollector.collect_spice_kernels(datetime(2025, 1, 1, tzinfo=timezone.utc),
+                                                                  datetime(2025, 4, 1, tzinfo=timezone.utc))
+
+        self.assertEqual(["naif0012.tls"] * 5, spice_kernels)
+        mock_spice_query.assert_any_call(type="leapseconds", start_time=0)
+
+    @patch('mapping_tool.dependency_collector.data_access.spice_query')
+    def test_collect_spice_kernels_for_windows_queries_each_kernel_type_once(self, mock_spice_query):
+        mock_spice_query.return_value = [
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2025_091_2025_181_01.ah.bc",
+                min_date_datetime="2025-04-01, 00:00:00",
+                max_date_datetime="2025-07-01, 00:00:00",
+            ),
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2025_001_2025_091_01.ah.bc",
+                min_date_datetime="2025-01-01, 00:00:00",
+                max_date_datetime="2025-04-01, 00:00:00",
+            ),
+        ]
+
+        imap_data_access.config["DATA_ACCESS_URL"] = "expected-url"
+        imap_data_access.config["ACCESS_TOKEN"] = "expected-access-token"
+
+        windows = [
+            (datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 4, 1, tzinfo=timezone.utc)),
+            (datetime(2025, 4, 1, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc)),
+            (datetime(2025, 7, 1, tzinfo=timezone.utc), datetime(2025, 10, 1, tzinfo=timezone.utc)),
+        ]
+        kernels_per_window = DependencyCollector.collect_spice_kernels_for_windows(windows)
+
+        mock_spice_query.assert_any_call(type="pointing_attitude", start_time=0)
+        self.assertEqual(5, mock_spice_query.call_count)
+        self.assertEqual([
+            ["imap_dps_2025_091_2025_181_01.ah.bc", "imap_dps_2025_001_2025_091_01.ah.bc"] * 5,
+            ["imap_dps_2025_091_2025_181_01.ah.bc"] * 5,
+            [],
+        ], kernels_per_window)
+
+    @patch('mapping_tool.dependency_collector.data_access.spice_query')
+    def test_kernels_resolved_for_every_window_up_front_answer_later_lookups_within_the_span(self,
+                                                                                             mock_spice_query):
+        mock_spice_query.return_value = [
+            SpiceFileRecord(
+                file_name="ck/imap_dps_2025_001_2025_091_01.ah.bc",
+                min_date_datetime="2025-01-01, 00:00:00",
+                max_date_datetime="2025-04-01, 00:00:00",
+            ),
+        ]
+        windows = [
+            (datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 4, 1, tzinfo=timezone.utc)),
+            (datetime(2025, 4, 2, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc)),
+        ]
+
+        catalog = DependencyCollector.spice_kernel_catalog
+        with DependencyCollector.span_queries(windows[0][0], windows[-1][1]), \
+                patch.object(catalog, "get_kernels_for_windows", wraps=catalog.get_kernels_for_windows) as lookup:
+            kernels_per_window = DependencyCollector.collect_spice_kernels_for_windows(windows)
+            self.assertEqual([DependencyCollector.collect_spice_kernels(*window) for window in windows],
+                             kernels_per_window)
+
+        lookup.assert_called_once_with(windows)
+        self.assertEqual(5, mock_spice_query.call_count)
+
+        self.assertEqual([["imap_dps_2025_001_2025_091_01.ah.bc"] * 5, []], kernels_per_window)
+
+    @patch('mapping_tool.dependency_collector.data_access.spice_query')
+    def test_raises_error_if_http_request_fails(self, mock_spice_query):
         desired_spice_start = datetime(2025, 1, 1, tzinfo=timezone.utc)
         desired_spice_end = datetime(2025, 3, 1, tzinfo=timezone.utc)
 
         expected_exception = Exception("unauthenticated")
-        mock_requests.get.return_value.raise_for_status.side_effect = expected_exception
+        mock_spice_query.side_effect = expected_exception
 
         imap_data_access.config["DATA_ACCESS_URL"] = "expected-url"
         imap_data_access.config["ACCESS_TOKEN"] = "bad-token"
@@ -410,7 +650,68 @@ class TestDependencyCollector(unittest.TestCase):
         self.assertEqual(expected_exception, cm.exception)
 
 
+class TestKernelIntervalIndex(unittest.TestCase):
+    def test_overlapping_matches_kernels_to_each_window(self):
+        index = KernelIntervalIndex([
+            SpiceFileRecord(file_name="ck/b.ah.bc", min_date_datetime="2025-02-01, 00:00:00",
+             max_date_datetime="2025-03-01, 00:00:00"),
+            SpiceFileRecord(file_name="ck/a.ah.bc", min_date_datetime="2025-01-01, 00:00:00",
+             max_date_datetime="2025-02-01, 00:00:00"),
+            SpiceFileRecord(file_name="ck/c.ah.bc", min_date_datetime="2025-01-15, 00:00:00",
+             max_date_datetime="2025-06-01, 00:00:00"),
+        ])
+
+        windows = [
+            (datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 10, tzinfo=timezone.utc)),
+            (datetime(2025, 2, 1), datetime(2025, 2, 2)),
+            (datetime(2024, 12, 1, tzinfo=timezone.utc), datetime(2025, 1, 1, tzinfo=timezone.utc)),
+            (datetime(2025, 6, 1, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc)),
+        ]
+
+        self.assertEqual([
+            ["a.ah.bc"],
+            ["b.ah.bc", "c.ah.bc"],
+            ["a.ah.bc"],
+            [],
+        ], index.overlapping(windows))
+
+    def test_overlapping_with_empty_listing(self):
+        index = KernelIntervalIndex([])
+
+        self.assertEqual([[]], index.overlapping([(datetime(2025, 1, 1), datetime(2025, 2, 1))]))
+
+
+class TestAncillaryIndex(unittest.TestCase):
+    def test_resolve_picks_latest_start_date_then_highest_version_per_descriptor(self):
+        index = AncillaryIndex([
+            create_imap_query_response_item(descriptor="esa-energies", version="v001", start_date="20250101"),
+            create_imap_query_response_item(descriptor="cal-prod", version="v003", start_date="20240101"),
+            create_imap_query_response_item(descriptor="cal-prod", version="v001", start_date="20250101"),
+            create_imap_query_response_item(descriptor="cal-prod", version="v002", start_date="20250101"),
+            create_imap_query_response_item(descriptor="cal-prod", version="v009", start_date="20260101"),
+        ])
+
+        cases = [
+            (datetime(2024, 6, 1, tzinfo=timezone.utc), ["imap_hi_cal-prod_20240101_v003.csv"]),
+            (datetime(2025, 1, 1, tzinfo=timezone.utc), ["imap_hi_cal-prod_20240101_v003.csv"]),
+            (datetime(2025, 1, 1, 6, tzinfo=timezone.utc), ["imap_hi_esa-energies_20250101_v001.csv",
+                                                            "imap_hi_cal-prod_20250101_v002.csv"]),
+            (datetime(2023, 1, 1, tzinfo=timezone.utc), []),
+        ]
+        for end_date, expected_files in cases:
+            with self.subTest(end_date):
+                self.assertEqual(expected_files, index.resolve(end_date))
+
+    def test_resolve_keeps_first_listed_file_for_identical_start_date_and_version(self):
+        index = AncillaryIndex([
+            FileRecord(file_path="first.csv", descriptor="cal-prod", start_date="20250101", version="v001"),
+            FileRecord(file_path="second.csv", descriptor="cal-prod", start_date="20250101", version="v001"),
+        ])
+
+        self.assertEqual(["first.csv"], index.resolve(datetime(2025, 2, 1, tzinfo=timezone.utc)))
+
+
 def create_imap_query_response_item(instrument="hi", descriptor="descriptor", version="v001", start_date="20240101"):
-    return {"file_path": f"imap_{instrument}_{descriptor}_{start_date}_{version}.csv",
-            "version": version,
-            "start_date": start_date, "descriptor": descriptor}
+    return FileRecord(file_path=f"imap_{instrument}_{descriptor}_{start_date}_{version}.csv",
+            version=version,
+            start_date=start_date, descriptor=descriptor)
@@ -0,0 +1,45 @@
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+
+from imap_processing.ena_maps.utils.naming import MappableInstrumentShortName
+
+from mapping_tool.dependency_collector import MapDependencies
+from mapping_tool.dependency_manifest import DependencyManifest
+from test.test_builders import create_map_descriptor
+
+
+class TestDependencyManifest(unittest.TestCase):
+    def test_round_trips_recorded_dependencies_through_a_file(self):
+        l2_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, survival_corrected="nsp")
+        l3_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, survival_corrected="sp")
+        start_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        end_date = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+        l2_dependencies = MapDependencies(psets=["imap_hi_l1c_90sensor-pset_20250101_v001.cdf"],
+                                          ancillary_dependencies=["imap_hi_90sensor-cal-prod_20240101_v002.csv"],
+                                          spice_kernels=["naif0012.tls"])
+        l3_dependencies = MapDependencies(psets=[], ancillary_dependencies=[], spice_kernels=["naif0012.tls"])
+
+        manifest = DependencyManifest()
+        manifest.record(l2_descriptor, start_date, end_date, l2_dependencies)
+        manifest.record(l3_descriptor, start_date, end_date, l3_dependencies)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest_path = Path(tmpdir) / "manifest.json"
+            manifest.to_file(manifest_path)
+            loaded_manifest = DependencyManifest.from_file(manifest_path)
+
+        self.assertEqual(l2_dependencies, loaded_manifest.lookup(l2_descriptor, start_date, end_date))
+        self.assertEqual(l3_dependencies, loaded_manifest.lookup(l3_descriptor, start_date, end_date))
+
+    def test_lookup_raises_error_for_unrecorded_map(self):
+        descriptor = create_map_descriptor()
+        start_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        end_date = datetime(2025, 4, 1, tzinfo=timezone.utc)
+
+        with self.assertRaises(ValueError) as context:
+            DependencyManifest().lookup(descriptor, start_date, end_date)
+
+        self.assertIn(f"Dependency manifest has no entry for {descriptor.to_string()}", str(context.exception))
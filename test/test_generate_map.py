@@ -1,6 +1,7 @@
 import dataclasses
 import logging
 import os
+import tempfile
 import unittest
 from datetime import datetime, timezone
 from pathlib import Path
@@ -13,16 +14,22 @@ from imap_processing.spice.geometry import SpiceFrame
 
 from mapping_tool.configuration import DataLevel
 from mapping_tool.generate_map import get_dependencies_for_l3_map, get_data_level_for_descriptor, generate_l3_map, \
-    generate_l2_map, generate_map
+    generate_l2_map, generate_map, plan_map_generation, get_map_node_key, run_map_plan, find_cached_maps, \
+    get_map_cache_keys
+from mapping_tool.dependency_collector import MapDependencies
 from test.test_builders import create_map_descriptor
 
 
 class TestGenerateMap(unittest.TestCase):
     def setUp(self):
-        download_patch = patch("mapping_tool.generate_map.download")
+        download_patch = patch("mapping_tool.data_access.download")
         self.mock_download = download_patch.start()
         self.addCleanup(download_patch.stop)
 
+        local_store_patch = patch("mapping_tool.generate_map.get_local_store")
+        self.mock_local_store = local_store_patch.start().return_value
+        self.addCleanup(local_store_patch.stop)
+
     def test_get_dependencies_for_l3_map_returns_correct_dependencies(self):
         # @formatter:off
         ultra_sp_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.ULTRA, spin_phase='full', survival_corrected='sp')
@@ -137,6 +144,147 @@ class TestGenerateMap(unittest.TestCase):
 
         self.assertEqual(l3_spx_map, output_map)
 
+    def test_plan_map_generation_merges_maps_shared_by_several_targets(self):
+        full_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="full")
+        ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="ram")
+        nsp_ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="ram",
+                                                   survival_corrected="nsp")
+        nsp_anti_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="anti",
+                                                    survival_corrected="nsp")
+        first_window = (datetime(2020, 1, 1), datetime(2020, 7, 1))
+        second_window = (datetime(2020, 7, 1), datetime(2021, 1, 1))
+
+        plan = plan_map_generation([(full_descriptor, *first_window), (ram_descriptor, *first_window),
+                                    (ram_descriptor, *second_window)])
+
+        self.assertEqual([
+            get_map_node_key(nsp_ram_descriptor, *first_window),
+            get_map_node_key(nsp_anti_descriptor, *first_window),
+            get_map_node_key(full_descriptor, *first_window),
+            get_map_node_key(ram_descriptor, *first_window),
+            get_map_node_key(nsp_ram_descriptor, *second_window),
+            get_map_node_key(ram_descriptor, *second_window),
+        ], list(plan))
+        self.assertEqual([get_map_node_key(nsp_ram_descriptor, *first_window),
+                          get_map_node_key(nsp_anti_descriptor, *first_window)],
+                         plan[get_map_node_key(full_descriptor, *first_window)].dependencies)
+        self.assertEqual([get_map_node_key(nsp_ram_descriptor, *first_window)],
+                         plan[get_map_node_key(ram_descriptor, *first_window)].dependencies)
+
+    @patch('mapping_tool.generate_map.print')
+    @patch('mapping_tool.generate_map.generate_l3_map')
+    @patch('mapping_tool.generate_map.generate_l2_map')
+    def test_run_map_plan_generates_each_shared_map_once(self, mock_generate_l2, mock_generate_l3, _):
+        full_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="full")
+        ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="ram")
+        start_date = datetime(2020, 1, 1)
+        end_date = datetime(2020, 7, 1)
+        mock_generate_l2.side_effect = lambda descriptor, start, end: Path(f"{descriptor.spin_phase}-nsp")
+        mock_generate_l3.side_effect = lambda descriptor, start, end, input_maps: Path(f"{descriptor.spin_phase}-sp")
+        targets = [get_map_node_key(full_descriptor, start_date, end_date),
+                   get_map_node_key(ram_descriptor, start_date, end_date)]
+
+        results = run_map_plan(plan_map_generation([(full_descriptor, start_date, end_date),
+                                                    (ram_descriptor, start_date, end_date)]), targets)
+
+        self.assertEqual(2, mock_generate_l2.call_count)
+        self.assertEqual([call(full_descriptor, start_date, end_date, [Path("ram-nsp"), Path("anti-nsp")]),
+                          call(ram_descriptor, start_date, end_date, [Path("ram-nsp")])],
+                         mock_generate_l3.call_args_list)
+        self.assertEqual([Path("full-sp"), Path("ram-sp")], [results[target] for target in targets])
+
+    def test_find_cached_maps_skips_maps_only_needed_by_cached_maps(self):
+        full_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="full")
+        ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="ram")
+        nsp_ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="ram",
+                                                   survival_corrected="nsp")
+        window = (datetime(2020, 1, 1), datetime(2020, 7, 1))
+        plan = plan_map_generation([(full_descriptor, *window), (ram_descriptor, *window)])
+        cache_keys = {key: f"cache key {i}" for i, key in enumerate(plan)}
+        full_key = get_map_node_key(full_descriptor, *window)
+        map_cache = Mock()
+        map_cache.get.side_effect = lambda cache_key: Path("full-sp") if cache_key == cache_keys[full_key] else None
+
+        cached_maps, remaining_plan = find_cached_maps(plan, [full_key, get_map_node_key(ram_descriptor, *window)],
+                                                       map_cache, cache_keys)
+
+        self.assertEqual({full_key: Path("full-sp")}, cached_maps)
+        self.assertEqual([get_map_node_key(nsp_ram_descriptor, *window), get_map_node_key(ram_descriptor, *window)],
+                         list(remaining_plan))
+
+    @patch('mapping_tool.generate_map.DependencyCollector')
+    def test_get_map_cache_keys_change_when_an_input_map_is_built_from_a_new_file_version(self,
+                                                                                         mock_dependency_collector):
+        ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="ram")
+        window = (datetime(2020, 1, 1), datetime(2020, 7, 1))
+        plan = plan_map_generation([(ram_descriptor, *window)])
+        mock_dependency_collector.resolve_l3_map_dependencies.return_value = MapDependencies(
+            [], [], ["naif0012.tls"])
+
+        mock_dependency_collector.resolve_map_dependencies.return_value = MapDependencies(
+            ["imap_hi_l1c_90sensor-pset_20200101_v001.cdf"], [], ["naif0012.tls"])
+        first_keys = get_map_cache_keys(plan)
+        unchanged_keys = get_map_cache_keys(plan)
+        mock_dependency_collector.resolve_map_dependencies.return_value = MapDependencies(
+            ["imap_hi_l1c_90sensor-pset_20200101_v002.cdf"], [], ["naif0012.tls"])
+        reprocessed_keys = get_map_cache_keys(plan)
+
+        self.assertEqual(first_keys, unchanged_keys)
+        for key in plan:
+            self.assertNotEqual(first_keys[key], reprocessed_keys[key])
+
+    @patch('mapping_tool.generate_map.DependencyCollector')
+    def test_get_map_cache_keys_change_when_a_custom_kernel_is_edited_in_place(self, mock_dependency_collector):
+        mock_dependency_collector.resolve_map_dependencies.return_value = MapDependencies(
+            ["imap_hi_l1c_90sensor-pset_20200101_v001.cdf"], [], ["naif0012.tls"])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            kernel_path = Path(tmpdir) / "spice_kernel.tf"
+            kernel_path.write_text("FRAME_-43905_NAME = 'CUSTOM'")
+            descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, survival_corrected="nsp",
+                                               kernel_path=kernel_path)
+            plan = plan_map_generation([(descriptor, datetime(2020, 1, 1), datetime(2020, 7, 1))])
+
+            first_keys = get_map_cache_keys(plan)
+            kernel_path.write_text("FRAME_-43905_NAME = 'EDITED'")
+            edited_keys = get_map_cache_keys(plan)
+
+        self.assertNotEqual(first_keys, edited_keys)
+
+    @patch('mapping_tool.generate_map.print')
+    @patch('mapping_tool.generate_map.copy_cached_map')
+    @patch('mapping_tool.generate_map.generate_imap_file_path')
+    @patch('mapping_tool.generate_map.get_map_cache_keys')
+    @patch('mapping_tool.generate_map.get_map_cache')
+    @patch('mapping_tool.generate_map.generate_l3_map')
+    @patch('mapping_tool.generate_map.generate_l2_map')
+    def test_run_map_plan_reuses_cached_maps_and_caches_generated_ones(self, mock_generate_l2, mock_generate_l3,
+                                                                       mock_get_map_cache, mock_get_map_cache_keys,
+                                                                       mock_generate_imap_file_path,
+                                                                       mock_copy_cached_map, _):
+        full_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, spin_phase="full")
+        window = (datetime(2020, 1, 1), datetime(2020, 7, 1))
+        plan = plan_map_generation([(full_descriptor, *window)])
+        nsp_ram_key, nsp_anti_key, full_key = plan
+        mock_get_map_cache_keys.return_value = {key: key[0] for key in plan}
+        map_cache = mock_get_map_cache.return_value
+        map_cache.get.side_effect = lambda cache_key: Path("cache/ram-nsp") if cache_key == nsp_ram_key[0] else None
+        mock_generate_imap_file_path.return_value.construct_path.return_value = Path("workspace/ram-nsp")
+        mock_copy_cached_map.side_effect = lambda cached_path, destination: destination
+        mock_generate_l2.return_value = Path("anti-nsp")
+        mock_generate_l3.return_value = Path("full-sp")
+
+        results = run_map_plan(plan, [full_key])
+
+        mock_get_map_cache_keys.assert_called_once_with(plan)
+        mock_generate_imap_file_path.assert_called_once_with("ram-nsp")
+        mock_copy_cached_map.assert_called_once_with(Path("cache/ram-nsp"), Path("workspace/ram-nsp"))
+        mock_generate_l2.assert_called_once_with(plan[nsp_anti_key].descriptor, *window)
+        mock_generate_l3.assert_called_once_with(full_descriptor, *window,
+                                                 [Path("workspace/ram-nsp"), Path("anti-nsp")])
+        self.assertEqual([call(nsp_anti_key[0], Path("anti-nsp")), call(full_key[0], Path("full-sp"))],
+                         map_cache.put.call_args_list)
+        self.assertEqual(Path("full-sp"), results[full_key])
+
     def test_generate_l3_map_raises_exception_when_called_with_non_l2_or_l3_map(self):
         map_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.GLOWS, principal_data="spx",
                                                spin_phase="full")
@@ -150,7 +298,7 @@ class TestGenerateMap(unittest.TestCase):
                       str(context.exception))
 
     @patch('mapping_tool.generate_map.spiceypy.furnsh')
-    @patch('mapping_tool.generate_map.imap_data_access.download')
+    @patch('mapping_tool.generate_map.download')
     @patch("mapping_tool.generate_map.DependencyCollector.collect_spice_kernels")
     @patch("mapping_tool.generate_map.HiProcessor")
     @patch("mapping_tool.generate_map.LoProcessor")
@@ -226,7 +374,7 @@ class TestGenerateMap(unittest.TestCase):
 
     @patch("mapping_tool.generate_map.DependencyCollector.collect_spice_kernels")
     @patch("mapping_tool.generate_map.spiceypy.furnsh")
-    @patch("mapping_tool.generate_map.imap_data_access.download")
+    @patch("mapping_tool.generate_map.download")
     @patch("mapping_tool.generate_map.HiProcessor")
     def test_generate_l3_map_raises_error_when_less_or_more_than_one_file_is_returned(self, mock_hi, mock_download,
                                                                                       mock_furnsh,
@@ -252,7 +400,7 @@ class TestGenerateMap(unittest.TestCase):
 
     @patch("mapping_tool.generate_map.DependencyCollector.collect_spice_kernels")
     @patch("mapping_tool.generate_map.spiceypy.furnsh")
-    @patch("mapping_tool.generate_map.imap_data_access.download")
+    @patch("mapping_tool.generate_map.download")
     @patch("mapping_tool.generate_map.HiProcessor.process")
     def test_generate_l3_map_gracefully_handles_processing_exceptions(self, mock_process, mock_download,
                                                                       mock_furnsh, mock_collect_spice_kernels):
@@ -318,7 +466,9 @@ class TestGenerateMap(unittest.TestCase):
                     call("imap_hi_l1c_pset-1_20250101_v000.cdf"),
                     call("imap_hi_l1c_pset-2_20250101_v000.cdf"),
                     call("imap_hi_45sensor-cal-prod_20240101_v002.csv"),
-                    call("imap_hi_45sensor-esa-energies_20240101_v002.csv")])
+                    call("imap_hi_45sensor-esa-energies_20240101_v002.csv"),
+                    call("imap_science_0001.tf"),
+                    call("imap_sclk_0000.tsc")], any_order=True)
 
                 expected_dependency_str = ProcessingInputCollection(
                     ScienceInput("imap_hi_l1c_pset-1_20250101_v000.cdf"),
@@ -348,6 +498,11 @@ class TestGenerateMap(unittest.TestCase):
 
                 mock_processor.cleanup.assert_called_once()
 
+                self.mock_local_store.pinned.assert_called_with([
+                    "imap_hi_l1c_pset-1_20250101_v000.cdf", "imap_hi_l1c_pset-2_20250101_v000.cdf",
+                    "imap_hi_45sensor-cal-prod_20240101_v002.csv", "imap_hi_45sensor-esa-energies_20240101_v002.csv",
+                    "imap_science_0001.tf", "imap_sclk_0000.tsc"])
+
                 self.assertEqual(expected_map, actual_map)
 
         mock_spiceypy.furnsh.assert_has_calls([
@@ -360,10 +515,10 @@ class TestGenerateMap(unittest.TestCase):
     @patch("mapping_tool.generate_map.DependencyCollector.collect_spice_kernels")
     @patch("mapping_tool.generate_map.DependencyCollector.get_pointing_sets")
     @patch("mapping_tool.generate_map.Hi")
-    def test_generate_l2_map_patches_l2_processing_get_map_coord_frame(self, mock_hi_processor_class,
-                                                                       mock_get_pointing_sets,
-                                                                       mock_collect_spice_kernels,
-                                                                       mock_get_ancillary_dependencies):
+    def test_generate_l2_map_overrides_map_coord_frame_during_l2_processing(self, mock_hi_processor_class,
+                                                                            mock_get_pointing_sets,
+                                                                            mock_collect_spice_kernels,
+                                                                            mock_get_ancillary_dependencies):
         mock_hi_processor = mock_hi_processor_class.return_value
         mock_collect_spice_kernels.return_value = ["imap_science_0001.tf", "imap_sclk_0000.tsc"]
         mock_get_ancillary_dependencies.return_value = []
@@ -433,14 +588,17 @@ class TestGenerateMap(unittest.TestCase):
                             datetime(2020, 1, 2, tzinfo=timezone.utc))
         self.assertIn(f"Processing for {hi_descriptor.to_string()} failed", e.exception.__notes__)
 
+    @patch("mapping_tool.generate_map.DependencyCollector.get_ancillary_dependencies")
     @patch("mapping_tool.generate_map.DependencyCollector.get_pointing_sets")
     @patch("mapping_tool.generate_map.DependencyCollector.collect_spice_kernels")
     @patch("mapping_tool.generate_map.Hi")
     def test_generate_l2_map_raises_exception_if_called_with_no_psets(self, mock_hi,
                                                                       mock_collect_spice_kernels,
-                                                                      mock_get_pointing_sets):
+                                                                      mock_get_pointing_sets,
+                                                                      mock_get_ancillary_dependencies):
         mock_collect_spice_kernels.return_value = []
         mock_get_pointing_sets.return_value = []
+        mock_get_ancillary_dependencies.return_value = []
 
         start_date = datetime(2020, 1, 1, tzinfo=timezone.utc)
         end_date = datetime(2020, 1, 2, tzinfo=timezone.utc)
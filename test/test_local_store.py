@@ -0,0 +1,123 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from mapping_tool.local_store import LocalStore
+
+
+class TestLocalStore(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = Path(temporary_directory.name)
+
+    def _create_file(self, name: str, size: int) -> Path:
+        path = self.directory / "imap" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+        return path
+
+    def test_record_access_tracks_each_file_once_by_name(self):
+        store = LocalStore(self.directory / "store.sqlite")
+        path = self._create_file("imap_hi_l1c_90sensor-pset_20250101_v001.cdf", 10)
+
+        store.record_access(path)
+        store.record_access(path)
+
+        self.assertEqual(10, store.total_size())
+
+    def test_enforce_budget_evicts_least_recently_used_files(self):
+        store = LocalStore(self.directory / "store.sqlite", budget_bytes=25)
+        oldest = self._create_file("oldest.cdf", 10)
+        middle = self._create_file("middle.cdf", 10)
+        newest = self._create_file("newest.cdf", 10)
+
+        store.record_access(oldest)
+        store.record_access(middle)
+        store.record_access(newest)
+        store.record_access(oldest)
+
+        evicted = store.enforce_budget()
+
+        self.assertEqual([middle], evicted)
+        self.assertFalse(middle.exists())
+        self.assertTrue(oldest.exists())
+        self.assertTrue(newest.exists())
+        self.assertEqual(20, store.total_size())
+
+    def test_enforce_budget_never_evicts_pinned_files(self):
+        store = LocalStore(self.directory / "store.sqlite", budget_bytes=5)
+        in_use = self._create_file("in_use.cdf", 10)
+        unused = self._create_file("unused.cdf", 10)
+        store.record_access(in_use)
+        store.record_access(unused)
+
+        with store.pinned(["in_use.cdf"]):
+            with self.assertLogs("mapping_tool.local_store", level="WARNING"):
+                evicted = store.enforce_budget()
+            self.assertEqual([unused], evicted)
+            self.assertTrue(in_use.exists())
+
+        self.assertEqual([in_use], store.enforce_budget())
+        self.assertEqual(0, store.total_size())
+
+    def test_pins_are_counted_per_user(self):
+        store = LocalStore(self.directory / "store.sqlite")
+
+        store.pin(["pset.cdf"])
+        store.pin([Path("data") / "pset.cdf"])
+        store.unpin(["pset.cdf"])
+        self.assertTrue(store.is_pinned("pset.cdf"))
+
+        store.unpin(["pset.cdf"])
+        self.assertFalse(store.is_pinned("pset.cdf"))
+
+    def test_enforce_budget_honours_pins_held_by_other_runs(self):
+        other_run = LocalStore(self.directory / "store.sqlite")
+        self.addCleanup(other_run.close)
+        store = LocalStore(self.directory / "store.sqlite", budget_bytes=5)
+        in_use = self._create_file("in_use.cdf", 10)
+        unused = self._create_file("unused.cdf", 10)
+        store.record_access(in_use)
+        store.record_access(unused)
+
+        with other_run.pinned(["in_use.cdf"]):
+            self.assertTrue(store.is_pinned("in_use.cdf"))
+            with self.assertLogs("mapping_tool.local_store", level="WARNING"):
+                self.assertEqual([unused], store.enforce_budget())
+            self.assertTrue(in_use.exists())
+
+        self.assertFalse(store.is_pinned("in_use.cdf"))
+
+    def test_pins_of_runs_that_stopped_renewing_or_exited_are_released(self):
+        cases = [
+            ("lease expired", patch("mapping_tool.local_store.PIN_LEASE_SECONDS", 0)),
+            ("process exited", patch("mapping_tool.local_store.is_process_alive", return_value=False)),
+        ]
+        for name, lease_patch in cases:
+            with self.subTest(name):
+                other_run = LocalStore(self.directory / "store.sqlite")
+                self.addCleanup(other_run.close)
+                store = LocalStore(self.directory / "store.sqlite", budget_bytes=0)
+                path = self._create_file("pset.cdf", 10)
+                store.record_access(path)
+
+                with lease_patch:
+                    other_run.pin(["pset.cdf"])
+                    self.assertFalse(store.is_pinned("pset.cdf"))
+                    self.assertEqual([path], store.enforce_budget())
+
+    def test_enforce_budget_does_nothing_without_a_budget(self):
+        store = LocalStore(self.directory / "store.sqlite")
+        path = self._create_file("pset.cdf", 10)
+        store.record_access(path)
+
+        self.assertEqual([], store.enforce_budget())
+        self.assertTrue(path.exists())
+
+    def test_index_is_shared_between_store_instances(self):
+        path = self._create_file("pset.cdf", 10)
+        LocalStore(self.directory / "store.sqlite").record_access(path)
+
+        self.assertEqual(10, LocalStore(self.directory / "store.sqlite").total_size())
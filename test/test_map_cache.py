@@ -0,0 +1,79 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+from mapping_tool.map_cache import MapCache
+
+
+class TestMapCache(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = Path(temporary_directory.name)
+
+    def _create_map(self, name: str, size: int) -> Path:
+        path = self.directory / "workspace" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+        return path
+
+    def test_make_key_depends_on_descriptor_window_and_inputs(self):
+        start, end = datetime(2025, 1, 1), datetime(2025, 4, 1)
+
+        key = MapCache.make_key("h90-ena-h-sf-nsp-ram-hae-4deg-3mo", start, end, "inputs-v1")
+
+        self.assertEqual(key, MapCache.make_key("h90-ena-h-sf-nsp-ram-hae-4deg-3mo", start, end, "inputs-v1"))
+        self.assertNotEqual(key, MapCache.make_key("h45-ena-h-sf-nsp-ram-hae-4deg-3mo", start, end, "inputs-v1"))
+        self.assertNotEqual(key, MapCache.make_key("h90-ena-h-sf-nsp-ram-hae-4deg-3mo", start,
+                                                   datetime(2025, 7, 1), "inputs-v1"))
+        self.assertNotEqual(key, MapCache.make_key("h90-ena-h-sf-nsp-ram-hae-4deg-3mo", start, end, "inputs-v2"))
+
+    def test_put_copies_the_map_and_get_returns_it(self):
+        cache = MapCache(self.directory / "cache")
+        map_path = self._create_map("imap_hi_l2_h90-ena_20250101_v000.cdf", 10)
+
+        cached_path = cache.put("key", map_path)
+        map_path.unlink()
+
+        self.assertEqual(cached_path, cache.get("key"))
+        self.assertEqual("imap_hi_l2_h90-ena_20250101_v000.cdf", cached_path.name)
+        self.assertEqual(b"x" * 10, cached_path.read_bytes())
+        self.assertIsNone(cache.get("other key"))
+
+    def test_entries_persist_across_instances(self):
+        cached_path = MapCache(self.directory / "cache").put("key", self._create_map("map.cdf", 10))
+
+        self.assertEqual(cached_path, MapCache(self.directory / "cache").get("key"))
+
+    def test_get_forgets_entries_whose_file_was_removed(self):
+        cache = MapCache(self.directory / "cache")
+        cached_path = cache.put("key", self._create_map("map.cdf", 10))
+        cached_path.unlink()
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(0, cache.total_size())
+
+    def test_put_evicts_least_recently_used_maps_over_budget(self):
+        cache = MapCache(self.directory / "cache", budget_bytes=25)
+        with patch("mapping_tool.lru_index.time.time", side_effect=[1, 2, 3, 4]):
+            oldest = cache.put("oldest", self._create_map("oldest.cdf", 10))
+            middle = cache.put("middle", self._create_map("middle.cdf", 10))
+            cache.get("oldest")
+            newest = cache.put("newest", self._create_map("newest.cdf", 10))
+
+        self.assertFalse(middle.exists())
+        self.assertIsNone(cache.get("middle"))
+        self.assertTrue(oldest.exists())
+        self.assertTrue(newest.exists())
+        self.assertEqual(20, cache.total_size())
+
+    def test_put_keeps_the_new_map_even_when_it_alone_exceeds_the_budget(self):
+        cache = MapCache(self.directory / "cache", budget_bytes=5)
+        older = cache.put("older", self._create_map("older.cdf", 10))
+
+        newest = cache.put("newest", self._create_map("newest.cdf", 10))
+
+        self.assertFalse(older.exists())
+        self.assertEqual(newest, cache.get("newest"))
@@ -0,0 +1,34 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from imap_processing.ena_maps.utils.naming import MapDescriptor
+from imap_processing.spice.geometry import SpiceFrame
+
+from mapping_tool.map_coord_frame import use_map_coord_frame
+
+
+class TestMapCoordFrame(unittest.TestCase):
+    def test_use_map_coord_frame_overrides_the_frame_only_inside_the_block(self):
+        descriptor = "h90-ena-h-sf-nsp-ram-hae-2deg-6mo"
+
+        with use_map_coord_frame(SpiceFrame.IMAP_RTN):
+            self.assertEqual(SpiceFrame.IMAP_RTN, MapDescriptor.from_string(descriptor).map_spice_coord_frame)
+            with use_map_coord_frame(SpiceFrame.IMAP_GCS):
+                self.assertEqual(SpiceFrame.IMAP_GCS, MapDescriptor.from_string(descriptor).map_spice_coord_frame)
+            self.assertEqual(SpiceFrame.IMAP_RTN, MapDescriptor.from_string(descriptor).map_spice_coord_frame)
+
+        self.assertEqual(SpiceFrame.IMAP_HAE, MapDescriptor.from_string(descriptor).map_spice_coord_frame)
+
+    def test_threads_each_see_their_own_frame(self):
+        frames = [SpiceFrame.IMAP_RTN, SpiceFrame.IMAP_GCS, SpiceFrame.IMAP_HAE, SpiceFrame.IMAP_RTN]
+        # Every thread sets its frame before any of them looks theirs up
+        frames_set = threading.Barrier(len(frames), timeout=5)
+
+        def get_frame_in_block(frame: SpiceFrame) -> SpiceFrame:
+            with use_map_coord_frame(frame):
+                frames_set.wait()
+                return MapDescriptor.get_map_coord_frame("hae")
+
+        with ThreadPoolExecutor(max_workers=len(frames)) as executor:
+            self.assertEqual(frames, list(executor.map(get_frame_in_block, frames)))
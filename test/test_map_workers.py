@@ -0,0 +1,162 @@
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import patch
+
+import imap_data_access
+from imap_processing.ena_maps.utils.naming import MappableInstrumentShortName
+
+from mapping_tool import data_access
+from mapping_tool.dependency_collector import DependencyCollector, MapDependencies
+from mapping_tool.dependency_manifest import DependencyManifest
+from mapping_tool.generate_map import MapNode
+from mapping_tool.map_cache import MapCache
+from mapping_tool.map_workers import MapNodeTask, MapNodeResult, run_map_node_task, generate_maps_in_processes, \
+    WorkerSettings
+from test.test_builders import create_map_descriptor
+
+
+class TestMapWorkers(unittest.TestCase):
+    def setUp(self):
+        original_config = data_access.config.copy()
+        self.addCleanup(data_access.config.update, original_config)
+        original_imap_config = imap_data_access.config.copy()
+        self.addCleanup(imap_data_access.config.update, original_imap_config)
+
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.directory = Path(temporary_directory.name)
+        imap_data_access.config["DATA_DIR"] = self.directory / "data"
+        self.descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, survival_corrected="nsp")
+        self.dependencies = MapDependencies(psets=["pset.cdf"], ancillary_dependencies=[], spice_kernels=["k.bc"])
+
+    @patch("mapping_tool.map_workers.spiceypy.kclear")
+    @patch("mapping_tool.map_workers.generate_map_node")
+    def test_run_map_node_task_moves_the_map_out_of_its_workspace_and_returns_the_recorded_dependencies(
+            self, mock_generate_map_node, mock_kclear):
+        start_date, end_date = datetime(2025, 1, 1), datetime(2025, 4, 1)
+        input_map = self.directory / "maps/map-0/imap_hi_l2_h90-ena-h-sf-nsp-ram-hae-2deg-6mo_20250101_v000.cdf"
+        input_map.parent.mkdir(parents=True)
+        input_map.write_bytes(b"input map")
+        workspaces = []
+
+        def generate_map_node(node, input_maps):
+            workspace = imap_data_access.config["DATA_DIR"]
+            workspaces.append(workspace)
+            self.assertEqual((datetime(2025, 1, 1), datetime(2025, 7, 1)), DependencyCollector.query_span)
+            self.assertEqual([workspace / "imap/hi/l2/2025/01" / input_map.name], input_maps)
+            self.assertEqual(b"input map", input_maps[0].read_bytes())
+            DependencyCollector.manifest.record(node.descriptor, node.start, node.end, self.dependencies)
+            map_path = workspace / "imap/hi/l3/map.cdf"
+            map_path.parent.mkdir(parents=True)
+            map_path.write_bytes(b"map")
+            return map_path
+
+        mock_generate_map_node.side_effect = generate_map_node
+        node = MapNode(self.descriptor, start_date, end_date, [])
+        task = MapNodeTask(node, [input_map], self.directory / "data", self.directory / "maps/map-1",
+                           (datetime(2025, 1, 1), datetime(2025, 7, 1)), None)
+
+        result = run_map_node_task(task)
+
+        self.assertEqual(self.directory / "maps/map-1/map.cdf", result.path)
+        self.assertEqual(b"map", result.path.read_bytes())
+        self.assertFalse(workspaces[0].exists())
+        self.assertEqual({DependencyManifest.make_key(self.descriptor, start_date, end_date): self.dependencies},
+                         result.recorded_maps)
+        mock_kclear.assert_called_once()
+        self.assertEqual(self.directory / "data", imap_data_access.config["DATA_DIR"])
+
+    @patch("mapping_tool.map_workers.print")
+    @patch("mapping_tool.map_workers.data_access.get_local_store")
+    @patch("mapping_tool.map_workers.run_map_node_task")
+    @patch("mapping_tool.map_workers.ProcessPoolExecutor")
+    def test_generate_maps_in_processes_runs_independent_maps_together_and_l3_maps_after_their_inputs(
+            self, mock_process_pool, mock_run_map_node_task, mock_get_local_store, _):
+        mock_process_pool.side_effect = lambda max_workers, mp_context, initializer, initargs: ThreadPoolExecutor(
+            max_workers)
+        descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, survival_corrected="sp",
+                                           spin_phase="full")
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 4, 1)), (datetime(2025, 4, 1), datetime(2025, 7, 1))]
+        imap_data_access.config["DATA_DIR"].mkdir(parents=True)
+        data_access.config["LOCAL_STORE_BUDGET_BYTES"] = 1000
+        # All four nsp branches of both windows have to be running at once to get past the barrier
+        l2_maps_running = threading.Barrier(4, timeout=5)
+        tasks = []
+
+        def run_map_node_task(task: MapNodeTask) -> MapNodeResult:
+            tasks.append(task)
+            if task.node.descriptor.survival_corrected == "nsp":
+                l2_maps_running.wait()
+            map_name = f"{task.node.descriptor.spin_phase}-{task.node.start.month}.cdf"
+            key = DependencyManifest.make_key(task.node.descriptor, task.node.start, task.node.end)
+            return MapNodeResult(task.output_dir / map_name, {key: self.dependencies})
+
+        mock_run_map_node_task.side_effect = run_map_node_task
+        manifest = DependencyManifest()
+        with DependencyCollector.use_manifest(manifest), \
+                DependencyCollector.span_queries(datetime(2025, 1, 1), datetime(2025, 7, 1)):
+            paths = generate_maps_in_processes(descriptor, map_date_ranges, jobs=8)
+
+        self.assertEqual(6, mock_process_pool.call_args.kwargs["max_workers"])
+        settings = mock_process_pool.call_args.kwargs["initargs"][0]
+        self.assertIsInstance(settings, WorkerSettings)
+        # Pins are shared leases, so workers can evict files without removing another worker's inputs
+        self.assertEqual(1000, settings.data_access_config["LOCAL_STORE_BUDGET_BYTES"])
+
+        self.assertEqual(6, len(tasks))
+        self.assertEqual(6, len({task.output_dir for task in tasks}))
+        self.assertTrue(all(task.query_span == (datetime(2025, 1, 1), datetime(2025, 7, 1)) for task in tasks))
+        l3_tasks = [task for task in tasks if task.node.descriptor == descriptor]
+        self.assertEqual(l3_tasks, tasks[4:])
+        for l3_task in l3_tasks:
+            self.assertEqual(["ram", "anti"], [input_map.name.split("-")[0] for input_map in l3_task.input_maps])
+            self.assertEqual({f"{l3_task.node.start.month}.cdf"},
+                             {input_map.name.split("-")[1] for input_map in l3_task.input_maps})
+        self.assertEqual([Path("full-1.cdf"), Path("full-4.cdf")], [Path(path.name) for path in paths])
+        for task in tasks:
+            self.assertEqual(self.dependencies, manifest.lookup(task.node.descriptor, task.node.start, task.node.end))
+        mock_get_local_store.return_value.enforce_budget.assert_called_once()
+
+    @patch("mapping_tool.map_workers.print")
+    @patch("mapping_tool.map_workers.data_access.get_local_store")
+    @patch("mapping_tool.map_workers.get_map_cache_keys")
+    @patch("mapping_tool.map_workers.map_cache.get_map_cache")
+    @patch("mapping_tool.map_workers.run_map_node_task")
+    @patch("mapping_tool.map_workers.ProcessPoolExecutor")
+    def test_generate_maps_in_processes_only_runs_maps_missing_from_the_map_cache(
+            self, mock_process_pool, mock_run_map_node_task, mock_get_map_cache, mock_get_map_cache_keys,
+            mock_get_local_store, _):
+        mock_process_pool.side_effect = lambda max_workers, mp_context, initializer, initargs: ThreadPoolExecutor(
+            max_workers)
+        descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, survival_corrected="sp",
+                                           spin_phase="full")
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 4, 1)), (datetime(2025, 4, 1), datetime(2025, 7, 1))]
+        imap_data_access.config["DATA_DIR"].mkdir(parents=True)
+        cache = MapCache(self.directory / "map_cache")
+        mock_get_map_cache.return_value = cache
+        mock_get_map_cache_keys.side_effect = lambda plan: {key: f"{key[0]}-{key[1].month}" for key in plan}
+        cached_map = self.directory / "full-1.cdf"
+        cached_map.write_bytes(b"cached")
+        cache.put(f"{descriptor.to_mapping_tool_string()}-1", cached_map)
+        tasks = []
+
+        def run_map_node_task(task: MapNodeTask) -> MapNodeResult:
+            tasks.append(task)
+            map_path = task.output_dir / f"{task.node.descriptor.spin_phase}-{task.node.start.month}.cdf"
+            map_path.parent.mkdir(parents=True)
+            map_path.write_bytes(b"generated")
+            return MapNodeResult(map_path, {})
+
+        mock_run_map_node_task.side_effect = run_map_node_task
+        paths = generate_maps_in_processes(descriptor, map_date_ranges, jobs=8)
+
+        self.assertEqual([4, 4, 4], [task.node.start.month for task in tasks])
+        self.assertEqual(b"cached", paths[0].read_bytes())
+        self.assertTrue(paths[0].is_relative_to(imap_data_access.config["DATA_DIR"]))
+        self.assertEqual(b"generated", paths[1].read_bytes())
+        for task in tasks:
+            self.assertIsNotNone(cache.get(f"{task.node.descriptor.to_mapping_tool_string()}-4"))
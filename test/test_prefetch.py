@@ -0,0 +1,135 @@
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import patch, call, sentinel
+
+from imap_processing.ena_maps.utils.naming import MappableInstrumentShortName
+
+from mapping_tool.dependency_collector import MapDependencies
+from mapping_tool.prefetch import MapPrefetcher, resolve_dependency_files, prefetch_map_dependencies
+from test.test_builders import create_map_descriptor
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        local_store_patch = patch("mapping_tool.prefetch.get_local_store")
+        self.mock_local_store = local_store_patch.start().return_value
+        self.addCleanup(local_store_patch.stop)
+
+    @patch("mapping_tool.prefetch.DependencyCollector.resolve_l3_map_dependencies")
+    @patch("mapping_tool.prefetch.DependencyCollector.resolve_map_dependencies")
+    def test_resolve_dependency_files_covers_every_map_in_the_dependency_tree(self, mock_resolve_l2,
+                                                                                mock_resolve_l3):
+        hi_l3_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90",
+                                                 survival_corrected="sp", spin_phase="ram")
+        hi_l2_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90",
+                                                 survival_corrected="nsp", spin_phase="ram")
+        start_date = datetime(2025, 1, 1)
+        end_date = datetime(2025, 4, 1)
+
+        mock_resolve_l2.return_value = MapDependencies(psets=["pset_1.cdf", "pset_2.cdf"],
+                                                       ancillary_dependencies=["ancillary.csv"],
+                                                       spice_kernels=["kernel.bsp", "clock.tsc"])
+        mock_resolve_l3.return_value = MapDependencies(psets=[], ancillary_dependencies=[],
+                                                       spice_kernels=["kernel.bsp"])
+
+        file_names = resolve_dependency_files(hi_l3_descriptor, start_date, end_date)
+
+        mock_resolve_l2.assert_called_once_with(hi_l2_descriptor, start_date, end_date)
+        mock_resolve_l3.assert_called_once_with(hi_l3_descriptor, start_date, end_date)
+        self.assertEqual(["pset_1.cdf", "pset_2.cdf", "ancillary.csv", "kernel.bsp", "clock.tsc"], file_names)
+
+    @patch("mapping_tool.prefetch.prefetch_map_dependencies")
+    def test_map_prefetcher_stays_at_most_lookahead_maps_ahead(self, mock_prefetch):
+        map_date_ranges = [(datetime(2025, month, 1), datetime(2025, month + 1, 1)) for month in range(1, 6)]
+        prefetch_calls = [call(sentinel.descriptor, *date_range) for date_range in map_date_ranges]
+        started = {start_date: threading.Event() for start_date, _ in map_date_ranges}
+
+        def prefetch(descriptor, start_date, end_date):
+            started[start_date].set()
+
+        mock_prefetch.side_effect = prefetch
+
+        with MapPrefetcher(sentinel.descriptor, map_date_ranges, lookahead=2) as prefetcher:
+            prefetcher.wait_for_map(0)
+            self.assertTrue(started[datetime(2025, 3, 1)].wait(timeout=5))
+            self.assertFalse(started[datetime(2025, 4, 1)].wait(timeout=0.2))
+            self.assertEqual(prefetch_calls[:3], mock_prefetch.call_args_list)
+
+            prefetcher.wait_for_map(1)
+            self.assertTrue(started[datetime(2025, 4, 1)].wait(timeout=5))
+            self.assertFalse(started[datetime(2025, 5, 1)].wait(timeout=0.2))
+            self.assertEqual(prefetch_calls[:4], mock_prefetch.call_args_list)
+
+            prefetcher.wait_for_map(3)
+            prefetcher.wait_for_map(4)
+
+        self.assertEqual(prefetch_calls, mock_prefetch.call_args_list)
+
+    @patch("mapping_tool.prefetch.prefetch_map_dependencies")
+    def test_map_prefetcher_downloads_next_map_while_current_map_is_processed(self, mock_prefetch):
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 2, 1)), (datetime(2025, 2, 1), datetime(2025, 3, 1))]
+        next_map_prefetching = threading.Event()
+
+        def prefetch(descriptor, start_date, end_date):
+            if start_date == datetime(2025, 2, 1):
+                next_map_prefetching.set()
+
+        mock_prefetch.side_effect = prefetch
+
+        with MapPrefetcher(sentinel.descriptor, map_date_ranges, lookahead=1) as prefetcher:
+            prefetcher.wait_for_map(0)
+            self.assertTrue(next_map_prefetching.wait(timeout=5))
+
+    @patch("mapping_tool.prefetch.prefetch_map_dependencies")
+    def test_map_prefetcher_logs_failures_and_leaves_them_to_the_map(self, mock_prefetch):
+        mock_prefetch.side_effect = Exception("archive unavailable")
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 2, 1))]
+
+        with MapPrefetcher(sentinel.descriptor, map_date_ranges, lookahead=1) as prefetcher:
+            with self.assertLogs("mapping_tool.prefetch", level="WARNING") as logs:
+                prefetcher.wait_for_map(0)
+
+        self.assertIn("Prefetching dependencies for map 1 failed: archive unavailable", logs.output[0])
+
+    @patch("mapping_tool.prefetch.download_files")
+    @patch("mapping_tool.prefetch.resolve_dependency_files")
+    def test_prefetch_map_dependencies_pins_files_until_released(self, mock_resolve, mock_download_files):
+        mock_resolve.return_value = ["pset.cdf", "ancillary.csv"]
+
+        file_names = prefetch_map_dependencies(sentinel.descriptor, sentinel.start, sentinel.end)
+
+        self.assertEqual(["pset.cdf", "ancillary.csv"], file_names)
+        mock_resolve.assert_called_once_with(sentinel.descriptor, sentinel.start, sentinel.end)
+        self.mock_local_store.pin.assert_called_once_with(["pset.cdf", "ancillary.csv"])
+        mock_download_files.assert_called_once_with(["pset.cdf", "ancillary.csv"])
+        self.mock_local_store.unpin.assert_not_called()
+
+        mock_download_files.side_effect = Exception("download failed")
+        with self.assertRaises(Exception):
+            prefetch_map_dependencies(sentinel.descriptor, sentinel.start, sentinel.end)
+        self.mock_local_store.unpin.assert_called_once_with(["pset.cdf", "ancillary.csv"])
+
+    @patch("mapping_tool.prefetch.prefetch_map_dependencies")
+    def test_map_prefetcher_releases_prefetched_files_once_their_map_is_done(self, mock_prefetch):
+        map_date_ranges = [(datetime(2025, month, 1), datetime(2025, month + 1, 1)) for month in range(1, 4)]
+        mock_prefetch.side_effect = lambda descriptor, start_date, end_date: [f"pset_{start_date.month}.cdf"]
+
+        with MapPrefetcher(sentinel.descriptor, map_date_ranges, lookahead=1) as prefetcher:
+            prefetcher.wait_for_map(0)
+            self.mock_local_store.unpin.assert_not_called()
+
+            prefetcher.wait_for_map(1)
+            self.mock_local_store.unpin.assert_called_once_with(["pset_1.cdf"])
+
+        self.mock_local_store.unpin.assert_has_calls([call(["pset_2.cdf"]), call(["pset_3.cdf"])], any_order=True)
+        self.assertEqual(3, self.mock_local_store.unpin.call_count)
+
+    @patch("mapping_tool.prefetch.prefetch_map_dependencies")
+    def test_map_prefetcher_does_nothing_without_lookahead(self, mock_prefetch):
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 2, 1))]
+
+        with MapPrefetcher(sentinel.descriptor, map_date_ranges, lookahead=0) as prefetcher:
+            prefetcher.wait_for_map(0)
+
+        mock_prefetch.assert_not_called()
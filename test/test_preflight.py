@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch, call
+
+from imap_processing.ena_maps.utils.naming import MappableInstrumentShortName
+
+from mapping_tool.dependency_collector import MapDependencies
+from mapping_tool.preflight import find_dependency_gaps, run_preflight, PreflightError, DependencyGap, \
+    find_map_dependency_problems
+from test.test_builders import create_map_descriptor
+
+
+class TestPreflight(unittest.TestCase):
+    @patch("mapping_tool.preflight.DependencyCollector.collect_spice_kernels_for_windows")
+    @patch("mapping_tool.preflight.DependencyCollector.resolve_l3_map_dependencies")
+    @patch("mapping_tool.preflight.DependencyCollector.resolve_map_dependencies")
+    def test_find_dependency_gaps_reports_every_gap_of_every_map_and_intermediate(self, mock_resolve_l2,
+                                                                                  mock_resolve_l3,
+                                                                                  mock_collect_spice_kernels):
+        hi_l3_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90",
+                                                 survival_corrected="sp", spin_phase="full")
+        ram_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90",
+                                               survival_corrected="nsp", spin_phase="ram")
+        anti_descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90",
+                                                survival_corrected="nsp", spin_phase="anti")
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 4, 1)), (datetime(2025, 4, 1), datetime(2025, 7, 1))]
+
+        def resolve_l2(descriptor, start_date, end_date):
+            if start_date == datetime(2025, 4, 1):
+                ancillary_dependencies = [] if descriptor.spin_phase == "ram" else ["cal.csv"]
+                return MapDependencies(psets=[], ancillary_dependencies=ancillary_dependencies,
+                                       spice_kernels=["kernel.bc"])
+            if descriptor.spin_phase == "anti":
+                raise ValueError("archive unavailable")
+            return MapDependencies(psets=["pset.cdf"], ancillary_dependencies=["cal.csv"], spice_kernels=["kernel.bc"])
+
+        mock_resolve_l2.side_effect = resolve_l2
+        mock_resolve_l3.side_effect = lambda descriptor, start_date, end_date: MapDependencies(
+            psets=[], ancillary_dependencies=[], spice_kernels=[] if start_date == datetime(2025, 4, 1) else ["k.bc"])
+
+        gaps = find_dependency_gaps(hi_l3_descriptor, map_date_ranges)
+
+        self.assertEqual([
+            DependencyGap(anti_descriptor, *map_date_ranges[0], "failed to resolve dependencies: archive unavailable"),
+            DependencyGap(ram_descriptor, *map_date_ranges[1], "no pointing sets found"),
+            DependencyGap(ram_descriptor, *map_date_ranges[1], "no ancillary files found"),
+            DependencyGap(anti_descriptor, *map_date_ranges[1], "no pointing sets found"),
+            DependencyGap(hi_l3_descriptor, *map_date_ranges[1], "no SPICE kernels cover the map window"),
+        ], gaps)
+        self.assertCountEqual([call(descriptor, *date_range) for date_range in map_date_ranges
+                               for descriptor in [ram_descriptor, anti_descriptor]],
+                              mock_resolve_l2.call_args_list)
+        self.assertCountEqual([call(hi_l3_descriptor, *date_range) for date_range in map_date_ranges],
+                              mock_resolve_l3.call_args_list)
+        mock_collect_spice_kernels.assert_called_once_with(map_date_ranges)
+
+    @patch("mapping_tool.preflight.DependencyCollector.resolve_map_dependencies")
+    def test_find_map_dependency_problems_reports_an_l2_map_without_ancillary_files(self, mock_resolve_l2):
+        descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.LO, survival_corrected="nsp")
+        mock_resolve_l2.return_value = MapDependencies(psets=["pset.cdf"], ancillary_dependencies=[],
+                                                       spice_kernels=["kernel.bc"])
+
+        self.assertEqual(["no ancillary files found"],
+                         find_map_dependency_problems(descriptor, datetime(2025, 1, 1), datetime(2025, 4, 1)))
+
+    @patch("mapping_tool.preflight.print")
+    @patch("mapping_tool.preflight.find_dependency_gaps")
+    def test_run_preflight_raises_with_every_gap_in_the_message(self, mock_find_dependency_gaps, mock_print):
+        descriptor = create_map_descriptor(instrument=MappableInstrumentShortName.HI, sensor="90",
+                                           survival_corrected="nsp", spin_phase="ram")
+        map_date_ranges = [(datetime(2025, 1, 1), datetime(2025, 4, 1))]
+        mock_find_dependency_gaps.return_value = []
+
+        run_preflight(descriptor, map_date_ranges)
+
+        mock_print.assert_called_once_with("Preflight check found dependencies for all 1 maps")
+
+        mock_find_dependency_gaps.return_value = [DependencyGap(descriptor, *map_date_ranges[0],
+                                                                "no pointing sets found")]
+        with self.assertRaises(PreflightError) as context:
+            run_preflight(descriptor, map_date_ranges)
+
+        self.assertEqual(mock_find_dependency_gaps.return_value, context.exception.gaps)
+        self.assertIn(f"{descriptor.to_mapping_tool_string()} 2025-01-01 to 2025-04-01: no pointing sets found",
+                      str(context.exception))
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from mapping_tool.query_cache import QueryCache
+from mapping_tool.query_records import iter_json_array
+
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.cache_dir = Path(temporary_directory.name)
+
+    def _read_records(self, cache: QueryCache, table: str, url: str, params):
+        records = cache.open_records(table, url, params)
+        if records is None:
+            return None
+        with records:
+            return list(iter_json_array(records))
+
+    def test_returns_stored_records_for_the_same_request(self):
+        cache = QueryCache(self.cache_dir, {"science": 60})
+
+        cache.put_records("science", "https://url/query", {"instrument": "hi", "data_level": "l1c"},
+                          iter([{"file_path": "a"}, {"file_path": "b"}]))
+
+        self.assertEqual([{"file_path": "a"}, {"file_path": "b"}],
+                         self._read_records(cache, "science", "https://url/query",
+                                            {"data_level": "l1c", "instrument": "hi"}))
+        self.assertIsNone(cache.open_records("science", "https://url/query", {"instrument": "lo", "data_level": "l1c"}))
+        self.assertIsNone(cache.open_records("science", "https://other-url/query",
+                                             {"instrument": "hi", "data_level": "l1c"}))
+        self.assertEqual([], list(self.cache_dir.glob("*/*.tmp")))
+
+    def test_entries_expire_after_the_table_ttl(self):
+        cache = QueryCache(self.cache_dir, {"science": 60, "spice": 3600})
+        cache.put_records("science", "https://url/query", None, [{"file_path": "science"}])
+        cache.put_records("spice", "https://url/spice-query", None, [{"file_name": "spice"}])
+
+        two_minutes_ago = time.time() - 120
+        for entry_path in self.cache_dir.glob("*/*.json"):
+            os.utime(entry_path, (two_minutes_ago, two_minutes_ago))
+
+        self.assertIsNone(cache.open_records("science", "https://url/query", None))
+        self.assertEqual([{"file_name": "spice"}], self._read_records(cache, "spice", "https://url/spice-query", None))
+
+    def test_tables_without_a_ttl_are_never_served_from_cache(self):
+        cache = QueryCache(self.cache_dir, {})
+        cache.put_records("ancillary", "https://url/query", None, [{"file_path": "ancillary"}])
+
+        self.assertIsNone(cache.open_records("ancillary", "https://url/query", None))
+
+    def test_empty_record_sets_are_stored(self):
+        cache = QueryCache(self.cache_dir, {"science": 60})
+        cache.put_records("science", "https://url/query", None, iter([]))
+
+        self.assertEqual([], self._read_records(cache, "science", "https://url/query", None))
+
@@ -0,0 +1,38 @@
+import json
+import unittest
+
+from mapping_tool.query_records import FileRecord, SpiceFileRecord, iter_json_array
+
+
+class TestQueryRecords(unittest.TestCase):
+    def test_iter_json_array_yields_items_across_chunk_boundaries(self):
+        items = [{"file_path": "imap/hi/l1c/a.cdf", "version": "v001", "size": 12345},
+                 {"file_path": "imap/hi/l1c/é.cdf", "nested": {"values": [1, 2.5, None, True]}}, 17, "text"]
+        body = json.dumps(items, ensure_ascii=False).encode()
+
+        for chunk_size in [1, 2, 3, 7, len(body)]:
+            with self.subTest(chunk_size=chunk_size):
+                chunks = [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+                self.assertEqual(items, list(iter_json_array(chunks)))
+
+    def test_iter_json_array_accepts_empty_arrays_and_text_chunks(self):
+        self.assertEqual([], list(iter_json_array([" [ ", "]"])))
+        self.assertEqual([1, 23], list(iter_json_array(["[1, 2", "3]"])))
+
+    def test_iter_json_array_rejects_truncated_or_non_array_responses(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[{"file_path": "a"}, {"file_']))
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"file_path": "a"}']))
+
+    def test_records_keep_only_the_fields_the_mapping_tool_uses(self):
+        file_record = FileRecord.from_json({"file_path": "imap/hi/l1c/a.cdf", "start_date": "20250101",
+                                            "version": "v001", "instrument": "hi", "ingestion_date": "20250102"})
+        spice_record = SpiceFileRecord.from_json({"file_name": "ck/a.ah.bc", "version": 1,
+                                                  "min_date_datetime": "2025-01-01, 00:00:00",
+                                                  "max_date_datetime": "2025-02-01, 00:00:00"})
+
+        self.assertEqual(FileRecord(file_path="imap/hi/l1c/a.cdf", start_date="20250101", version="v001"), file_record)
+        self.assertEqual(SpiceFileRecord(file_name="ck/a.ah.bc", min_date_datetime="2025-01-01, 00:00:00",
+                                         max_date_datetime="2025-02-01, 00:00:00"), spice_record)
+        self.assertFalse(hasattr(file_record, "__dict__"))
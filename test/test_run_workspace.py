@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import imap_data_access
+
+from mapping_tool import data_access
+from mapping_tool.run_workspace import RunWorkspace
+
+
+class TestRunWorkspace(unittest.TestCase):
+    def setUp(self):
+        original_config = data_access.config.copy()
+        self.addCleanup(data_access.config.update, original_config)
+        original_imap_config = imap_data_access.config.copy()
+        self.addCleanup(imap_data_access.config.update, original_imap_config)
+
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.shared_data_dir = Path(temporary_directory.name)
+        imap_data_access.config["DATA_DIR"] = self.shared_data_dir
+
+    def test_intermediates_stay_in_the_workspace_while_inputs_are_shared(self):
+        shared_pset = self.shared_data_dir / "imap/hi/l1c/2025/06/imap_hi_l1c_90sensor-pset_20250606_v001.cdf"
+        shared_glows = self.shared_data_dir / "imap/glows/l3e/2025/06/imap_glows_l3e_survival-probability_20250606_v001.cdf"
+        other_run_l2 = self.shared_data_dir / "imap/hi/l2/2025/06/imap_hi_l2_h90-ena-h-sf-nsp-ram-hae-4deg-6mo_20250606_v000.cdf"
+        for path in [shared_pset, shared_glows, other_run_l2]:
+            path.parent.mkdir(parents=True)
+            path.touch()
+
+        with RunWorkspace(self.shared_data_dir, ["hi"]) as workspace:
+            self.assertEqual(workspace.path, imap_data_access.config["DATA_DIR"])
+            self.assertEqual(self.shared_data_dir, data_access.get_data_dir())
+
+            self.assertTrue((workspace.path / "imap/hi/l1c/2025/06" / shared_pset.name).exists())
+            self.assertTrue((workspace.path / "imap/glows/l3e/2025/06" / shared_glows.name).exists())
+            self.assertTrue((workspace.path / "imap/ancillary").is_symlink())
+            self.assertTrue((workspace.path / "imap/spice").is_symlink())
+            self.assertFalse((workspace.path / "imap/hi/l2").exists())
+
+            intermediate_map = workspace.path / "imap/hi/l2/2025/06/imap_hi_l2_h90-ena-h-sf-nsp-anti-hae-4deg-6mo_20250606_v000.cdf"
+            intermediate_map.parent.mkdir(parents=True)
+            intermediate_map.touch()
+
+            self.assertEqual(self.shared_data_dir / "imap/hi/l1c/2025/06" / shared_pset.name,
+                             data_access.get_local_path(shared_pset.name))
+
+        self.assertEqual(self.shared_data_dir, imap_data_access.config["DATA_DIR"])
+        self.assertIsNone(data_access.config["SHARED_DATA_DIR"])
+        self.assertFalse(workspace.path.exists())
+        self.assertTrue(shared_pset.exists())
+        self.assertTrue(shared_glows.exists())
+        self.assertTrue(other_run_l2.exists())
+
+    def test_files_the_processors_download_during_a_run_land_in_the_shared_data_dir(self):
+        downloaded_files = ["imap/hi/l1b/2025/06/imap_hi_l1b_90sensor-de_20250606_v001.cdf",
+                            "imap/glows/l3e/2025/06/imap_glows_l3e_survival-probability-hi-90_20250606_v001.cdf",
+                            "imap/glows/l2/2025/06/imap_glows_l2_hist_20250606_v001.cdf",
+                            "imap/ancillary/hi/imap_hi_90sensor-esa-energies_20240101_v001.csv"]
+
+        with RunWorkspace(self.shared_data_dir, ["hi"]) as workspace:
+            for downloaded_file in downloaded_files:
+                (workspace.path / downloaded_file).parent.mkdir(parents=True, exist_ok=True)
+                (workspace.path / downloaded_file).touch()
+            intermediate_map = workspace.path / "imap/hi/l3/2025/06/imap_hi_l3_h90-ena-h-sf-sp-full-hae-4deg-6mo_20250606_v000.cdf"
+            intermediate_map.parent.mkdir(parents=True)
+            intermediate_map.touch()
+
+        for downloaded_file in downloaded_files:
+            self.assertTrue((self.shared_data_dir / downloaded_file).exists())
+        self.assertFalse((self.shared_data_dir / "imap/hi/l3").exists())
+
+    def test_concurrent_runs_get_separate_workspaces(self):
+        first_workspace = RunWorkspace(self.shared_data_dir, ["hi"])
+        second_workspace = RunWorkspace(self.shared_data_dir, ["hi"])
+
+        with first_workspace:
+            first_path = first_workspace.path
+            (first_path / "imap/hi/l2").mkdir()
+            with second_workspace:
+                self.assertNotEqual(first_path, second_workspace.path)
+            self.assertTrue((first_path / "imap/hi/l2").exists())
+        self.assertFalse(first_path.exists())
+
+    def test_workspace_is_removed_when_the_run_fails(self):
+        with self.assertRaises(RuntimeError):
+            with RunWorkspace(self.shared_data_dir, ["lo"]) as workspace:
+                raise RuntimeError("processing failed")
+
+        self.assertFalse(workspace.path.exists())
+        self.assertTrue((self.shared_data_dir / "imap/lo/l1c").is_dir())